@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+#
+# Benchmark pairing of Fastqs for a large synthetic sample
+#
+# Usage: python benchmarks/fastq_pairs.py [NFASTQS]
+
+import sys
+import time
+from auto_process_ngs.utils import AnalysisSample
+from qcreport.illumina import get_fastq_pairs
+
+def synthetic_sample(nfastqs,name='PB1',dir_path='/data/PB'):
+    """
+    Return an AnalysisSample with R1/R2 Fastqs across many lanes/sets
+
+    """
+    sample = AnalysisSample(name)
+    for i in xrange(nfastqs/2):
+        lane,set_number = divmod(i,999)
+        for read_number in (1,2):
+            sample.add_fastq("%s/%s_S1_L%03d_R%d_%03d.fastq.gz" %
+                             (dir_path,name,lane+1,read_number,
+                              set_number+1))
+    return sample
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        nfastqs = int(sys.argv[1])
+    else:
+        nfastqs = 50000
+    sample = synthetic_sample(nfastqs)
+    start = time.time()
+    pairs = get_fastq_pairs(sample)
+    print "Paired %d Fastqs into %d pairs in %.2fs" % (nfastqs,len(pairs),
+                                                      time.time()-start)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+#
+# report cache library
+import os
+import json
+import hashlib
+import inspect
+import cPickle
+
+class ReportCache:
+    """
+    Class for caching report content between runs
+
+    Report content (e.g. the section for a single Fastq)
+    is stored along with a manifest of the input files
+    used to generate it (paths, sizes, modification times
+    and MD5 checksums). When the content is requested
+    again it is only returned if none of the inputs have
+    changed.
+
+    Example usage:
+
+    >>> cache = ReportCache('/path/to/cache')
+    >>> content = cache.get('key',inputs)
+    >>> if content is None:
+    ...    content = make_content()
+    ...    cache.put('key',inputs,content)
+    >>> cache.save()
+
+    The manifest is written to 'manifest.json' in the
+    cache directory when 'save' is invoked; cached content
+    which wasn't used since the cache was loaded is
+    removed at the same time.
+
+    """
+    def __init__(self,cache_dir):
+        """
+        Create a new ReportCache instance
+
+        Arguments:
+          cache_dir (str): path to the directory to store
+            the cached content and manifest in (will be
+            created if it doesn't exist)
+
+        """
+        self._cache_dir = os.path.abspath(cache_dir)
+        self._manifest_file = os.path.join(self._cache_dir,
+                                           'manifest.json')
+        self._manifest = {}
+        self._used = set()
+        self.nreused = 0
+        self.nstored = 0
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        if os.path.exists(self._manifest_file):
+            try:
+                with open(self._manifest_file,'r') as fp:
+                    self._manifest = json.load(fp)
+            except ValueError:
+                # Corrupted manifest, ignore it
+                self._manifest = {}
+
+    def _content_file(self,key):
+        """
+        Internal: return the path to the file for cached content
+
+        """
+        return os.path.join(self._cache_dir,"%s.pickle" % key)
+
+    def get(self,key,inputs):
+        """
+        Fetch cached content
+
+        Arguments:
+          key (str): key for the content
+          inputs (list): list of paths to the input
+            files used to generate the content
+
+        Returns:
+          Object: the cached content, or None if there is
+            no content for the key, or if any of the inputs
+            have changed.
+
+        """
+        entry = self._manifest.get(key)
+        if entry is None:
+            return None
+        if sorted(entry['inputs']) != sorted(inputs):
+            return None
+        for path in inputs:
+            info = entry['inputs'][path]
+            if not file_unchanged(path,info):
+                return None
+            if info is not None:
+                # Update the modification time in case the
+                # file was touched without being changed
+                info['mtime'] = os.path.getmtime(path)
+        try:
+            with open(self._content_file(key),'rb') as fp:
+                content = cPickle.load(fp)
+        except Exception:
+            return None
+        self._used.add(key)
+        self.nreused += 1
+        return content
+
+    def put(self,key,inputs,content):
+        """
+        Store content in the cache
+
+        Arguments:
+          key (str): key for the content
+          inputs (list): list of paths to the input
+            files used to generate the content
+          content (Object): the content to store (must
+            be picklable)
+
+        """
+        tmp_file = "%s.tmp" % self._content_file(key)
+        with open(tmp_file,'wb') as fp:
+            cPickle.dump(content,fp,cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file,self._content_file(key))
+        self._manifest[key] = { 'inputs': dict([(path,file_info(path))
+                                                for path in inputs]), }
+        self._used.add(key)
+        self.nstored += 1
+
+    def save(self):
+        """
+        Write the manifest and remove unused content
+
+        """
+        for key in self._manifest.keys():
+            if key not in self._used:
+                del self._manifest[key]
+                if os.path.exists(self._content_file(key)):
+                    os.remove(self._content_file(key))
+        tmp_file = "%s.tmp" % self._manifest_file
+        with open(tmp_file,'w') as fp:
+            json.dump(self._manifest,fp,indent=1,sort_keys=True)
+        os.rename(tmp_file,self._manifest_file)
+
+def cache_key(*args):
+    """
+    Return a cache key generated from arbitrary arguments
+
+    Arguments:
+      args (list): values to generate the key from
+        (their representations must be stable between
+        runs)
+
+    Returns:
+      String: key.
+
+    """
+    return hashlib.md5(repr(args)).hexdigest()
+
+def source_checksum(*objs):
+    """
+    Return a checksum for the source code defining objects
+
+    This can be included in cache keys so that cached
+    content is regenerated when the code which produces
+    it changes. For decorated functions the source of
+    the original function (the '__wrapped__' attribute)
+    is used.
+
+    Arguments:
+      objs (list): modules, classes or functions
+
+    Returns:
+      String: MD5 hex digest of the source files for
+        the objects.
+
+    """
+    md5 = hashlib.md5()
+    for source_file in sorted(set([inspect.getsourcefile(
+            getattr(obj,'__wrapped__',obj)) for obj in objs])):
+        md5.update(md5sum(source_file))
+    return md5.hexdigest()
+
+def file_info(path):
+    """
+    Return the size, modification time and checksum for a file
+
+    Arguments:
+      path (str): path to the file
+
+    Returns:
+      Dictionary: dictionary with keys 'size', 'mtime' and
+        'md5', or None if the file doesn't exist.
+
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return { 'size': st.st_size,
+             'mtime': st.st_mtime,
+             'md5': md5sum(path), }
+
+def file_unchanged(path,info):
+    """
+    Check whether a file matches previously recorded info
+
+    The file is unchanged if it has the same size and
+    modification time as recorded; if the modification
+    time differs then the checksum is also compared.
+
+    Arguments:
+      path (str): path to the file
+      info (dict): file info previously returned by
+        'file_info' (or None if the file didn't exist)
+
+    Returns:
+      Boolean: True if the file is unchanged, False if
+        not.
+
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return info is None
+    if info is None or st.st_size != info['size']:
+        return False
+    if st.st_mtime == info['mtime']:
+        return True
+    return md5sum(path) == info['md5']
+
+def md5sum(path,blocksize=1024*1024):
+    """
+    Return the MD5 checksum for a file
+
+    Arguments:
+      path (str): path to the file
+      blocksize (int): size of blocks to read the file in
+
+    Returns:
+      String: MD5 hex digest.
+
+    """
+    md5 = hashlib.md5()
+    with open(path,'rb') as fp:
+        while True:
+            block = fp.read(blocksize)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
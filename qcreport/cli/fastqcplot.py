@@ -6,20 +6,26 @@ from .. import get_version
 import sys
 import os
 import optparse
-from ..fastqc import ufastqcplot
+from ..plots import ufastqcplot
 
 def main():
     # Process command line
     p = optparse.OptionParser(usage="%prog FASTQC_SUMMARY",
                               version="%prog "+get_version(),)
+    p.add_option('--svg',action='store_true',dest='svg',
+                 help="output plot as SVG (default is PNG)")
     opts,args = p.parse_args()
     if len(args) != 1:
         p.error("Need to supply one FastQC summary files")
     summary = args[0]
+    if opts.svg:
+        plot_format = 'svg'
+    else:
+        plot_format = 'png'
     # Make the summary plot
     ##outfile = os.path.splitext(os.path.basename(fq))[0] + '.png'
-    outfile = 'ufastqc.png'
-    ufastqcplot(summary,outfile)
+    outfile = 'ufastqc.' + plot_format
+    ufastqcplot(summary,outfile,format=plot_format)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# Query QC metrics stored by qcreporter2
+
+from .. import get_version
+import sys
+import os
+import optparse
+from ..metrics import MetricsStore
+from ..metrics import FASTQ_METRICS
+
+def main():
+    # Process command line
+    p = optparse.OptionParser(usage="%prog DB METRIC",
+                              version="%prog "+get_version(),
+                              description="Report values of METRIC for "
+                              "Fastqs from the QC metrics database DB "
+                              "(written by 'qcreporter2 --metrics-db'), "
+                              "most recent runs first. METRIC can be one "
+                              "of: %s; or a fastq_screen library (e.g. "
+                              "'PhiX') or screen and library (e.g. "
+                              "'other_organisms/PhiX') to report the "
+                              "percentage of reads mapped to the library" %
+                              ", ".join(FASTQ_METRICS))
+    p.add_option('--run',action='store',dest='run',default=None,
+                 help="only report Fastqs from RUN")
+    p.add_option('--project',action='store',dest='project',default=None,
+                 help="only report Fastqs from PROJECT")
+    p.add_option('--sample',action='store',dest='sample',default=None,
+                 help="only report Fastqs from SAMPLE")
+    p.add_option('--lane',action='store',dest='lane',type='int',
+                 default=None,
+                 help="only report Fastqs from LANE")
+    p.add_option('--read',action='store',dest='read_number',type='int',
+                 default=None,
+                 help="only report Fastqs for READ (1 or 2)")
+    p.add_option('--fastq',action='store',dest='fastq',default=None,
+                 help="only report Fastqs with the name FASTQ")
+    p.add_option('--last',action='store',dest='last',type='int',
+                 default=50,
+                 help="only report values from the LAST most recent "
+                 "runs (default 50; 0 reports all runs)")
+    opts,args = p.parse_args()
+    if len(args) != 2:
+        p.error("Need to supply database file and metric")
+    db_file,metric = args
+    if not os.path.exists(db_file):
+        p.error("%s: not found" % db_file)
+    store = MetricsStore(db_file)
+    try:
+        for row in store.query(metric,
+                               run=opts.run,
+                               project=opts.project,
+                               sample=opts.sample,
+                               lane=opts.lane,
+                               read_number=opts.read_number,
+                               fastq=opts.fastq,
+                               last=opts.last):
+            print "\t".join([str(x) for x in row])
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
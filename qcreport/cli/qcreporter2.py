@@ -12,14 +12,68 @@ from .. import get_version
 import sys
 import os
 import optparse
+import json
+from multiprocessing.pool import ThreadPool
 from auto_process_ngs.utils import AnalysisProject
 from ..illumina import QCReporter
+from ..illumina import report_projects
+from ..timings import enable_timings
+from ..timings import timings_table
+from ..timings import write_trace
 
 """
 qc_reporter2
 
 """
 
+#######################################################################
+# Functions
+#######################################################################
+
+def verify_project(d,count_reads=False):
+    """
+    Verify the QC outputs for a project directory
+
+    Verification only lists the project and QC
+    directories, so it is cheap and doesn't write
+    anything; Fastqs are only read if 'count_reads'
+    is set.
+
+    Arguments:
+      d (str): path to the project directory
+      count_reads (boolean): if True then count the
+        reads directly for Fastqs with no read count
+        from the statistics file or FastQC (counts
+        cached by earlier reports are reused, but the
+        cache isn't updated)
+
+    Returns:
+      Dictionary: dictionary with keys 'project', 'dir',
+        'samples', 'fastqs', 'verified', 'missing' (list
+        of paths to missing QC outputs) and 'reads'
+        (mapping of the Fastqs with no read count from
+        the statistics file or FastQC to the number of
+        reads, or None if 'count_reads' isn't set).
+
+    """
+    project_name = os.path.basename(d)
+    dir_path = os.path.abspath(d)
+    p = AnalysisProject(project_name,dir_path)
+    qc = QCReporter(p)
+    missing = qc.missing_outputs()
+    if count_reads:
+        reads = qc.count_reads(qc.fastqs_without_counts(),
+                               update_cache=False)
+    else:
+        reads = None
+    return { 'project': p.name,
+             'dir': dir_path,
+             'samples': len(p.samples),
+             'fastqs': len(p.fastqs),
+             'verified': (not missing),
+             'missing': missing,
+             'reads': reads, }
+
 #######################################################################
 # Main program
 #######################################################################
@@ -32,11 +86,188 @@ def main():
                               "DIR")
     p.add_option('--verify',action='store_true',dest='verify',
                  help="verify the QC products only (don't write the report)")
+    p.add_option('--missing-report',action='store',
+                 dest='missing_report',default=None,
+                 help="with --verify, write a JSON report listing the "
+                 "missing QC outputs for each directory to "
+                 "MISSING_REPORT")
+    p.add_option('--count-reads',action='store_true',dest='count_reads',
+                 help="with --verify, also count the reads in Fastqs "
+                 "which have no read count from the statistics file "
+                 "or FastQC (reads the Fastqs, so can be slow)")
+    p.add_option('--sprites',action='store_true',dest='sprites',
+                 help="pack the summary table 'micro-plots' into "
+                 "sprite sheets (smaller HTML for large projects)")
+    p.add_option('-j','--jobs',action='store',dest='nprocs',
+                 type='int',default=1,
+                 help="number of processes to use for generating "
+                 "the thumbnail images and the report content for "
+                 "each Fastq, or number of directories to check "
+                 "concurrently with --verify (default 1)")
+    p.add_option('--svg',action='store_true',dest='svg',
+                 help="embed the summary table 'micro-plots' as "
+                 "inline SVG rather than PNG images")
+    p.add_option('--assets',action='store_true',dest='assets',
+                 help="write the images to a separate directory "
+                 "alongside the report, rather than embedding them "
+                 "(faster loading for large projects; by default "
+                 "the report is a single self-contained file)")
+    p.add_option('--data-table',action='store_true',dest='data_table',
+                 help="render the summary table in the browser from "
+                 "compact JSON data, with sorting and filtering (for "
+                 "very large projects; by default a static HTML table "
+                 "is written)")
+    p.add_option('--samples-per-page',action='store',
+                 dest='samples_per_page',type='int',default=None,
+                 help="write the reports for the samples to separate "
+                 "pages with SAMPLES_PER_PAGE samples on each, linked "
+                 "from the summary (for very large projects; by "
+                 "default everything is written to a single file)")
+    p.add_option('--heatmap',action='store_true',dest='heatmap',
+                 help="add a heatmap of the per-base quality for all "
+                 "Fastqs to the top of the report")
+    p.add_option('--metrics-db',action='store',dest='metrics_db',
+                 default=None,
+                 help="store the QC metrics for each Fastq in the "
+                 "SQLite database METRICS_DB (created if it doesn't "
+                 "exist; query using 'qcmetrics')")
+    p.add_option('--run',action='store',dest='run',default=None,
+                 help="name of the sequencing run to store the "
+                 "metrics under with --metrics-db (default is the "
+                 "name of the directory containing each project)")
+    p.add_option('--metrics-file',action='store',dest='metrics_file',
+                 type='choice',choices=('json','tsv'),default=None,
+                 help="also write the QC metrics for each Fastq to a "
+                 "machine-readable file alongside the report, in "
+                 "format METRICS_FILE (either 'json' or 'tsv')")
+    p.add_option('--gzip',action='store_true',dest='gzip',
+                 help="also write gzip-compressed copies of the report "
+                 "files ('.html.gz')")
+    p.add_option('--gzip-only',action='store_true',dest='gzip_only',
+                 help="only write the gzip-compressed copies of the "
+                 "report files (implies --gzip)")
+    p.add_option('--gzip-level',action='store',dest='gzip_level',
+                 type='int',default=6,
+                 help="compression level for --gzip (1-9, default 6)")
+    p.add_option('--batch',action='store_true',dest='batch',
+                 help="report all the projects using a single shared "
+                 "pool of worker processes (see -j), writing each "
+                 "report as soon as it is complete (rather than "
+                 "handling the projects strictly one after another)")
+    p.add_option('--memory-budget',action='store',dest='memory_budget',
+                 type='int',default=None,
+                 help="limit the total size (in MB) of the files being "
+                 "processed by the worker processes at any one time "
+                 "(see -j); larger files are always processed first")
+    p.add_option('--queue-size',action='store',dest='queue_size',
+                 type='int',default=8,
+                 help="maximum number of Fastqs to hold the report "
+                 "content for while waiting for it to be added to the "
+                 "report (default 8)")
+    p.add_option('--pipeline-stats',action='store_true',
+                 dest='pipeline_stats',
+                 help="print statistics on the stages of the report "
+                 "pipeline (items, busy/blocked times, throughput and "
+                 "queue depths)")
+    p.add_option('--timings',action='store_true',dest='timings',
+                 help="print a summary of the time spent in each phase "
+                 "of generating the reports (parsing, plotting, "
+                 "encoding, writing etc)")
+    p.add_option('--trace',action='store',dest='trace',default=None,
+                 help="write a trace of the time spent generating the "
+                 "reports (with spans for each Fastq) to TRACE, in "
+                 "Chrome trace format (for chrome://tracing or "
+                 "Perfetto)")
+    p.add_option('--rebuild',action='store_true',dest='rebuild',
+                 help="regenerate all the report content, rather "
+                 "than reusing content for Fastqs with unchanged QC "
+                 "outputs from previous runs")
     opts,args = p.parse_args()
     if len(args) < 1:
         p.error("Need to supply at least one directory")
+    if opts.svg and opts.sprites:
+        p.error("--svg and --sprites cannot be used together")
+    if opts.svg:
+        plot_format = 'svg'
+    else:
+        plot_format = 'png'
+
+    if opts.gzip_level < 1 or opts.gzip_level > 9:
+        p.error("--gzip-level must be between 1 and 9")
+    if opts.gzip or opts.gzip_only:
+        gzip_level = opts.gzip_level
+    else:
+        gzip_level = None
+    if opts.memory_budget is not None:
+        if opts.memory_budget < 1:
+            p.error("--memory-budget must be at least 1")
+        memory_budget = opts.memory_budget*1024*1024
+    else:
+        memory_budget = None
+    if opts.queue_size < 1:
+        p.error("--queue-size must be at least 1")
+    if opts.missing_report and not opts.verify:
+        p.error("--missing-report can only be used with --verify")
+    if opts.count_reads and not opts.verify:
+        p.error("--count-reads can only be used with --verify")
+
+    # Verify projects
+    if opts.verify:
+        if opts.nprocs > 1 and len(args) > 1:
+            pool = ThreadPool(opts.nprocs)
+            try:
+                results = pool.map(
+                    lambda d: verify_project(d,count_reads=opts.count_reads),
+                    args)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [verify_project(d,count_reads=opts.count_reads)
+                       for d in args]
+        for result in results:
+            print "Project: %s" % result['project']
+            print "-"*(len('Project: ')+len(result['project']))
+            print "%d samples | %d fastqs" % (result['samples'],
+                                              result['fastqs'])
+            if result['reads']:
+                print "%d reads in %d Fastqs without FastQC data" % \
+                    (sum(result['reads'].values()),len(result['reads']))
+            if not result['verified']:
+                print "Verification: FAILED"
+            else:
+                print "Verification: OK"
+        if opts.missing_report:
+            with open(opts.missing_report,'w') as fp:
+                json.dump(results,fp,indent=1,sort_keys=True,
+                          separators=(',',': '))
+                fp.write("\n")
+            print "Wrote %s" % opts.missing_report
+        return
+
+    # Record timings
+    if opts.timings or opts.trace:
+        enable_timings()
+
+    # Options for the reports
+    report_opts = dict(sprites=opts.sprites,
+                       plot_format=plot_format,
+                       use_cache=(not opts.rebuild),
+                       assets=opts.assets,
+                       samples_per_page=opts.samples_per_page,
+                       data_table=opts.data_table,
+                       gzip_level=gzip_level,
+                       plain=(not opts.gzip_only),
+                       heatmap=opts.heatmap,
+                       metrics_db=opts.metrics_db,
+                       run=opts.run,
+                       metrics_file=opts.metrics_file,
+                       memory_budget=memory_budget,
+                       queue_size=opts.queue_size,
+                       pipeline_stats=opts.pipeline_stats)
 
     # Examine projects i.e. supplied directories
+    projects = []
     for d in args:
         project_name = os.path.basename(d)
         dir_path = os.path.abspath(d)
@@ -44,13 +275,23 @@ def main():
         print "Project: %s" % p.name
         print "-"*(len('Project: ')+len(p.name))
         print "%d samples | %d fastqs" % (len(p.samples),len(p.fastqs))
-        if opts.verify:
-            if not QCReporter(p).verify():
-                print "Verification: FAILED"
-            else:
-                print "Verification: OK"
-        else:
-            qc = QCReporter(p).report()
+        if opts.batch:
+            projects.append(p)
+            continue
+        qc = QCReporter(p).report(nprocs=opts.nprocs,**report_opts)
+
+    # Report projects in batch mode
+    if projects:
+        for name in report_projects(projects,nprocs=opts.nprocs,
+                                    **report_opts):
+            print "Completed report for %s" % name
+
+    # Report timings
+    if opts.timings:
+        print timings_table()
+    if opts.trace:
+        write_trace(opts.trace)
+        print "Wrote trace to %s" % opts.trace
 
 if __name__ == '__main__':
     main()
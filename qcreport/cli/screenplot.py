@@ -6,8 +6,8 @@ from .. import get_version
 import sys
 import os
 import optparse
-from ..screens import screenplot
-from ..screens import uscreenplot
+from ..plots import screenplot
+from ..plots import uscreenplot
 
 def main():
     # Process command line
@@ -20,15 +20,24 @@ def main():
                  "threshold (default no threshold)")
     p.add_option('-u',action='store_true',dest='micro',
                  help="make a 'micro' screen plot")
+    p.add_option('--svg',action='store_true',dest='svg',
+                 help="output 'micro' screen plot as SVG (default "
+                 "is PNG)")
     opts,args = p.parse_args()
     if len(args) < 1:
         p.error("Need to supply one or more FastqScreen .txt files")
+    if opts.svg and not opts.micro:
+        p.error("--svg can only be used for 'micro' screen plots")
     screen_files = args[:]
     # Make the boxplot
     ##outfile = os.path.splitext(os.path.basename(fq))[0] + '.png'
     outfile = 'ex.png'
     if opts.micro:
-        uscreenplot(screen_files,outfile)
+        if opts.svg:
+            outfile = 'ex.svg'
+            uscreenplot(screen_files,outfile,format='svg')
+        else:
+            uscreenplot(screen_files,outfile)
     else:
         if opts.threshold is not None:
             threshold = opts.threshold/100.0
@@ -12,19 +12,28 @@ def main():
     # Process command line
     p = optparse.OptionParser(usage="%prog FASTQ|FASTQC_DATA",
                               version="%prog "+get_version(),)
+    p.add_option('--svg',action='store_true',dest='svg',
+                 help="output plot as SVG (default is PNG)")
     opts,args = p.parse_args()
     if len(args) != 1:
         p.error("Need to supply FASTQ file or fastqc_data.txt file")
+    if opts.svg:
+        plot_format = 'svg'
+    else:
+        plot_format = 'png'
     # Make output file name
-    outfile = os.path.splitext(os.path.basename(args[0]))[0] + '.png'
+    outfile = os.path.splitext(os.path.basename(args[0]))[0] + \
+              '.' + plot_format
     # Try to detect if file is fastq_data.txt or FASTQ
     # and call the plotter with the appropriate args
     with open(args[0],'r') as fp:
         line = fp.readline()
         if line.startswith('##FastQC'):
-            uboxplot(fastq_data=args[0],outfile=outfile)
+            uboxplot(fastqc_data=args[0],outfile=outfile,
+                     format=plot_format)
         else:
-            uboxplot(fastq=args[0],outfile=outfile)
+            uboxplot(fastq=args[0],outfile=outfile,
+                     format=plot_format)
 
 if __name__ == '__main__':
     main()
@@ -2,17 +2,171 @@
 #
 # document generation library
 
+import os
+import re
+import json
+import gzip
+import base64
+from StringIO import StringIO
+import struct
+import hashlib
 from bcftbx.htmlpagewriter import HTMLPageWriter
+from .timings import timed
+
+# Placeholder used to locate the body in the page template
+BODY_PLACEHOLDER = "<!-- qcreport document body -->"
+
+# Script for rendering DataTables
+DATATABLE_JS = """function qcreport_datatable(id) {
+  var data = JSON.parse(document.getElementById(id+'_data').textContent);
+  var rows = data.rows;
+  var ncols = data.names.length;
+  var order = [];
+  var filters = {};
+  var sort_keys = {};
+  var sort_col = -1;
+  var sort_dir = 1;
+  var row_height = 0;
+  function text(v) {
+    if (v === null) return '';
+    return v.replace(/<[^>]*>/g,'').replace(/&nbsp;/g,' ').trim();
+  }
+  function keys(c) {
+    if (!sort_keys[c]) {
+      sort_keys[c] = rows.map(function(r) {
+        var t = text(r[c]);
+        var x = parseFloat(t.replace(/,/g,''));
+        return isNaN(x) ? t.toLowerCase() : x;
+      });
+    }
+    return sort_keys[c];
+  }
+  function row_html(i) {
+    var html = '<tr>';
+    for (var c = 0; c < ncols; c++)
+      html += '<td>' + (rows[i][c] === null ? '&nbsp;' : rows[i][c]) + '</td>';
+    return html + '</tr>';
+  }
+  function render() {
+    if (!row_height && order.length) {
+      tbody.innerHTML = row_html(order[0]);
+      row_height = tbody.rows[0].offsetHeight || 20;
+    }
+    var first = Math.max(0,Math.floor(scroller.scrollTop/row_height)-10);
+    var last = Math.min(order.length,
+                        first+Math.ceil(data.height/row_height)+20);
+    var html = '<tr style="height:'+(first*row_height)+'px"></tr>';
+    for (var i = first; i < last; i++) html += row_html(order[i]);
+    html += '<tr style="height:'+((order.length-last)*row_height)+'px"></tr>';
+    tbody.innerHTML = html;
+  }
+  function update() {
+    order = [];
+    for (var i = 0; i < rows.length; i++) {
+      var keep = true;
+      for (var c in filters)
+        if (filters[c] && text(rows[i][c]) != filters[c]) keep = false;
+      if (keep) order.push(i);
+    }
+    if (sort_col >= 0) {
+      var k = keys(sort_col);
+      order.sort(function(a,b) {
+        var x = k[a], y = k[b];
+        if (typeof x != typeof y) { x = String(x); y = String(y); }
+        return (x < y ? -sort_dir : (x > y ? sort_dir : 0)) || (a-b);
+      });
+    }
+    for (var c = 0; c < ncols; c++)
+      header.cells[c].innerHTML = data.names[c] +
+        (c == sort_col ? (sort_dir > 0 ? ' &#9650;' : ' &#9660;') : '');
+    count.innerHTML = order.length + ' of ' + rows.length + ' rows';
+    scroller.scrollTop = 0;
+    render();
+  }
+  var container = document.getElementById(id);
+  var controls = document.createElement('div');
+  controls.className = 'no_print';
+  data.filters.forEach(function(c) {
+    var values = {};
+    rows.forEach(function(r) { var t = text(r[c]); if (t) values[t] = 1; });
+    var select = document.createElement('select');
+    select.innerHTML = '<option value="">All</option>' +
+      Object.keys(values).sort().map(function(v) {
+        return '<option>' + v + '</option>'; }).join('');
+    select.onchange = function() { filters[c] = select.value; update(); };
+    controls.appendChild(document.createTextNode(text(data.names[c])+': '));
+    controls.appendChild(select);
+    controls.appendChild(document.createTextNode(' '));
+  });
+  var count = document.createElement('span');
+  controls.appendChild(count);
+  var scroller = document.createElement('div');
+  scroller.style.maxHeight = data.height + 'px';
+  scroller.style.overflowY = 'auto';
+  var table = document.createElement('table');
+  table.className = data.css;
+  var header = table.createTHead().insertRow();
+  for (var c = 0; c < ncols; c++) {
+    var th = document.createElement('th');
+    th.style.position = 'sticky';
+    th.style.top = '0';
+    th.style.cursor = 'pointer';
+    th.onclick = (function(c) { return function() {
+      if (sort_col == c) { sort_dir = -sort_dir; }
+      else { sort_col = c; sort_dir = 1; }
+      update();
+    }; })(c);
+    header.appendChild(th);
+  }
+  var tbody = table.createTBody();
+  scroller.appendChild(table);
+  container.appendChild(controls);
+  container.appendChild(scroller);
+  scroller.onscroll = render;
+  update();
+}"""
 
 class Document:
     """
     Utility class for constructing documents
 
+    If 'dedup_images' is set then images which are embedded
+    in the document more than once (i.e. which have
+    identical 'data:' URIs as their sources, and the same
+    displayed dimensions) are only included once, as a CSS
+    background image, and each use of the image is replaced
+    by a <span> which refers to it via a CSS class.
+
+    If 'assets_dir' is set then inline PNG images (i.e.
+    images with 'data:' URIs as their sources, including
+    those in CSS rules) are written to separate files in
+    that directory when the document is written, with
+    names generated from a hash of their contents. Images
+    are then loaded from these files (lazily, for <img>
+    tags) rather than being embedded in the document.
+
     """
-    def __init__(self,title=None):
+    def __init__(self,title=None,dedup_images=False,assets_dir=None):
         self._title = title
         self._sections = []
         self._css_rules = []
+        self._dedup_images = bool(dedup_images)
+        self._shared_image_css = []
+        self._assets_dir = assets_dir
+        self._assets = set()
+
+    @property
+    def assets(self):
+        """
+        Return the names of the asset files for the document
+
+        Returns:
+          Set: names of the files (without leading paths)
+            written to the assets directory for the images
+            in the document, when it was last written.
+
+        """
+        return self._assets
 
     def add_section(self,title=None,section=None,name=None):
         """
@@ -29,31 +183,224 @@ class Document:
         """
         self._css_rules.append(css_rule)
 
+    def _share_duplicate_images(self):
+        """
+        Internal: set up references for duplicated images
+
+        Finds inline images with identical sources and
+        display sizes, assigns each set a shared CSS class,
+        and generates the CSS rules containing the image
+        data.
+
+        """
+        images = {}
+        order = []
+        for item in walk(self._sections):
+            if isinstance(item,Img) and item.src.startswith('data:'):
+                size = image_size(item.src)
+                if size is None:
+                    continue
+                key = (hashlib.md5(item.src).hexdigest(),
+                       item.display_size(size))
+                try:
+                    images[key].append(item)
+                except KeyError:
+                    images[key] = [item]
+                    order.append(key)
+        self._shared_image_css = []
+        for key in order:
+            imgs = images[key]
+            if len(imgs) < 2:
+                continue
+            css_class = "img%d" % len(self._shared_image_css)
+            width,height = key[1]
+            for img in imgs:
+                img.set_shared(css_class)
+            self._shared_image_css.append(
+                "span.%s { display: inline-block;\n"
+                "          width: %dpx; height: %dpx;\n"
+                "          background-image: url(%s);\n"
+                "          background-size: 100%% 100%%; }" %
+                (css_class,width,height,imgs[0].src))
+
+    def _write_assets(self,html_dir):
+        """
+        Internal: write inline images to the assets directory
+
+        Replaces the sources of inline PNG images in the
+        document and CSS rules with references to files
+        in the assets directory.
+
+        Arguments:
+          html_dir (str): path to the directory that the
+            document is written to (references to the
+            assets are relative to this)
+
+        Returns:
+          List: updated list of CSS rules.
+
+        """
+        assets_dir = self._assets_dir
+        if not os.path.exists(assets_dir):
+            os.makedirs(assets_dir)
+        assets = {}
+        def asset_src(src):
+            try:
+                return assets[src]
+            except KeyError:
+                pass
+            filen = write_asset(src,assets_dir)
+            assets[src] = os.path.relpath(filen,html_dir)
+            return assets[src]
+        for item in walk(self._sections):
+            if isinstance(item,Img) and item.src.startswith('data:'):
+                size = image_size(item.src)
+                if size is None:
+                    continue
+                item.set_asset(asset_src(item.src),size)
+        css_rules = [re.sub(r"url\((data:image/png;base64,[^)]+)\)",
+                            lambda m: "url(%s)" % asset_src(m.group(1)),
+                            css_rule)
+                     for css_rule in self._css_rules]
+        self._assets = set([os.path.basename(src)
+                            for src in assets.values()])
+        return css_rules
+
     def html(self):
         """
         Generate HTML version of the document contents
 
         """
-        html = []
+        html = StringIO()
+        self.write_html(html)
+        return html.getvalue()
+
+    def write_html(self,fp):
+        """
+        Write HTML version of the document contents to a stream
+
+        Arguments:
+          fp (File): file-like object to write to
+
+        """
+        if self._dedup_images:
+            self._share_duplicate_images()
+        self._write_sections(fp)
+
+    def _write_sections(self,fp):
+        """
+        Internal: write the HTML for the title and sections
+
+        """
+        sep = ''
         if self._title is not None:
-            html.append("<h1>%s</h1>" % self._title)
+            fp.write("<h1>%s</h1>" % self._title)
+            sep = '\n'
         for section in self._sections:
-            try:
-                html.append(section.html())
-            except AttributeError,ex:
-                html.append("<p>Failed to render section: %s</p>" % ex)
-        return '\n'.join(html)
+            fp.write(sep)
+            section.write_html(fp)
+            sep = '\n'
 
-    def write(self,outfile):
+    @timed('Document.write',args=('outfile',))
+    def write(self,outfile,gzip_level=None,plain=True):
         """
         Write document contents to a file
 
+        The document contents are streamed directly to
+        the file rather than being assembled in memory
+        first. Optionally a gzip-compressed copy (with
+        '.gz' appended to the name) can be written at the
+        same time, either alongside or instead of the
+        uncompressed file.
+
+        Arguments:
+          outfile (str): path to write the document to
+          gzip_level (int): if set then also write a
+            compressed copy using this compression level
+            (1-9)
+          plain (boolean): if False then don't write the
+            uncompressed file (only the compressed copy)
+
+        Returns:
+          List: paths to the files which were written.
+
         """
+        if self._assets_dir:
+            css_rules = self._write_assets(
+                os.path.dirname(os.path.abspath(outfile)))
+        else:
+            css_rules = self._css_rules
+        if self._dedup_images:
+            self._share_duplicate_images()
+        # Get the page header and footer
         html = HTMLPageWriter(self._title)
-        for css_rule in self._css_rules:
+        for css_rule in css_rules:
+            html.addCSSRule(css_rule)
+        for css_rule in self._shared_image_css:
             html.addCSSRule(css_rule)
-        html.add(self.html())
-        html.write("%s" % outfile)
+        html.add(BODY_PLACEHOLDER)
+        page = StringIO()
+        html.write(fp=page)
+        header,footer = page.getvalue().split(BODY_PLACEHOLDER)
+        # Open the output files
+        outfiles = []
+        files = []
+        fps = []
+        try:
+            if plain:
+                files.append(open(outfile,'w'))
+                fps.append(files[-1])
+                outfiles.append(outfile)
+            if gzip_level is not None:
+                gzip_file = "%s.gz" % outfile
+                files.append(open(gzip_file,'wb'))
+                # Fixed timestamp so that the output is reproducible
+                fps.append(gzip.GzipFile(filename=os.path.basename(outfile),
+                                         mode='wb',
+                                         compresslevel=gzip_level,
+                                         fileobj=files[-1],
+                                         mtime=0))
+                outfiles.append(gzip_file)
+            # Write the page
+            fp = MultiWriter(*fps)
+            fp.write(header)
+            self._write_sections(fp)
+            fp.write(footer)
+        finally:
+            # Close compressed streams before the underlying files
+            for fp in fps:
+                fp.close()
+            for f in files:
+                f.close()
+        return outfiles
+
+class MultiWriter:
+    """
+    Utility class for writing the same output to multiple streams
+
+    Example usage:
+
+    >>> fp = MultiWriter(open('doc.html','w'),gzip.open('doc.html.gz','wb'))
+    >>> fp.write("<html>")
+
+    """
+    def __init__(self,*fps):
+        """
+        Create a new MultiWriter instance
+
+        Arguments:
+          fps (list): file-like objects to write to
+
+        """
+        self._fps = fps
+
+    def write(self,s):
+        """
+        Write a string to all the streams
+
+        """
+        for fp in self._fps:
+            fp.write(s)
 
 class Section:
     """
@@ -77,6 +424,7 @@ class Section:
         self._content = []
         self._css_classes = []
         self._level = level
+        self.page = None
 
     @property
     def name(self):
@@ -128,6 +476,18 @@ class Section:
         """
         Generate HTML version of the section
 
+        """
+        html = StringIO()
+        self.write_html(html)
+        return html.getvalue()
+
+    def write_html(self,fp):
+        """
+        Write HTML version of the section to a stream
+
+        Arguments:
+          fp (File): file-like object to write to
+
         """
         div = "<div"
         if self.name:
@@ -135,18 +495,20 @@ class Section:
         if self._css_classes:
             div += " class='%s'" % ' '.join(self._css_classes)
         div += ">"
-        html = [div,]
+        fp.write(div)
         if self._title is not None:
-            html.append("<h%d>%s</h%d>" % (self._level,
-                                           self._title,
-                                           self._level))
+            fp.write("\n<h%d>%s</h%d>" % (self._level,
+                                            self._title,
+                                            self._level))
         for content in self._content:
-            try:
-                html.append(content.html())
-            except AttributeError,ex:
-                html.append("<p>%s</p>" % str(content))
-        html.append('</div>')
-        return '\n'.join(html)
+            fp.write('\n')
+            if hasattr(content,'write_html'):
+                content.write_html(fp)
+            elif hasattr(content,'html'):
+                fp.write(content.html())
+            else:
+                fp.write("<p>%s</p>" % str(content))
+        fp.write('\n</div>')
 
 class Table:
     """
@@ -172,6 +534,14 @@ class Table:
         self._column_names = dict(kws)
         self._css_classes = []
 
+    @property
+    def columns(self):
+        """
+        Return the list of column ids
+
+        """
+        return list(self._columns)
+
     def add_css_classes(self,*classes):
         """
         Associate CSS classes with the section
@@ -223,7 +593,19 @@ class Table:
         Generate HTML version of the table contents
 
         """
-        html = []
+        html = StringIO()
+        self.write_html(html,css_id=css_id)
+        return html.getvalue()
+
+    def write_html(self,fp,css_id=None):
+        """
+        Write HTML version of the table contents to a stream
+
+        Arguments:
+          fp (File): file-like object to write to
+          css_id (str): optional 'id' for the table
+
+        """
         # Opening tag
         table_tag = []
         table_tag.append("<table")
@@ -232,10 +614,10 @@ class Table:
         if self._css_classes:
             table_tag.append(" class='%s'" % ' '.join(self._css_classes))
         table_tag.append(">\n")
-        html.append(''.join(table_tag))
+        fp.write(''.join(table_tag))
         # Header
         header = []
-        header.append("<tr>")
+        header.append("\n<tr>")
         for col in self._columns:
             try:
                 col_name = self._column_names[col]
@@ -243,24 +625,113 @@ class Table:
                 col_name = col
             header.append("<th>%s</th>" % col_name)
         header.append("</tr>")
-        html.append(''.join(header))
+        fp.write(''.join(header))
         # Body
         for row in self._rows:
             line = []
-            line.append("<tr>")
+            line.append("\n<tr>")
             for col in self._columns:
-                try:
-                    value = row[col].html()
-                except KeyError:
+                if col not in row:
                     value = '&nbsp;'
-                except AttributeError:
+                elif hasattr(row[col],'html'):
+                    value = row[col].html()
+                else:
                     value = row[col]
                 line.append("<td>%s</td>" % value)
             line.append("</tr>")
-            html.append(''.join(line))
+            fp.write(''.join(line))
         # Finish
-        html.append("</table>")
-        return '\n'.join(html)
+        fp.write("\n</table>")
+
+class DataTable(Table):
+    """
+    Utility class for tables which are rendered client-side
+
+    Rather than writing every row of the table as HTML,
+    the values (i.e. the HTML for each cell) are written
+    as compact JSON data along with a small script which
+    renders the table in the browser. Only the rows which
+    are scrolled into view are rendered; the rows can be
+    sorted by clicking on the column headers (numerically
+    where the values are numbers), and filtered on the
+    values in selected columns.
+
+    Example usage:
+
+    >>> t = DataTable(('name','status'),name='Name',status='Status')
+    >>> t.add_filter('status')
+
+    Otherwise DataTables are used in the same way as
+    Tables.
+
+    """
+    def __init__(self,columns,**kws):
+        """
+        Create a new DataTable instance
+
+        Arguments:
+          columns (list): list of column ids
+          kws (mapping): optional, mapping of
+            column ids to actual names
+
+        """
+        Table.__init__(self,columns,**kws)
+        self._filters = []
+        self._height = 600
+
+    def add_filter(self,*columns):
+        """
+        Allow rows to be filtered on the values in columns
+
+        Arguments:
+          columns (list): list of column ids
+
+        """
+        for col in columns:
+            if col not in self._columns:
+                raise KeyError("Key '%s' not found" % col)
+            self._filters.append(col)
+
+    def write_html(self,fp,css_id='datatable'):
+        """
+        Write HTML version of the table contents to a stream
+
+        Arguments:
+          fp (File): file-like object to write to
+          css_id (str): 'id' for the table (defaults
+            to 'datatable')
+
+        """
+        fp.write("<div id='%s'></div>\n" % css_id)
+        fp.write("<script type='application/json' id='%s_data'>" % css_id)
+        fp.write(_json_for_html(
+            { 'names': [self._column_names.get(col,col)
+                        for col in self._columns],
+              'filters': [self._columns.index(col)
+                          for col in self._filters],
+              'css': ' '.join(self._css_classes),
+              'height': self._height, })[:-1])
+        fp.write(',"rows":[')
+        sep = '\n'
+        for row in self._rows:
+            values = []
+            for col in self._columns:
+                if col not in row:
+                    value = None
+                elif hasattr(row[col],'html'):
+                    value = row[col].html()
+                else:
+                    value = "%s" % row[col]
+                values.append(value)
+            fp.write(sep)
+            fp.write(_json_for_html(values))
+            sep = ',\n'
+        fp.write("]}</script>\n")
+        fp.write("<noscript><p>JavaScript is needed to display "
+                 "this table</p></noscript>\n")
+        fp.write("<script type='text/javascript'>\n%s\n"
+                 "qcreport_datatable('%s');\n</script>" % (DATATABLE_JS,
+                                                           css_id))
 
 class List:
     """
@@ -362,6 +833,9 @@ class Img:
         self._name = name
         self._target = href
         self._alt = alt
+        self._shared_class = None
+        self._lazy = False
+        self.page = None
 
     @property
     def name(self):
@@ -371,11 +845,93 @@ class Img:
         """
         return self._name
 
+    @property
+    def src(self):
+        """
+        Return the source for the image
+
+        """
+        return self._src
+
+    def display_size(self,size):
+        """
+        Return the displayed dimensions of the image
+
+        Missing height or width values are calculated
+        from the natural size so that the aspect ratio
+        is preserved.
+
+        Arguments:
+          size (tuple): the natural (width,height) of
+            the image (pixels)
+
+        Returns:
+          Tuple: (width,height) in pixels.
+
+        """
+        w,h = size
+        width,height = self._width,self._height
+        if not height and not width:
+            width,height = w,h
+        elif not width:
+            width = int(round(float(height)*w/h))
+        elif not height:
+            height = int(round(float(width)*h/w))
+        return (int(width),int(height))
+
+    def set_shared(self,css_class):
+        """
+        Display the image via a shared CSS class
+
+        Instead of an <img> tag embedding the image
+        source, a <span> is generated with the CSS
+        class, which is expected to supply the image
+        data as a background along with the dimensions.
+
+        Arguments:
+          css_class (str): CSS class which provides
+            the image
+
+        """
+        self._shared_class = css_class
+
+    def set_asset(self,src,size):
+        """
+        Display the image from an external file
+
+        The source is replaced, the image dimensions are
+        set explicitly (so that the layout doesn't change
+        as images are loaded), and the browser is told to
+        load the image lazily.
+
+        Arguments:
+          src (str): path to the external file
+          size (tuple): the natural (width,height) of
+            the image (pixels)
+
+        """
+        self._width,self._height = self.display_size(size)
+        self._src = src
+        self._lazy = True
+
+    def resolve_link(self):
+        """
+        Replace the link target with its href
+
+        The image no longer refers to the target object,
+        so the target can be discarded.
+
+        """
+        if self._target:
+            self._target = Link(None,self._target).href
+
     def html(self):
         """
         Generate HTML version of the image tag
 
         """
+        if self._shared_class:
+            return self._shared_html()
         # Build the tag contents
         html = []
         html.append("<img")
@@ -390,6 +946,9 @@ class Img:
         # Optional alt text
         if self._alt:
             html.append("alt='%s'" % self._alt)
+        # Lazy loading
+        if self._lazy:
+            html.append("loading='lazy'")
         # Close the tag
         html.append("/>")
         # Wrap in a hef
@@ -398,6 +957,25 @@ class Img:
         else:
             return " ".join(html)
 
+    def _shared_html(self):
+        """
+        Internal: generate HTML for shared image
+
+        """
+        html = []
+        html.append("<span")
+        if self._name:
+            html.append("id='%s'" % self._name)
+        html.append("class='%s'" % self._shared_class)
+        if self._alt:
+            html.append("title='%s'" % self._alt)
+        html = "%s></span>" % " ".join(html)
+        # Wrap in a hef
+        if self._target:
+            return Link(html,self._target).html()
+        else:
+            return html
+
 class Link:
     """
     Utility class for embedding <a href=...> tags
@@ -420,6 +998,13 @@ class Link:
     >>> ahref.href
     '#new_section'
 
+    If the target is in a different file (i.e. its
+    'page' attribute is set) then this is included:
+
+    >>> sect.page = 'page1.html'
+    >>> ahref.href
+    'page1.html#new_section'
+
     """
     def __init__(self,text,target=None):
         """
@@ -445,9 +1030,24 @@ class Link:
 
         """
         try:
-            return '#%s' % self._target.name
+            name = self._target.name
         except AttributeError:
             return str(self._target)
+        page = getattr(self._target,'page',None)
+        if page:
+            # Target is in another file
+            return '%s#%s' % (page,name)
+        return '#%s' % name
+
+    def resolve_link(self):
+        """
+        Replace the link target with its href
+
+        The link no longer refers to the target object,
+        so the target can be discarded.
+
+        """
+        self._target = self.href
 
     def html(self):
         """
@@ -489,6 +1089,7 @@ class Target:
 
         """
         self._name = name
+        self.page = None
 
     @property
     def name(self):
@@ -505,3 +1106,137 @@ class Target:
         """
         # Build the anchor
         return "<a id='%s' />" % self._name
+
+def walk(content):
+    """
+    Iterate over items of content and their nested content
+
+    Yields each of the items in 'content' in turn,
+    descending into Sections (i.e. their content) and
+    Tables (i.e. the values in each row).
+
+    Arguments:
+      content (list): list of items (e.g. Sections,
+        Tables, Imgs etc)
+
+    """
+    for item in content:
+        yield item
+        if isinstance(item,Section):
+            for x in walk(item._content):
+                yield x
+        elif isinstance(item,Table):
+            for row in item._rows:
+                for x in walk(row.values()):
+                    yield x
+
+def set_page(content,page):
+    """
+    Set the page for items of content and their nested content
+
+    Links to the Sections, Targets and Imgs within the
+    content will refer to them in the specified page.
+
+    Arguments:
+      content (list): list of items (e.g. Sections,
+        Tables, Imgs etc)
+      page (str): name of the file (e.g. 'page1.html')
+        that the content will be written to
+
+    """
+    for item in walk(content):
+        if isinstance(item,(Section,Target,Img)):
+            item.page = page
+
+def resolve_links(content):
+    """
+    Replace link targets within content with their hrefs
+
+    Afterwards the content no longer refers to the
+    link target objects (e.g. Sections in a page which
+    has already been written), so these can be
+    discarded.
+
+    Arguments:
+      content (list): list of items (e.g. Sections,
+        Tables, Imgs etc)
+
+    """
+    for item in walk(content):
+        if hasattr(item,'resolve_link'):
+            item.resolve_link()
+
+def _json_for_html(data):
+    """
+    Internal: return compact JSON for embedding in HTML
+
+    """
+    return json.dumps(data,separators=(',',':')).replace('</','<\\/')
+
+def image_size(src):
+    """
+    Return the dimensions of an inline PNG image
+
+    Arguments:
+      src (str): 'data:' URI with a Base64 encoded
+        PNG image
+
+    Returns:
+      Tuple: (width,height) in pixels, or None if the
+        dimensions couldn't be determined.
+
+    """
+    prefix = "data:image/png;base64,"
+    if not src.startswith(prefix):
+        return None
+    # Width and height are in the IHDR chunk
+    # which starts after the 8 byte PNG signature
+    try:
+        header = base64.b64decode(src[len(prefix):len(prefix)+32])
+    except TypeError:
+        return None
+    if len(header) < 24 or header[12:16] != 'IHDR':
+        return None
+    return struct.unpack('>II',header[16:24])
+
+def write_asset(src,assets_dir):
+    """
+    Write the contents of an inline PNG image to a file
+
+    The file name is generated from the MD5 checksum of
+    the image data, so identical images are only written
+    once.
+
+    Arguments:
+      src (str): 'data:' URI with a Base64 encoded
+        PNG image
+      assets_dir (str): directory to write the file to
+
+    Returns:
+      String: path to the file.
+
+    """
+    data = base64.b64decode(src[src.index(',')+1:])
+    filen = os.path.join(assets_dir,
+                         "%s.png" % hashlib.md5(data).hexdigest()[:16])
+    if not os.path.exists(filen):
+        tmp_filen = "%s.tmp" % filen
+        with open(tmp_filen,'wb') as fp:
+            fp.write(data)
+        os.rename(tmp_filen,filen)
+    return filen
+
+def remove_unused_assets(assets_dir,assets):
+    """
+    Remove files from an assets directory which aren't in use
+
+    Arguments:
+      assets_dir (str): path to the assets directory
+      assets (set): names of the asset files which are
+        still in use (see the 'assets' property of
+        Document)
+
+    """
+    for filen in os.listdir(assets_dir):
+        if filen.endswith('.png') and filen not in assets:
+            os.remove(os.path.join(assets_dir,filen))
@@ -1,8 +1,16 @@
 #!/usr/bin/env python
 #
 # Fastq statistics utilities
+import os
+import json
+import zlib
+from multiprocessing import Pool
 from bcftbx.FASTQFile import FastqIterator
 from .fastqc import FastqcData
+from .timings import timed
+
+# Size of blocks to read when counting reads (bytes)
+COUNT_BLOCKSIZE = 4*1024*1024
 
 class FastqQualityStats:
     """
@@ -131,10 +139,13 @@ class FastqQualityStats:
 
         Arguments:
           fastqc_data (str): path to a FastQC
-            ``fastqc_data.txt`` file
+            ``fastqc_data.txt`` file, or a FastqcData
+            instance with the data already read in
 
         """
-        for line in FastqcData(fastqc_data).data('Per base sequence quality'):
+        if not isinstance(fastqc_data,FastqcData):
+            fastqc_data = FastqcData(fastqc_data)
+        for line in fastqc_data.data('Per base sequence quality'):
             if line.startswith('#'):
                 continue
             i,mean,median,q25,q75,p10,p90 = line.strip().split('\t')
@@ -144,3 +155,150 @@ class FastqQualityStats:
             self.q75.append(int(float(q75)))
             self.p10.append(int(float(p10)))
             self.p90.append(int(float(p90)))
+
+@timed(args=('fastq',))
+def count_reads(fastq,blocksize=COUNT_BLOCKSIZE):
+    """
+    Count the reads in a Fastq file
+
+    The count is obtained by counting the newlines in
+    the file (which is read in large blocks) and dividing
+    by four, without parsing the records; gzipped Fastqs
+    (including those with multiple gzip members) are
+    decompressed on the fly.
+
+    Arguments:
+      fastq (str): path to the Fastq file (can be
+        gzipped)
+      blocksize (int): size of the blocks to read
+        (bytes)
+
+    Returns:
+      Integer: number of reads.
+
+    """
+    nlines = 0
+    last = '\n'
+    with open(fastq,'rb') as fp:
+        if fastq.endswith('.gz'):
+            blocks = _gunzip_blocks(fp,blocksize)
+        else:
+            blocks = iter(lambda: fp.read(blocksize),'')
+        for block in blocks:
+            if block:
+                nlines += block.count('\n')
+                last = block[-1]
+    if last != '\n':
+        # Final line has no trailing newline
+        nlines += 1
+    return nlines/4
+
+def _gunzip_blocks(fp,blocksize):
+    """
+    Internal: yield decompressed blocks of data from a gzipped file
+
+    """
+    decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+    while True:
+        data = fp.read(blocksize)
+        if not data:
+            break
+        while data:
+            # Limit the size of the decompressed blocks
+            yield decompressor.decompress(data,blocksize)
+            if decompressor.unused_data:
+                # Start of the next gzip member
+                data = decompressor.unused_data
+                yield decompressor.flush()
+                decompressor = zlib.decompressobj(16+zlib.MAX_WBITS)
+            else:
+                data = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+def read_counts(fastqs,nprocs=1,cache_file=None,scheduler=None,
+                update_cache=True):
+    """
+    Count the reads in a set of Fastq files
+
+    The Fastqs are counted in parallel using multiple
+    processes if 'nprocs' is greater than one (or using
+    a scheduler for an existing pool of worker processes,
+    in which case the largest Fastqs are counted first).
+    If a
+    cache file is supplied then counts are stored in it
+    along with the size and modification time of each
+    Fastq, and are reused on subsequent calls for Fastqs
+    which haven't changed.
+
+    Set 'update_cache' to False to use the counts already
+    in the cache without writing to it (e.g. when only
+    checking a project).
+
+    Arguments:
+      fastqs (list): list of paths to Fastq files
+      nprocs (int): number of processes to use
+      cache_file (str): path to a JSON file to cache
+        the counts in (will be created if it doesn't
+        exist)
+      scheduler (SizeScheduler): if not None then the
+        scheduler to count the reads with (overrides
+        'nprocs')
+      update_cache (boolean): if True (the default) then
+        store new counts in the cache file
+
+    Returns:
+      Dictionary: mapping of the Fastq paths to the
+        number of reads.
+
+    """
+    cache = {}
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file,'r') as fp:
+                cache = json.load(fp)
+        except ValueError:
+            # Corrupted cache, ignore it
+            cache = {}
+    counts = {}
+    tasks = []
+    for fastq in fastqs:
+        path = os.path.abspath(fastq)
+        st = os.stat(path)
+        entry = cache.get(path)
+        if entry and entry['size'] == st.st_size and \
+           entry['mtime'] == st.st_mtime:
+            counts[fastq] = entry['nreads']
+        else:
+            cache[path] = { 'size': st.st_size,
+                            'mtime': st.st_mtime, }
+            tasks.append((fastq,path))
+    if scheduler is not None and tasks:
+        nreads = scheduler.map(count_reads,
+                               [path for fastq,path in tasks],
+                               [cache[path]['size'] for fastq,path in tasks])
+    elif nprocs > 1 and len(tasks) > 1:
+        pool = Pool(nprocs)
+        try:
+            nreads = pool.map(count_reads,[path for fastq,path in tasks])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        nreads = [count_reads(path) for fastq,path in tasks]
+    for (fastq,path),n in zip(tasks,nreads):
+        counts[fastq] = n
+        cache[path]['nreads'] = n
+    if cache_file and update_cache and tasks:
+        try:
+            cache_dir = os.path.dirname(os.path.abspath(cache_file))
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_file = "%s.%d.tmp" % (cache_file,os.getpid())
+            with open(tmp_file,'w') as fp:
+                json.dump(cache,fp,indent=1,sort_keys=True)
+            os.rename(tmp_file,cache_file)
+        except (IOError,OSError):
+            # Unable to update the cache (e.g. read-only
+            # location), the counts are still returned
+            pass
+    return counts
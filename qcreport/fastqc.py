@@ -6,6 +6,8 @@ from bcftbx.TabFile import TabFile
 from bcftbx.htmlpagewriter import PNGBase64Encoder
 from .docwriter import Table
 from .docwriter import Link
+from .prefetch import open_file
+from .timings import timed
 
 """
 Example Fastqc summary text file (FASTQ_fastqc/summary.txt):
@@ -65,6 +67,7 @@ class Fastqc:
                   'per_tile_quality',
                   'sequence_length_distribution',
                   )
+    @timed('Fastqc')
     def __init__(self,fastqc_dir):
         """
         Create a new Fastqc instance
@@ -151,6 +154,7 @@ class FastqcSummary(TabFile):
     Class representing data from a Fastqc summary file
 
     """
+    @timed('FastqcSummary')
     def __init__(self,summary_file=None):
         """
         Create a new FastqcSummary instance
@@ -162,7 +166,7 @@ class FastqcSummary(TabFile):
                                        'File',))
         if summary_file:
             summary_file = os.path.abspath(summary_file)
-            with open(summary_file,'r') as fp:
+            with open_file(summary_file) as fp:
                 for line in fp:
                     line = line.strip()
                     self.append(tabdata=line)
@@ -200,6 +204,16 @@ class FastqcSummary(TabFile):
         return [r['Module'] for r in filter(lambda x: x['Status'] == 'FAIL',
                                             self)]
 
+    @property
+    def overall_status(self):
+        # Return 'FAIL' if any modules failed, 'WARN' if there
+        # were warnings but no failures, otherwise 'PASS'
+        if self.failures:
+            return 'FAIL'
+        elif self.warnings:
+            return 'WARN'
+        return 'PASS'
+
     def link_to_module(self,name,full_path=True):
         """
         """
@@ -246,6 +260,7 @@ class FastqcData:
     >>> nreads = fqc.basic_statistics('Total Sequences')
 
     """
+    @timed('FastqcData')
     def __init__(self,data_file):
         """
         Create a new FastqcData instance
@@ -260,7 +275,7 @@ class FastqcData:
         self._modules = {}
         if data_file:
             fastqc_module = None
-            with open(data_file,'r') as fp:
+            with open_file(data_file) as fp:
                 for line in fp:
                     line = line.strip()
                     if fastqc_module is None:
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+#
+# per-base quality heatmap library
+import os
+import json
+import numpy
+from matplotlib import cm
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+from .cache import file_info
+from .cache import file_unchanged
+from .prefetch import open_file
+from .timings import timed
+
+# Statistics stored for each position in the quality matrix
+QUALITY_STATS = ('mean','median',)
+
+def read_per_base_quality(fastqc_data):
+    """
+    Read the per-base quality statistics from a FastQC data file
+
+    Only the mean and median values are read from the
+    ``Per base sequence quality`` module; reading stops
+    at the end of the module, so the remainder of the
+    file isn't processed.
+
+    Arguments:
+      fastqc_data (str): path to a FastQC
+        ``fastqc_data.txt`` file
+
+    Returns:
+      Tuple: tuple of lists (mean,median) with the values
+        for each base position (where FastQC has grouped
+        positions together, the values for the group are
+        repeated for each position in it). The lists are
+        empty if the file doesn't exist.
+
+    """
+    try:
+        fp = open_file(fastqc_data)
+    except IOError:
+        return ([],[])
+    with fp:
+        lines = []
+        in_module = False
+        for line in fp:
+            if not in_module:
+                in_module = line.startswith('>>Per base sequence quality')
+                continue
+            if line.startswith('>>END_MODULE'):
+                break
+            lines.append(line)
+    return per_base_quality(lines)
+
+def per_base_quality(lines):
+    """
+    Extract the per-base quality statistics from FastQC data
+
+    Arguments:
+      lines (list): lines from the ``Per base sequence
+        quality`` module of a FastQC data file (e.g. as
+        returned by the 'data' method of a FastqcData
+        instance)
+
+    Returns:
+      Tuple: tuple of lists (mean,median) with the values
+        for each base position (where FastQC has grouped
+        positions together, the values for the group are
+        repeated for each position in it).
+
+    """
+    mean = []
+    median = []
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        fields = line.split('\t')
+        if '-' in fields[0]:
+            start,end = fields[0].split('-')
+            n = int(end) - int(start) + 1
+        else:
+            n = 1
+        mean.extend([float(fields[1])]*n)
+        median.extend([float(fields[2])]*n)
+    return (mean,median)
+
+@timed()
+def quality_matrix(fastqc_data_files,matrix_file):
+    """
+    Build a matrix of per-base quality statistics
+
+    The matrix has one row for each of the FastQC data
+    files, and for each row holds the mean and median
+    quality at each base position (in the order given by
+    'QUALITY_STATS'), i.e. its shape is
+    (nfiles,2,npositions). Positions where there is no
+    data (e.g. beyond the end of shorter reads, or for
+    missing files) are set to NaN.
+
+    The matrix is stored in 'matrix_file' in NumPy
+    '.npy' format and returned as a read-only memory
+    map, along with a manifest of the data files
+    ('<matrix_file>.json'). When the matrix is rebuilt,
+    the rows for data files which haven't changed since
+    the previous build are copied from the existing
+    matrix rather than being read in again.
+
+    Arguments:
+      fastqc_data_files (list): list of paths to
+        ``fastqc_data.txt`` files
+      matrix_file (str): path to the '.npy' file to
+        store the matrix in
+
+    Returns:
+      numpy.memmap: the matrix.
+
+    """
+    manifest_file = "%s.json" % matrix_file
+    # Load the matrix and manifest from the previous build
+    previous = None
+    previous_rows = {}
+    try:
+        with open(manifest_file,'r') as fp:
+            manifest = json.load(fp)
+        previous = numpy.load(matrix_file,mmap_mode='r')
+        if previous.shape[0] == len(manifest['inputs']):
+            for i,(path,info) in enumerate(manifest['inputs']):
+                previous_rows[path] = (i,info)
+    except (IOError,ValueError,KeyError):
+        pass
+    # Read in data from new or changed files
+    rows = []
+    npositions = 0
+    for path in fastqc_data_files:
+        path = os.path.abspath(path)
+        if path in previous_rows and \
+           file_unchanged(path,previous_rows[path][1]):
+            i,info = previous_rows[path]
+            row = previous[i]
+            npositions = max(npositions,
+                             numpy.count_nonzero(~numpy.isnan(row[0])))
+        else:
+            info = file_info(path)
+            row = read_per_base_quality(path)
+            npositions = max(npositions,len(row[0]))
+        rows.append((path,info,row))
+    # Write the new matrix to a temporary file
+    tmp_file = "%s.%d.tmp" % (matrix_file,os.getpid())
+    matrix = numpy.lib.format.open_memmap(tmp_file,mode='w+',
+                                          dtype=numpy.float32,
+                                          shape=(len(rows),
+                                                 len(QUALITY_STATS),
+                                                 npositions))
+    matrix[:] = numpy.nan
+    for i,(path,info,row) in enumerate(rows):
+        if isinstance(row,numpy.ndarray):
+            n = min(row.shape[1],npositions)
+            matrix[i,:,:n] = row[:,:n]
+        else:
+            for j,values in enumerate(row):
+                matrix[i,j,:len(values)] = values
+    matrix.flush()
+    del matrix
+    del previous
+    os.rename(tmp_file,matrix_file)
+    tmp_file = "%s.%d.tmp" % (manifest_file,os.getpid())
+    with open(tmp_file,'w') as fp:
+        json.dump({ 'stats': QUALITY_STATS,
+                    'inputs': [(path,info) for path,info,row in rows], },
+                  fp,indent=1,sort_keys=True)
+    os.rename(tmp_file,manifest_file)
+    return numpy.load(matrix_file,mmap_mode='r')
+
+@timed()
+def quality_heatmap_image(matrix,stat='median',row_height=None,
+                          column_width=2,cmap='RdYlGn',
+                          qmin=10,qmax=38):
+    """
+    Generate a heatmap image from a per-base quality matrix
+
+    Each row of the heatmap represents one of the rows
+    in the matrix (i.e. one Fastq) and each column a
+    base position; the colour shows the quality at that
+    position. Positions with no data are shown in white.
+
+    Arguments:
+      matrix (numpy.ndarray): quality matrix as
+        returned by 'quality_matrix'
+      stat (str): statistic to plot (either 'median',
+        the default, or 'mean')
+      row_height (int): height of each row (pixels);
+        by default this is scaled between 1 and 4
+        pixels according to the number of rows
+      column_width (int): width of each column (pixels)
+      cmap (str): name of the matplotlib colormap to use
+      qmin (int): quality mapped to the bottom of the
+        colormap (lower values are clipped)
+      qmax (int): quality mapped to the top of the
+        colormap (higher values are clipped)
+
+    Returns:
+      Image: PIL Image instance with the heatmap.
+
+    """
+    nrows,nstats,npositions = matrix.shape
+    if row_height is None:
+        row_height = default_row_height(nrows)
+    data = numpy.array(matrix[:,QUALITY_STATS.index(stat),:])
+    missing = numpy.isnan(data)
+    data = (numpy.clip(numpy.nan_to_num(data),qmin,qmax) - qmin) / \
+           float(qmax - qmin)
+    rgb = cm.get_cmap(cmap)(data,bytes=True)[:,:,:3]
+    rgb[missing] = 255
+    rgb = numpy.repeat(numpy.repeat(rgb,row_height,axis=0),
+                       column_width,axis=1)
+    return Image.fromarray(numpy.ascontiguousarray(rgb),'RGB')
+
+@timed()
+def quality_heatmap_plot(matrix,labels=None,stat='median',row_height=None,
+                         column_width=2,cmap='RdYlGn',qmin=10,qmax=38):
+    """
+    Generate a labelled heatmap from a per-base quality matrix
+
+    The heatmap (see 'quality_heatmap_image') is drawn
+    with the base positions along the x-axis and a colour
+    bar showing the quality scale alongside.
+
+    If labels are supplied for the rows then consecutive
+    rows with the same label (e.g. the Fastqs for one
+    sample) are treated as a group: the first row of each
+    group is labelled on the y-axis (skipping labels which
+    would overlap the previous one) and the groups are
+    separated by lines (unless the groups are too small
+    for the lines to be useful).
+
+    Arguments:
+      matrix (numpy.ndarray): quality matrix as
+        returned by 'quality_matrix'
+      labels (list): optional list of labels for each
+        row of the matrix
+      stat (str): statistic to plot (either 'median',
+        the default, or 'mean')
+      row_height (int): height of each row (pixels);
+        by default this is scaled between 1 and 4
+        pixels according to the number of rows
+      column_width (int): width of each column (pixels)
+      cmap (str): name of the matplotlib colormap to use
+      qmin (int): quality mapped to the bottom of the
+        colormap (lower values are clipped)
+      qmax (int): quality mapped to the top of the
+        colormap (higher values are clipped)
+
+    Returns:
+      Image: PIL Image instance with the plot.
+
+    """
+    nrows,nstats,npositions = matrix.shape
+    if row_height is None:
+        row_height = default_row_height(nrows)
+    heatmap = quality_heatmap_image(matrix,stat=stat,row_height=row_height,
+                                    column_width=column_width,cmap=cmap,
+                                    qmin=qmin,qmax=qmax)
+    # Groups of rows with the same label
+    groups = []
+    if labels:
+        for i,label in enumerate(labels):
+            if not groups or label != groups[-1][1]:
+                groups.append((i,label))
+    # Layout (pixels)
+    dpi = 100
+    width,height = heatmap.size
+    height = max(height,100)
+    if groups:
+        left = 20 + 7*max([len(str(label)) for i,label in groups])
+    else:
+        left = 20
+    left = min(left,200)
+    label_height = 12
+    right = 100
+    bottom = 40
+    top = 10
+    fig_width = left + width + right
+    fig_height = bottom + height + top
+    fig = Figure(figsize=(float(fig_width)/dpi,float(fig_height)/dpi),
+                 dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    # Heatmap
+    ax = fig.add_axes([float(left)/fig_width,float(bottom)/fig_height,
+                       float(width)/fig_width,float(height)/fig_height])
+    ax.imshow(numpy.asarray(heatmap),aspect='auto',interpolation='nearest',
+              extent=(0.5,npositions+0.5,nrows,0))
+    ax.set_xlabel("Base position",fontsize=7)
+    ax.tick_params(labelsize=7)
+    # Row labels and lines between groups
+    row_scale = float(height)/nrows
+    ticks = []
+    for i,label in groups:
+        if not ticks or (i - ticks[-1][0])*row_scale >= label_height:
+            ticks.append((i,label))
+    ax.set_yticks([i+0.5 for i,label in ticks])
+    ax.set_yticklabels([label for i,label in ticks])
+    if groups and height >= 4*len(groups):
+        for i,label in groups[1:]:
+            ax.axhline(i,color='black',linewidth=0.5)
+    # Colour key
+    cax = fig.add_axes([float(left+width+15)/fig_width,
+                        float(bottom)/fig_height,
+                        10.0/fig_width,
+                        float(height)/fig_height])
+    key = cm.ScalarMappable(norm=Normalize(qmin,qmax),
+                            cmap=cm.get_cmap(cmap))
+    key.set_array(numpy.array([]))
+    colorbar = fig.colorbar(key,cax=cax)
+    colorbar.set_label("%s quality" % stat.title(),fontsize=7)
+    colorbar.ax.tick_params(labelsize=7)
+    canvas.draw()
+    img = Image.frombytes('RGB',canvas.get_width_height(),
+                          canvas.tostring_rgb())
+    fig.clf()
+    return img
+
+def default_row_height(nrows):
+    """
+    Return the default height of each row of a heatmap
+
+    Arguments:
+      nrows (int): number of rows in the heatmap
+
+    Returns:
+      Integer: height in pixels (between 1 and 4, so
+        that smaller heatmaps are at least 400 pixels
+        high where possible).
+
+    """
+    return max(1,min(4,400/max(nrows,1)))
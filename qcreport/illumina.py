@@ -4,25 +4,77 @@
 
 import sys
 import os
+import glob
+import logging
+import threading
+from StringIO import StringIO
+from math import ceil
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from auto_process_ngs.utils import AnalysisFastq
 from bcftbx.TabFile import TabFile
 from bcftbx.qc.report import strip_ngs_extensions
 from .docwriter import Document
+from .docwriter import Section
 from .docwriter import Table
+from .docwriter import DataTable
 from .docwriter import Img
 from .docwriter import Link
 from .docwriter import Target
+from .docwriter import set_page
+from .docwriter import resolve_links
+from .docwriter import remove_unused_assets
 from .fastqc import Fastqc
 from .screens import Fastqscreen
-from .plots import uscreenplot
-from .plots import ufastqcplot
-from .plots import uboxplot
-from .plots import encode_png
+from .plots import uscreenplot_image
+from .plots import ufastqcplot_image
+from .plots import uboxplot_image
+from .plots import png_bytes
+from .plots import encode_png_data
+from .plots import svg_from_image
+from .plots import svg_css_rules
+from .sprites import SpriteSheet
+from .thumbnails import make_thumbnails
+from .prefetch import Prefetcher
+from .prefetch import open_file
+from .pipeline import PipelineSource
+from .pipeline import PipelineSink
+from .pipeline import pipeline_stats_table
+from .timings import Span
+from .timings import timed
+from .scheduler import worker_pool
+from .fastq_stats import read_counts
+from .fastq_stats import FastqQualityStats
+from .cache import ReportCache
+from .cache import cache_key
+from .cache import source_checksum
+from .heatmap import quality_matrix
+from .heatmap import quality_heatmap_plot
+from .metrics import MetricsStore
+from .metrics import fastq_metrics
+from .metrics import run_name
+from .metrics import write_metrics_json
+from .metrics import write_metrics_tsv
+from . import get_version
+try:
+    from os import scandir
+except ImportError:
+    # Python 2: use the 'scandir' backport if available
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+logger = logging.getLogger(__name__)
 
 FASTQ_SCREENS = ('model_organisms',
                  'other_organisms',
                  'rRNA',)
 
+# Prefetcher for each worker process, as (pid,Prefetcher)
+# (see '_worker_prefetcher')
+_prefetcher = None
+
 #######################################################################
 # Classes
 #######################################################################
@@ -32,19 +84,25 @@ class QCReporter:
     Class describing QC results for an AnalysisProject
 
     """
-    def __init__(self,project):
+    def __init__(self,project,cache_dir=None):
         """
         Initialise a new QCReporter instance
 
         Arguments:
            project (AnalysisProject): project to handle the QC for
+           cache_dir (str): directory to store cached data
+             (e.g. thumbnails) in; defaults to '.qcreport_cache'
+             in the QC directory
 
         """
         self._project = project
         self._samples = []
         self._parent_dir = os.path.dirname(self._project.dirn)
         self._stats_file = os.path.join(self._parent_dir,'statistics.info')
-        self._qc_dir = self._project.qc_dir
+        self._qc_dir = os.path.abspath(self._project.qc_dir)
+        if cache_dir is None:
+            cache_dir = os.path.join(self._qc_dir,'.qcreport_cache')
+        self._cache_dir = os.path.abspath(cache_dir)
         try:
             self._stats = FastqStats(self._stats_file)
         except IOError:
@@ -53,6 +111,9 @@ class QCReporter:
         for sample in self._project.samples:
             self._samples.append(QCSample(sample))
         print "Found %d samples" % len(self._samples)
+        self._image_stats = None
+        self._metrics = None
+        self._read_counts = {}
 
     @property
     def name(self):
@@ -62,6 +123,23 @@ class QCReporter:
     def paired_end(self):
         return self._project.info.paired_end
 
+    @property
+    def image_stats(self):
+        """
+        Return statistics on the embedded micro-plots
+
+        Returns a dictionary with the number of micro-plots
+        embedded in the last report ('nimages'), the total
+        size of the PNG or SVG data ('plot_bytes') and the
+        total size once embedded ('encoded_bytes', i.e.
+        after Base64 encoding for PNGs); all sizes are in
+        bytes. When the micro-plots are packed into sprite
+        sheets the sizes are for the sheets. Returns None if
+        no report has been generated.
+
+        """
+        return self._image_stats
+
     def verify(self):
         """
         Check that the QC outputs are correct
@@ -71,18 +149,737 @@ class QCReporter:
 
         """
         verified = True
+        index = qc_dir_index(self._qc_dir)
         for sample in self._samples:
-            if not sample.verify(self._qc_dir):
+            if not sample.verify(self._qc_dir,index=index):
                 verified = False
         return verified
 
-    def report(self):
+    def missing_outputs(self):
+        """
+        Return the QC outputs which are missing
+
+        Returns:
+          List: list of paths to the expected QC outputs
+            which are missing from the QC directory, for
+            all Fastqs in the project.
+
+        """
+        missing = []
+        index = qc_dir_index(self._qc_dir)
+        for sample in self._samples:
+            for fq_pair in sample.fastq_pairs:
+                for fq in fq_pair:
+                    if fq is None:
+                        continue
+                    missing.extend(check_qc_outputs(fq,self._qc_dir,
+                                                    index=index)[1])
+        return missing
+
+    def fastqs_without_counts(self,index=None):
+        """
+        Return the Fastqs with no read count available
+
+        These are the Fastqs which are missing from the
+        statistics file and which also have no FastQC
+        outputs.
+
+        Arguments:
+          index (set): optional set of names in the QC
+            directory (see 'qc_dir_index'); if not supplied
+            then the QC directory is listed
+
+        Returns:
+          List: list of paths to the Fastqs.
+
+        """
+        if index is None:
+            index = qc_dir_index(self._qc_dir)
+        fastqs = []
+        for sample in self._samples:
+            for fq_pair in sample.fastq_pairs:
+                for fq in fq_pair:
+                    if fq is None:
+                        continue
+                    if self._stats is not None and \
+                       self._stats.nreads(fq) is not None:
+                        continue
+                    if fastqc_output(fq)[0] in index:
+                        continue
+                    fastqs.append(fq)
+        return fastqs
+
+    def count_reads(self,fastqs,nprocs=1,scheduler=None,update_cache=True):
+        """
+        Count the reads in Fastqs directly
+
+        The counts are cached in the cache directory, so
+        Fastqs are only counted again if they change.
+
+        Arguments:
+          fastqs (list): list of paths to Fastqs
+          nprocs (int): number of processes to use for
+            counting
+          scheduler (SizeScheduler): if not None then the
+            scheduler to use for counting
+          update_cache (boolean): if False then counts
+            already in the cache are used but new counts
+            aren't written to it
+
+        Returns:
+          Dictionary: mapping of the Fastq paths to the
+            number of reads.
+
+        """
+        return read_counts(fastqs,nprocs=nprocs,
+                           cache_file=os.path.join(self._cache_dir,
+                                                   'read_counts.json'),
+                           scheduler=scheduler,
+                           update_cache=update_cache)
+
+    def report(self,sprites=False,nprocs=1,plot_format='png',
+               use_cache=True,assets=False,samples_per_page=None,
+               data_table=False,gzip_level=None,plain=True,
+               heatmap=False,metrics_db=None,run=None,
+               metrics_file=None,memory_budget=None,queue_size=8,
+               pipeline_stats=False,scheduler=None):
         """
         Report the QC for the project
 
+        Arguments:
+          sprites (boolean): if True then pack the
+            'micro-plots' in the summary table into
+            sprite sheets, rather than embedding each
+            one as a separate image (default; ignored
+            for SVG micro-plots)
+          nprocs (int): number of processes to use
+            for generating thumbnails and the report
+            content for each Fastq
+          plot_format (str): format for the micro-plots,
+            either 'png' (the default) or 'svg' (inline
+            SVG)
+          use_cache (boolean): if True (the default) then
+            reuse report content for Fastqs from previous
+            runs where the QC outputs haven't changed
+          assets (boolean): if True then write the images
+            to a separate '<NAME>.qcreport_assets' directory
+            alongside the report (which are then loaded
+            lazily), rather than embedding them in the
+            report (the default)
+          samples_per_page (int): if set then the reports
+            for the samples are written to separate pages
+            ('<NAME>.qcreport.p<N>.html') with this many
+            samples on each, linked from the summary in the
+            main report (by default everything is written to
+            a single file)
+          data_table (boolean): if True then the summary
+            table is rendered in the browser from JSON data
+            (with sorting and filtering), rather than being
+            written as a static HTML table (the default)
+          gzip_level (int): if set then also write
+            gzip-compressed copies of the report files
+            ('.html.gz') using this compression level (1-9)
+          plain (boolean): if False then only write the
+            compressed copies of the report files
+          heatmap (boolean): if True then add a heatmap of
+            the per-base median quality for all Fastqs at
+            the top of the report
+          metrics_db (str): if set then store the QC
+            metrics for each Fastq in this SQLite database
+            (see 'MetricsStore')
+          run (str): name of the sequencing run to store
+            the metrics under (defaults to the name of the
+            directory containing the project, without any
+            trailing '_analysis')
+          metrics_file (str): if set then also write the
+            QC metrics for each Fastq to a '<NAME>.qcreport.json'
+            or '<NAME>.qcreport.tsv' file alongside the report
+            (for 'json' or 'tsv' respectively)
+          memory_budget (int): if set then limit the total
+            size of the files (in bytes) being processed by
+            the worker processes at any one time
+          queue_size (int): maximum number of Fastqs to
+            hold the report content for while waiting for
+            it to be added to the report
+          pipeline_stats (boolean): if True then print
+            statistics on the stages of the report pipeline
+            (for tuning 'queue_size' etc)
+          scheduler (SizeScheduler): if not None then the
+            scheduler to use for the thumbnails, read counts
+            and Fastq report content (instead of starting a
+            new pool of 'nprocs' processes); this allows a
+            single pool to be shared between several projects
+            (see 'report_projects')
+
+        """
+        with _report_scheduler(nprocs,memory_budget,scheduler) as scheduler:
+            report_span = Span('report',project=self.name)
+            report_file = "%s.qcreport.html" % self.name
+            if assets:
+                assets_dir = report_assets_dir(self.name)
+            else:
+                assets_dir = None
+            report = self._report_document("%s: QC report" % self.name,
+                                           assets_dir=assets_dir)
+            # Statistics on embedded micro-plots
+            self._image_stats = dict(nimages=0,
+                                     plot_bytes=0,
+                                     encoded_bytes=0)
+            # Metrics for each Fastq
+            self._metrics = []
+            # Count reads where the count isn't otherwise available
+            self._count_missing_reads(scheduler=scheduler)
+            # Thumbnails for the FastQC and screen plots
+            with Span('thumbnails'):
+                thumbnails = self._make_thumbnails(scheduler=scheduler)
+            # Styles for SVG micro-plots
+            if plot_format == 'svg':
+                for css_rule in svg_css_rules():
+                    report.add_css_rule(css_rule)
+            # Sprite sheet for micro-plots
+            if sprites and plot_format == 'png':
+                sprite_sheet = SpriteSheet()
+            else:
+                sprite_sheet = None
+            # Per-base quality heatmap
+            if heatmap:
+                self._add_heatmap(report)
+            # Summary section & table
+            summary,summary_tbl = self._add_summary(report,data_table)
+            # Sections for each sample and Fastq
+            if use_cache:
+                cache = ReportCache(os.path.join(self._cache_dir,'sections'))
+            else:
+                cache = None
+            written,assets_used = self._render_sections(
+                report,summary,summary_tbl,report_file,
+                thumbnails=thumbnails,
+                plot_format=plot_format,
+                sprite_sheet=sprite_sheet,
+                samples_per_page=samples_per_page,
+                assets_dir=assets_dir,
+                cache=cache,
+                scheduler=scheduler,
+                gzip_level=gzip_level,
+                plain=plain,
+                queue_size=queue_size,
+                pipeline_stats=pipeline_stats)
+            # Store the metrics
+            self._store_metrics(metrics_db=metrics_db,
+                                run=run,
+                                metrics_file=metrics_file)
+            # Add the micro-plot styles
+            self._add_micro_plot_rules(report,sprite_sheet,plot_format)
+            # Write the report
+            self._write_pages(report,report_file,written,assets_used,
+                              assets_dir=assets_dir,
+                              gzip_level=gzip_level,
+                              plain=plain)
+            report_span.end()
+
+    def _count_missing_reads(self,scheduler=None):
+        """
+        Internal: count the reads for Fastqs without a count
+
+        The counts are used for Fastqs which don't have a
+        read count from the statistics file or FastQC (see
+        'fastqs_without_counts' and 'count_reads').
+
+        Arguments:
+          scheduler (SizeScheduler): if not None then the
+            scheduler to use for counting
+
+        """
+        fastqs = self.fastqs_without_counts()
+        if fastqs:
+            with Span('count reads'):
+                self._read_counts = self.count_reads(fastqs,
+                                                     scheduler=scheduler)
+            print "Counted reads for %d Fastqs without FastQC data" % \
+                len(fastqs)
+
+    def _add_heatmap(self,report):
+        """
+        Internal: add the per-base quality heatmap to the report
+
+        Arguments:
+          report (Document): the report document
+
+        """
+        with Span('heatmap'):
+            heatmap_img = self._quality_heatmap()
+        if heatmap_img is not None:
+            section = report.add_section("Per-base quality",
+                                         name='quality_heatmap')
+            section.add("Median quality at each base position "
+                        "for each Fastq: there is one row per "
+                        "Fastq (so the R1 and R2 Fastqs of each "
+                        "pair are on adjacent rows), grouped by "
+                        "sample in the same order as the summary "
+                        "table")
+            section.add(heatmap_img)
+
+    def _add_summary(self,report,data_table=False):
+        """
+        Internal: add the summary section and table to the report
+
+        Arguments:
+          report (Document): the report document
+          data_table (boolean): if True then the summary
+            table is rendered in the browser from JSON data
+
+        Returns:
+          Tuple: (section,table) with the summary Section
+            and its (empty) Table or DataTable.
+
+        """
+        summary = report.add_section("Summary",name='summary')
+        summary.add("%d samples | %d fastqs" % (len(self._samples),
+                                                len(self._project.fastqs)))
+        if data_table:
+            summary_tbl = DataTable(('sample',),sample='Sample')
+            for status,color in (('PASS','green'),
+                                 ('WARN','orange'),
+                                 ('FAIL','red')):
+                report.add_css_rule("table.summary span.%s { font-weight: bold;\n"
+                                    "                        color: %s; }" %
+                                    (status,color))
+        else:
+            summary_tbl = Table(('sample',),sample='Sample')
+        summary_tbl.add_css_classes('summary')
+        summary.add(summary_tbl)
+        if self.paired_end:
+            summary_tbl.append_columns('fastqs',fastqs='Fastqs (R1/R2)')
+        else:
+            summary_tbl.append_columns('fastq',fastq='Fastq')
+        summary_tbl.append_columns('reads','fastqc_r1','boxplot_r1','screens_r1',
+                                   reads='#reads',fastqc_r1='FastQC',boxplot_r1='Boxplot',
+                                   screens_r1='Screens')
+        if self.paired_end:
+            summary_tbl.append_columns('fastqc_r2','boxplot_r2','screens_r2',
+                                   fastqc_r2='FastQC',boxplot_r2='Boxplot',
+                                   screens_r2='Screens')
+        if data_table:
+            # Overall FastQC status for filtering
+            if self.paired_end:
+                summary_tbl.append_columns('status_r1','status_r2',
+                                           status_r1='Status (R1)',
+                                           status_r2='Status (R2)')
+                summary_tbl.add_filter('status_r1','status_r2')
+            else:
+                summary_tbl.append_columns('status_r1',
+                                           status_r1='Status')
+                summary_tbl.add_filter('status_r1')
+        return (summary,summary_tbl)
+
+    def _render_sections(self,report,summary,summary_tbl,report_file,
+                         thumbnails,plot_format='png',sprite_sheet=None,
+                         samples_per_page=None,assets_dir=None,cache=None,
+                         scheduler=None,gzip_level=None,plain=True,
+                         queue_size=8,pipeline_stats=False):
+        """
+        Internal: add the sections for each sample and Fastq
+
+        The sections are generated as a pipeline: the
+        content for each Fastq is generated in the background
+        (with the QC outputs read ahead when not using worker
+        processes) and assembled into the report here, while
+        completed pages of sample reports are written in the
+        background.
+
+        Arguments:
+          report (Document): the report document
+          summary (Section): the summary section
+          summary_tbl (Table): the summary table
+          report_file (str): name of the main report file
+          thumbnails (dict): mapping of PNGs to thumbnails
+          plot_format (str): format for the micro-plots
+          sprite_sheet (SpriteSheet): if not None then
+            micro-plots are added to this sprite sheet
+          samples_per_page (int): if set then the sample
+            reports are written to separate pages with
+            this many samples on each
+          assets_dir (str): if not None then the assets
+            directory for images in the pages
+          cache (ReportCache): if not None then the cache
+            for Fastq report content
+          scheduler (SizeScheduler): if not None then the
+            scheduler to generate the content with
+          gzip_level (int): if set then also write
+            compressed copies of the pages
+          plain (boolean): if False then only write the
+            compressed copies of the pages
+          queue_size (int): maximum number of Fastqs to
+            hold the report content for
+          pipeline_stats (boolean): if True then print
+            statistics on the stages of the pipeline
+
+        Returns:
+          Tuple: (written,assets) where 'written' is a list
+            of the page files which were written, and
+            'assets' is a set of the assets they use.
+
+        """
+        # Tasks for generating the reports for each Fastq
+        tasks = []
+        for sample in self._samples:
+            for fq_pair in sample.fastq_pairs:
+                tasks.append(self._report_fastq_task(fq_pair.r1,'r1',
+                                                     thumbnails,
+                                                     plot_format,
+                                                     sprite_sheet))
+                if self.paired_end:
+                    tasks.append(self._report_fastq_task(fq_pair.r2,'r2',
+                                                         thumbnails,
+                                                         plot_format,
+                                                         sprite_sheet))
+        if scheduler is None:
+            prefetcher = Prefetcher()
+        else:
+            prefetcher = None
+        fastq_reports = PipelineSource('render',
+                                       self._fastq_reports(
+                                           tasks,
+                                           cache=cache,
+                                           scheduler=scheduler,
+                                           prefetcher=prefetcher),
+                                       queue_size=queue_size)
+        def write_page(args):
+            page,page_file = args
+            outfiles = self._write_document(page,page_file,
+                                            gzip_level,plain)
+            return (outfiles,page.assets)
+        page_writer = PipelineSink('write',write_page)
+        # Pages for the sample reports
+        if samples_per_page:
+            npages = int(ceil(float(len(self._samples))/samples_per_page))
+            summary.add("Sample reports: %s" %
+                        " | ".join([Link("page %d" % (n+1),
+                                         report_page(self.name,n+1)).html()
+                                    for n in xrange(npages)]))
+        else:
+            npages = 0
+        page = None
+        page_file = None
+        written = []
+        assets = set()
+        # Write entries for samples, fastqs etc
+        assemble_span = Span('assemble')
+        try:
+            for i,sample in enumerate(self._samples):
+                if npages and i % samples_per_page == 0:
+                    # Write the current page and start a new one
+                    if page is not None:
+                        page_writer.put((page,page_file))
+                    page_no = i/samples_per_page + 1
+                    page_file = report_page(self.name,page_no)
+                    page = self._report_page_document(report_file,
+                                                      page_no,npages,
+                                                      assets_dir=assets_dir)
+                print "Sample #%3d: %s " % (i+1,sample.name)
+                if page is not None:
+                    sample_doc = page
+                else:
+                    sample_doc = report
+                self._add_sample(sample,sample_doc,summary_tbl,
+                                 fastq_reports,sprite_sheet,
+                                 page_file=page_file)
+            # Write the final page
+            if page is not None:
+                page_writer.put((page,page_file))
+                page = None
+            # Report the pages from this thread (rather than the
+            # writer's) so the output isn't mixed with the sample
+            # names, and is captured along with the rest of the
+            # project's output in batch mode
+            for outfiles,page_assets in page_writer.close():
+                self._report_written(outfiles)
+                written.extend(outfiles)
+                assets.update(page_assets)
+            assemble_span.end()
+        finally:
+            fastq_reports.close()
+            page_writer.abort()
+            if prefetcher is not None:
+                prefetcher.close()
+        if cache is not None:
+            cache.save()
+            print "Reused %d of %d Fastq sections from cache" % \
+                (cache.nreused,len(tasks))
+        if pipeline_stats:
+            print pipeline_stats_table([fastq_reports,page_writer])
+            if prefetcher is not None:
+                print "Read %d files ahead (%d reads reused, at most " \
+                    "%d bytes held)" % (prefetcher.nreads,
+                                        prefetcher.nreused,
+                                        prefetcher.max_nbytes)
+        return (written,assets)
+
+    def _report_page_document(self,report_file,page_no,npages,
+                              assets_dir=None):
+        """
+        Internal: create a new page for sample reports
+
+        Arguments:
+          report_file (str): name of the main report file
+          page_no (int): number of the page
+          npages (int): total number of pages
+          assets_dir (str): if not None then the assets
+            directory for images in the page
+
+        Returns:
+          Document: new Document instance with the
+            navigation links for the page.
+
+        """
+        page = self._report_document(
+            "%s: QC report (page %d of %d)" % (self.name,
+                                               page_no,
+                                               npages),
+            assets_dir=assets_dir)
+        page.add_section(name='navigation').add(
+            report_navigation(report_file,
+                              page_no,
+                              npages,
+                              report_page(self.name,page_no-1),
+                              report_page(self.name,page_no+1)))
+        return page
+
+    def _add_sample(self,sample,sample_doc,summary_tbl,fastq_reports,
+                    sprite_sheet=None,page_file=None):
+        """
+        Internal: add the report for a sample
+
+        Arguments:
+          sample (QCSample): the sample to report
+          sample_doc (Document): document to add the
+            sample report to
+          summary_tbl (Table): summary table to add rows
+            for the sample's Fastqs to
+          fastq_reports (iterator): source of the
+            (section,values,stats) tuples for the Fastqs,
+            in report order
+          sprite_sheet (SpriteSheet): if not None then
+            micro-plots are added to this sprite sheet
+          page_file (str): if not None then the file that
+            the sample report will be written to
+
+        """
+        sample_name = sample.name
+        sample_report = sample_doc.add_section("Sample: %s" % sample_name,
+                                               name="sample_%s" % sample_name)
+        sample_report.add_css_classes('sample')
+        sample_report.page = page_file
+        if self.paired_end:
+            sample_report.add("%d fastq R1/R2 pairs" %
+                              len(sample.fastq_pairs))
+        else:
+            sample_report.add("%d fastqs" % len(sample.fastq_pairs))
+        for fq_pair in sample.fastq_pairs:
+            # Sample name for first pair only
+            if sample_name is not None:
+                sample_link = Link(sample_name,sample_report)
+                if page_file:
+                    sample_link.resolve_link()
+                idx = summary_tbl.add_row(sample=sample_link)
+            else:
+                idx = summary_tbl.add_row(sample="&nbsp;")
+            # Container for fastqs
+            fqs_report = sample_report.add_subsection()
+            fqs_report.add_css_classes('fastqs')
+            # Add the reports for R1 (and R2)
+            fqr1_report = self._add_fastq_report(fastq_reports.next(),
+                                                 fqs_report,
+                                                 summary_tbl,idx,
+                                                 sprite_sheet,
+                                                 page=page_file)
+            if self.paired_end:
+                fqr2_report = self._add_fastq_report(fastq_reports.next(),
+                                                     fqs_report,
+                                                     summary_tbl,idx,
+                                                     sprite_sheet,
+                                                     page=page_file)
+                # Add entries to summary table
+                summary_tbl.set_value(idx,'fastqs',
+                                      "%s<br />%s" %
+                                      (Link(fqr1_report.name,
+                                            fqr1_report),
+                                       Link(fqr2_report.name,
+                                            fqr2_report)))
+            else:
+                # Add entry to summary table
+                fqr1_link = Link(fqr1_report.name,fqr1_report)
+                if page_file:
+                    fqr1_link.resolve_link()
+                summary_tbl.set_value(idx,'fastq',fqr1_link)
+            # Reset sample name for remaining pairs
+            sample_name = None
+            # Add an empty section to clear HTML floats
+            clear = fqs_report.add_subsection()
+            clear.add_css_classes("clear")
+
+    def _store_metrics(self,metrics_db=None,run=None,metrics_file=None):
+        """
+        Internal: store the metrics collected for each Fastq
+
+        Arguments:
+          metrics_db (str): if set then store the metrics
+            in this SQLite database (see 'MetricsStore')
+          run (str): name of the sequencing run to store
+            the metrics under (defaults to the name of the
+            directory containing the project)
+          metrics_file (str): if set then also write the
+            metrics to a '<NAME>.qcreport.<FORMAT>' file,
+            where FORMAT is either 'json' or 'tsv'
+
+        """
+        if metrics_db:
+            if run is None:
+                run = run_name(self._project.dirn)
+            with Span('store metrics'):
+                store = MetricsStore(metrics_db)
+                try:
+                    store.add_project(run,self.name,self._metrics)
+                finally:
+                    store.close()
+            print "Stored metrics for %d Fastqs in %s" % \
+                (len(self._metrics),metrics_db)
+        if metrics_file:
+            filen = "%s.qcreport.%s" % (self.name,metrics_file)
+            if metrics_file == 'json':
+                write_metrics_json(self._metrics,filen,project=self.name)
+            elif metrics_file == 'tsv':
+                write_metrics_tsv(self._metrics,filen)
+            else:
+                raise Exception("Unrecognised metrics file format '%s'" %
+                                metrics_file)
+            print "Wrote %s (%d bytes)" % (filen,os.path.getsize(filen))
+
+    def _add_micro_plot_rules(self,report,sprite_sheet=None,
+                              plot_format='png'):
+        """
+        Internal: add the sprite sheets and report micro-plot sizes
+
+        Arguments:
+          report (Document): the report document
+          sprite_sheet (SpriteSheet): if not None then the
+            sprite sheet with the micro-plots, which is
+            added to the report styles
+          plot_format (str): format of the micro-plots
+
+        """
+        if sprite_sheet is not None:
+            for css_rule in sprite_sheet.css_rules(stats=self._image_stats):
+                report.add_css_rule(css_rule)
+            print "Packed %d micro-plots into %d sprite sheets" % \
+                (sprite_sheet.nsprites,sprite_sheet.nsheets)
+        print "Embedded %d micro-plots: %d bytes %s, " \
+            "%d bytes encoded" % (self._image_stats['nimages'],
+                                  self._image_stats['plot_bytes'],
+                                  plot_format.upper(),
+                                  self._image_stats['encoded_bytes'])
+
+    def _write_pages(self,report,report_file,written,assets,
+                     assets_dir=None,gzip_level=None,plain=True):
+        """
+        Internal: write the main report and tidy up old outputs
+
+        Files for pages and assets from previous reports
+        which are no longer used are removed (including
+        the assets directory if the images are no longer
+        written to one).
+
+        Arguments:
+          report (Document): the report document
+          report_file (str): name of the main report file
+          written (list): page files which have already
+            been written
+          assets (set): assets used by the pages already
+            written
+          assets_dir (str): if not None then the assets
+            directory for images in the report
+          gzip_level (int): if set then also write a
+            compressed copy of the report
+          plain (boolean): if False then only write the
+            compressed copy
+
+        """
+        outfiles = self._write_document(report,report_file,
+                                        gzip_level,plain)
+        self._report_written(outfiles)
+        written = written + outfiles
+        # Remove out of date outputs from previous reports
+        for filen in [report_file,"%s.gz" % report_file] + \
+            glob.glob(report_page(self.name,'*')) + \
+            glob.glob("%s.gz" % report_page(self.name,'*')):
+            if os.path.exists(filen) and filen not in written:
+                os.remove(filen)
+        if assets_dir:
+            assets = assets | report.assets
+            remove_unused_assets(assets_dir,assets)
+            print "Wrote images to %s" % assets_dir
+        else:
+            # Images are embedded, so remove the assets
+            # directory from a previous report
+            old_assets_dir = report_assets_dir(self.name)
+            if os.path.isdir(old_assets_dir):
+                remove_unused_assets(old_assets_dir,set())
+                try:
+                    os.rmdir(old_assets_dir)
+                    print "Removed out of date images in %s" % \
+                        old_assets_dir
+                except OSError:
+                    print "Warning: %s is no longer used by the report " \
+                        "but contains other files so wasn't removed" % \
+                        old_assets_dir
+
+    def _write_document(self,doc,filen,gzip_level=None,plain=True):
+        """
+        Internal: write a document for the report
+
+        Arguments:
+          doc (Document): the document to write
+          filen (str): path to write the document to
+          gzip_level (int): if set then also write a
+            compressed copy using this compression level
+          plain (boolean): if False then only write the
+            compressed copy
+
+        Returns:
+          List: paths to the files which were written.
+
+        """
+        return doc.write(filen,gzip_level=gzip_level,plain=plain)
+
+    def _report_written(self,outfiles):
+        """
+        Internal: print the names and sizes of written files
+
+        Arguments:
+          outfiles (list): paths to the files which were
+            written
+
+        """
+        for outfile in outfiles:
+            print "Wrote %s (%d bytes)" % (outfile,
+                                           os.path.getsize(outfile))
+
+    def _report_document(self,title,assets_dir=None):
+        """
+        Internal: create a new document with the report styles
+
+        Arguments:
+          title (str): title for the document
+          assets_dir (str): if not None then the assets
+            directory for images in the document
+
+        Returns:
+          Document: new Document instance.
+
         """
-        # Initialise report
-        report = Document(title="%s: QC report" % self.name)
+        report = Document(title=title,
+                          dedup_images=True,
+                          assets_dir=assets_dir)
         # Styles
         report.add_css_rule("h1 { background-color: #42AEC2;\n"
                             "     color: white;\n"
@@ -150,166 +947,247 @@ class QCReporter:
                             "table th { border-bottom: solid 1px lightgray; }\n"
                             ".no_print { display: none; }\n"
                             "}")
-        # Set up summary section & table
-        summary = report.add_section("Summary",name='summary')
-        summary.add("%d samples | %d fastqs" % (len(self._samples),
-                                                len(self._project.fastqs)))
-        summary_tbl = Table(('sample',),sample='Sample')
-        summary_tbl.add_css_classes('summary')
-        summary.add(summary_tbl)
-        if self.paired_end:
-            summary_tbl.append_columns('fastqs',fastqs='Fastqs (R1/R2)')
-        else:
-            summary_tbl.append_columns('fastq',fastq='Fastq')
-        summary_tbl.append_columns('reads','fastqc_r1','boxplot_r1','screens_r1',
-                                   reads='#reads',fastqc_r1='FastQC',boxplot_r1='Boxplot',
-                                   screens_r1='Screens')
-        if self.paired_end:
-            summary_tbl.append_columns('fastqc_r2','boxplot_r2','screens_r2',
-                                   fastqc_r2='FastQC',boxplot_r2='Boxplot',
-                                   screens_r2='Screens')
-        # Write entries for samples, fastqs etc
-        current_sample = None
-        for i,sample in enumerate(self._samples):
-            print "Sample #%3d: %s " % (i+1,sample.name)
-            sample_name = sample.name
-            sample_report = report.add_section("Sample: %s" % sample_name,
-                                               name="sample_%s" % sample_name)
-            sample_report.add_css_classes('sample')
-            if self.paired_end:
-                sample_report.add("%d fastq R1/R2 pairs" %
-                                  len(sample.fastq_pairs))
-            else:
-                sample_report.add("%d fastqs" % len(sample.fastq_pairs))
+        return report
+
+    def _quality_heatmap(self):
+        """
+        Internal: make a per-base quality heatmap for all Fastqs
+
+        The matrix of per-base quality statistics used to
+        generate the heatmap is stored in the cache
+        directory, so that only data for new or updated
+        Fastqs needs to be read in when the report is
+        regenerated.
+
+        Returns:
+          Img: Img instance with the embedded heatmap, or
+            None if there is no per-base quality data.
+
+        """
+        fastqc_data_files = []
+        labels = []
+        for sample in self._samples:
             for fq_pair in sample.fastq_pairs:
-                # Sample name for first pair only
-                if sample_name is not None:
-                    idx = summary_tbl.add_row(sample=Link(sample_name,
-                                                          sample_report))
-                else:
-                    idx = summary_tbl.add_row(sample="&nbsp;")
-                # Container for fastqs
-                fqs_report = sample_report.add_subsection()
-                fqs_report.add_css_classes('fastqs')
-                # Fastq name(s)
-                fq_r1 = os.path.basename(fq_pair.r1)
-                fq_r2 = os.path.basename(fq_pair.r2)
-                if self.paired_end:
-                    # Create subsections for R1 and R2
-                    fqr1_report = fqs_report.add_subsection(fq_r1)
-                    fqr2_report = fqs_report.add_subsection(fq_r2)
-                    # Add classes
-                    fqr1_report.add_css_classes('fastq_r1')
-                    fqr2_report.add_css_classes('fastq_r2')
-                    # Add entries to summary table
-                    summary_tbl.set_value(idx,'fastqs',
-                                          "%s<br />%s" %
-                                          (Link(fq_r1,fqr1_report),
-                                           Link(fq_r2,fqr2_report)))
-                else:
-                    # Create subsection for R1 only
-                    fqr1_report = fqs_report.add_subsection(fq_r1)
-                    # Add classes
-                    fqr1_report.add_css_classes('fastq_r1')
-                    # Add entry to summary table
-                    summary_tbl.set_value(idx,'fastq',Link(fq_r1,
-                                                           fqr1_report))
-                self._report_fastq(fq_r1,'r1',summary_tbl,idx,
-                                   fqr1_report)
-                if self.paired_end:
-                    self._report_fastq(fq_r2,'r2',summary_tbl,idx,
-                                       fqr2_report)
-                # Reset sample name for remaining pairs
-                sample_name = None
-                # Add an empty section to clear HTML floats
-                clear = fqs_report.add_subsection()
-                clear.add_css_classes("clear")
-        # Write the report
-        report.write("%s.qcreport.html" % self.name)
+                for fq in fq_pair:
+                    if fq is None:
+                        continue
+                    labels.append(sample.name)
+                    fastqc_data_files.append(
+                        os.path.join(self._qc_dir,
+                                     fastqc_output(fq)[0],
+                                     'fastqc_data.txt'))
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+        matrix = quality_matrix(fastqc_data_files,
+                                os.path.join(self._cache_dir,
+                                             'quality_matrix.npy'))
+        if not matrix.size:
+            return None
+        img = quality_heatmap_plot(matrix,labels=labels)
+        return Img(encode_png_data(png_bytes(img)),
+                   name='quality_heatmap',
+                   alt="Per-base quality heatmap")
+
+    def _make_thumbnails(self,scheduler=None):
+        """
+        Generate thumbnails of the FastQC and screen plots
+
+        The thumbnails are the size that the plots are
+        displayed at in the report, and are stored in the
+        cache directory so they are only regenerated if
+        the originals change.
+
+        Arguments:
+          scheduler (SizeScheduler): if not None then the
+            scheduler to generate the thumbnails with
+
+        Returns:
+          Dictionary: mapping of paths for the original
+            PNGs to their thumbnails.
 
-    def _report_fastq(self,fq,read_id,summary,idx,report):
         """
-        Generate report section for a Fastq file
+        thumbnail_dir = os.path.join(self._cache_dir,'thumbnails')
+        boxplots = []
+        screens = []
+        for sample in self._samples:
+            for fq_pair in sample.fastq_pairs:
+                for fq in fq_pair:
+                    if fq is None:
+                        continue
+                    boxplot,screen_pngs = fastq_qc_plots(fq,self._qc_dir)
+                    boxplots.append(boxplot)
+                    screens.extend(screen_pngs)
+        thumbnails = make_thumbnails(boxplots,thumbnail_dir,(480,250),
+                                     scheduler=scheduler)
+        thumbnails.update(make_thumbnails(screens,thumbnail_dir,(None,250),
+                                          scheduler=scheduler))
+        return thumbnails
+
+    def _report_fastq_task(self,fastq,read_id,thumbnails,plot_format,
+                           sprites):
+        """
+        Internal: set up arguments for generating a Fastq report
 
         Arguments:
-          fq (str): Fastq file that is being reported
+          fastq (str): path to Fastq file
           read_id (str): either 'r1' or 'r2'
+          thumbnails (dict): mapping of PNGs to
+            thumbnails
+          plot_format (str): format for micro-plots
+          sprites (SpriteSheet): sprite sheet for
+            micro-plots (or None)
+
+        Returns:
+          Tuple: arguments for 'report_fastq'.
+
+        """
+        boxplot_png,screen_pngs = fastq_qc_plots(fastq,self._qc_dir)
+        fastq_thumbnails = dict([(png,thumbnails[png])
+                                 for png in [boxplot_png]+screen_pngs
+                                 if png in thumbnails])
+        # Read count and size from the statistics file
+        if self._stats is not None:
+            nreads = self._stats.nreads(fastq)
+            size = self._stats.size(fastq)
+        else:
+            nreads = None
+            size = None
+        if nreads is None:
+            nreads = self._read_counts.get(fastq)
+        # Fastq sections are at level 4 (i.e. within the
+        # Fastqs container within the sample section)
+        return (os.path.basename(fastq),read_id,self._qc_dir,
+                4,fastq_thumbnails,plot_format,(sprites is not None),
+                nreads,size)
+
+    def _fastq_reports(self,tasks,cache=None,scheduler=None,
+                       prefetcher=None):
+        """
+        Internal: generate the report content for each Fastq
+
+        Content is taken from the cache where the QC
+        outputs for the Fastq are unchanged; the remaining
+        content is generated (in parallel if a scheduler
+        is supplied) and stored in the cache. The QC
+        outputs are read in the background ahead of
+        generating the content (see 'Prefetcher').
+
+        When the content is generated in parallel, the
+        Fastqs with the largest QC outputs are handled
+        first.
+
+        Arguments:
+          tasks (list): list of argument tuples for
+            'report_fastq'
+          cache (ReportCache): if not None then the cache
+            for Fastq report content
+          scheduler (SizeScheduler): if not None then the
+            scheduler to generate the content with
+          prefetcher (Prefetcher): if not None then the
+            Prefetcher to read the QC outputs with when
+            the content is generated in this process (it
+            is left open)
+
+        Yields:
+          Tuple: (section,values,stats) tuple for each
+            task, in the same order as the tasks.
+
+        """
+        # Look up content in the cache
+        keys = []
+        inputs = []
+        cached = []
+        # Code used to generate the content (i.e. all the
+        # modules contributing to the cached sections)
+        code = source_checksum(report_fastq,Section,uboxplot_image,
+                               Fastqc,Fastqscreen,fastq_metrics,
+                               FastqQualityStats,quality_matrix,
+                               SpriteSheet,make_thumbnails,open_file)
+        for task in tasks:
+            fq,read_id,qc_dir,level,thumbnails = task[:5]
+            keys.append(cache_key(fq,read_id,qc_dir,level,
+                                  sorted(thumbnails.items()),
+                                  task[5:],
+                                  get_version(),
+                                  code))
+            inputs.append(fastq_qc_inputs(fq,qc_dir))
+            if cache is not None:
+                cached.append(cache.get(keys[-1],inputs[-1]))
+            else:
+                cached.append(None)
+        # Generate the missing content
+        missing = [task for task,content in zip(tasks,cached)
+                   if content is None]
+        new_prefetcher = None
+        if scheduler is not None and missing:
+            sizes = [sum([_file_size(path) for path in fastq_inputs])
+                     for fastq_inputs,content in zip(inputs,cached)
+                     if content is None]
+            fastq_reports = scheduler.imap(_prefetch_report_fastq,missing,
+                                           sizes)
+        else:
+            # Read the QC outputs for upcoming Fastqs in the
+            # background while the content is generated
+            if prefetcher is None:
+                prefetcher = new_prefetcher = Prefetcher()
+            fastq_reports = prefetcher.imap(
+                _report_fastq,missing,
+                [fastq_report_files(task[0],task[2],task[4])
+                 for task in missing])
+        try:
+            for key,fastq_inputs,content in zip(keys,inputs,cached):
+                if content is None:
+                    content = fastq_reports.next()
+                    if cache is not None:
+                        cache.put(key,fastq_inputs,content)
+                yield content
+        finally:
+            if new_prefetcher is not None:
+                new_prefetcher.close()
+
+    def _add_fastq_report(self,fastq_report,fqs_report,summary,idx,
+                          sprites=None,page=None):
+        """
+        Internal: add report content for a Fastq file
+
+        Arguments:
+          fastq_report (tuple): the (section,values,stats)
+            tuple returned by 'report_fastq'
+          fqs_report (Section): container to add the
+            report section to
           summary (Table): summary table object
           idx (integer): row index for summary table
-          report (Section): container for the report
-
-        """
-        # Locate FastQC outputs for R1
-        fastqc = Fastqc(os.path.join(self._qc_dir,fastqc_output(fq)[0]))
-        # Number of reads for summary
-        if read_id == 'r1':
-            nreads = fastqc.data.basic_statistics('Total Sequences')
-            summary.set_value(idx,'reads',nreads)
-        # FastQC quality boxplot
-        fastqc_report = report.add_subsection("FastQC")
-        fastqc_report.add("Per base sequence quality boxplot:")
-        boxplot = Img(fastqc.quality_boxplot(inline=True),
-                      height=250,
-                      width=480,
-                      href=fastqc.summary.link_to_module(
-                          'Per base sequence quality'),
-                      name="boxplot_%s" % fq)
-        fastqc_report.add(boxplot)
-        summary.set_value(idx,'boxplot_%s' % read_id,
-                          Img(uboxplot(fastqc.data.path,inline=True),
-                              href=boxplot))
-        # FastQC summary plot
-        fastqc_report.add("FastQC summary:")
-        fastqc_tbl = Target("fastqc_%s" % fq)
-        fastqc_report.add(fastqc_tbl,fastqc.summary.html_table())
-        summary.set_value(idx,'fastqc_%s' % read_id,
-                          Img(ufastqcplot(fastqc.summary.path,inline=True),
-                              href=fastqc_tbl))
-        fastqc_report.add("%s for %s" % (Link("Full FastQC report",
-                                              fastqc.html_report),
-                                         fq))
-        # Fastq_screens
-        screens_report = report.add_subsection("Screens")
-        fastq_screens = Target("fastq_screens_%s" % fq)
-        screens_report.add(fastq_screens)
-        screen_files = []
-        fastq_screen_txt = []
-        for name in FASTQ_SCREENS:
-            description = name.replace('_',' ').title()
-            png,txt = fastq_screen_output(fq,name)
-            png = os.path.join(self._qc_dir,png)
-            screen_files.append(os.path.join(self._qc_dir,txt))
-            screens_report.add(description)
-            screens_report.add(Img(encode_png(png),
-                                   height=250,
-                                   href=png))
-            fastq_screen_txt.append(
-                Link(description,os.path.join(self._qc_dir,txt)).html())
-        screens_report.add("Raw screen data: " +
-                           " | ".join(fastq_screen_txt))
-        summary.set_value(idx,'screens_%s' % read_id,
-                          Img(uscreenplot(screen_files,inline=True),
-                              href=fastq_screens))
-        # Program versions
-        versions = report.add_subsection("Program versions")
-        versions.add(self._program_versions(fq))
-
-    def _program_versions(self,fastq):
-        """
-        """
-        # Program versions table
-        tbl = Table(("Program","Version"))
-        tbl.add_css_classes("programs","summary")
-        tbl.add_row(Program='fastqc',
-                    Version=Fastqc(
-                        os.path.join(self._qc_dir,
-                                     fastqc_output(fastq)[0])).version)
-        tbl.add_row(Program='fastq_screen',
-                    Version=Fastqscreen(
-                        os.path.join(self._qc_dir,
-                                     fastq_screen_output(fastq,
-                                        FASTQ_SCREENS[0])[1])).version)
-        return tbl
+          sprites (SpriteSheet): if not None then
+            micro-plots are added to this sprite sheet
+          page (str): if not None then the file that
+            the report will be written to (in which case
+            links from the summary table are resolved
+            immediately)
+
+        Returns:
+          Section: the section for the Fastq report.
+
+        """
+        section,values,stats = fastq_report
+        fqs_report.add_subsection(section=section)
+        self._metrics.append(values['metrics'])
+        if page:
+            set_page([section],page)
+        for key in sorted(values):
+            if key not in summary.columns:
+                # Not displayed in this summary
+                continue
+            value = values[key]
+            if isinstance(value,tuple):
+                # Image and link target for sprite sheet
+                img,href = value
+                value = sprites.add(img,href=href)
+            if page:
+                resolve_links([value])
+            summary.set_value(idx,key,value)
+        for key in stats:
+            self._image_stats[key] += stats[key]
+        return section
 
 class QCSample:
     """
@@ -335,16 +1213,23 @@ class QCSample:
     def fastq_pairs(self):
         return self._fastq_pairs
 
-    def verify(self,qc_dir):
+    def verify(self,qc_dir,index=None):
         """
         Check QC products for this sample
 
         Checks that fastq_screens and FastQC files were found.
         Returns True if the QC products are present, False
         otherwise.
+
+        Arguments:
+          qc_dir (str): path to the location of the QC
+            output directory
+          index (set): optional set of names in the QC
+            directory (see 'qc_dir_index')
+
         """
         for fq_pair in self.fastq_pairs:
-            if not fq_pair.verify(qc_dir):
+            if not fq_pair.verify(qc_dir,index=index):
                 return False
         return True
 
@@ -370,6 +1255,12 @@ class FastqSet:
     def __getitem__(self,key):
         return self._fastqs[key]
 
+    def __eq__(self,other):
+        return list(self) == list(other)
+
+    def __ne__(self,other):
+        return not self.__eq__(other)
+
     @property
     def r1(self):
         """
@@ -386,7 +1277,7 @@ class FastqSet:
         """
         return self._fastqs[1]
 
-    def verify(self,qc_dir):
+    def verify(self,qc_dir,index=None):
         """
         Check QC products for this Fastq pair
 
@@ -397,12 +1288,14 @@ class FastqSet:
         Arguments:
           qc_dir (str): path to the location of the QC
             output directory
+          index (set): optional set of names in the QC
+            directory (see 'qc_dir_index')
 
         """
         for fq in self._fastqs:
             if fq is None:
                 continue
-            present,missing = check_qc_outputs(fq,qc_dir)
+            present,missing = check_qc_outputs(fq,qc_dir,index=index)
             if missing:
                 return False
         return True
@@ -411,6 +1304,20 @@ class FastqStats(TabFile):
     """
     Class for looking up statistics on Fastq files
 
+    The statistics are read from a 'statistics.info'
+    file, which has a header line followed by one line
+    for each Fastq, e.g.:
+
+    #Project	Sample	Fastq	Size	Nreads	Paired_end	Read_number
+    PJB	PJB1	PJB1_S1_L001_R1_001.fastq.gz	1.2G	100	Y	1
+
+    and are indexed by Fastq name so they can be looked
+    up directly:
+
+    >>> stats = FastqStats('statistics.info')
+    >>> stats.nreads('/data/PJB/PJB1_S1_L001_R1_001.fastq.gz')
+    100
+
     """
     def __init__(self,stats_file):
         """
@@ -421,7 +1328,70 @@ class FastqStats(TabFile):
 
         """
         self._stats_file = stats_file
-        TabFile.__init__(self,self._stats_file)
+        TabFile.__init__(self,self._stats_file,first_line_is_header=True)
+        self._index = {}
+        for line in self:
+            fastq = str(line['Fastq'])
+            self._index[fastq] = line
+            self._index.setdefault(strip_ngs_extensions(fastq),line)
+
+    def lookup_fastq(self,fastq):
+        """
+        Return the statistics for a Fastq
+
+        Fastqs are matched by name (without any leading
+        path); if there is no exact match then the name
+        without the file extensions is tried.
+
+        Arguments:
+           fastq (str): path to the Fastq file
+
+        Returns:
+           TabDataLine: the line with the statistics for
+             the Fastq, or None if it isn't found.
+
+        """
+        fastq = os.path.basename(fastq)
+        try:
+            return self._index[fastq]
+        except KeyError:
+            return self._index.get(strip_ngs_extensions(fastq))
+
+    def nreads(self,fastq):
+        """
+        Return the number of reads in a Fastq
+
+        Arguments:
+           fastq (str): path to the Fastq file
+
+        Returns:
+           Integer: number of reads, or None if the Fastq
+             isn't found.
+
+        """
+        line = self.lookup_fastq(fastq)
+        try:
+            return int(line['Nreads'])
+        except (TypeError,KeyError,ValueError):
+            return None
+
+    def size(self,fastq):
+        """
+        Return the size of a Fastq
+
+        Arguments:
+           fastq (str): path to the Fastq file
+
+        Returns:
+           String: size of the Fastq (e.g. '1.2G'), or None
+             if the Fastq isn't found.
+
+        """
+        line = self.lookup_fastq(fastq)
+        try:
+            return str(line['Size'])
+        except (TypeError,KeyError):
+            return None
 
 #######################################################################
 # Functions
@@ -431,6 +1401,10 @@ def get_fastq_pairs(sample):
     """
     Return pairs of Fastqs for an AnalysisSample instance
 
+    The R2 Fastqs are indexed by their name components
+    (see 'fastq_pair_key'), so that the mate for each R1
+    Fastq can be looked up directly.
+
     Arguments:
        sample (AnalysisSample): sample to get Fastq pairs for
 
@@ -440,30 +1414,592 @@ def get_fastq_pairs(sample):
     """
     pairs = []
     fastqs_r1 = sample.fastq_subset(read_number=1)
-    fastqs_r2 = sample.fastq_subset(read_number=2)
+    fastqs_r2 = dict([(fastq_pair_key(fqr2),fqr2)
+                      for fqr2 in sample.fastq_subset(read_number=2)])
     for fqr1 in fastqs_r1:
-        # Split up R1 name
-        print "fqr1 %s" % os.path.basename(fqr1)
-        fastq_base = os.path.basename(fqr1)
-        dir_path = os.path.dirname(fqr1)
-        try:
-            i = fastq_base.index('.')
-            ext = fastq_base[i:]
-        except ValueError:
-            ext = ''
-        # Generate equivalent R2 file
-        fqr2 = AnalysisFastq(fqr1)
-        fqr2.read_number = 2
-        fqr2 = os.path.join(dir_path,"%s" % fqr2)
-        if ext:
-            fqr2 += ext
-        print "fqr2 %s" % os.path.basename(fqr2)
-        if fqr2 in fastqs_r2:
-            pairs.append(FastqSet(fqr1,fqr2))
-        else:
-            pairs.append(FastqSet(fqr1))
+        fqr2 = fastqs_r2.get(fastq_pair_key(fqr1))
+        logger.debug("%s: R2 %s",os.path.basename(fqr1),
+                     (os.path.basename(fqr2) if fqr2 else "not found"))
+        pairs.append(FastqSet(fqr1,fqr2))
     return pairs
 
+def fastq_pair_key(fastq):
+    """
+    Return a key identifying the pair that a Fastq belongs to
+
+    The key is made from the directory, the components
+    parsed from the Fastq name (with the read number set
+    to 2) and the file extension, so the R1 and R2
+    Fastqs from the same pair have the same key.
+
+    Arguments:
+       fastq (str): path to the Fastq file
+
+    Returns:
+       Tuple: the key for the Fastq.
+
+    """
+    fastq_base = os.path.basename(fastq)
+    try:
+        ext = fastq_base[fastq_base.index('.'):]
+    except ValueError:
+        ext = ''
+    analysis_fastq = AnalysisFastq(fastq)
+    analysis_fastq.read_number = 2
+    return (os.path.dirname(fastq),str(analysis_fastq),ext)
+
+class ThreadOutput:
+    """
+    Collect the output from threads and write it in blocks
+
+    Replaces a file-like object (e.g. sys.stdout) so
+    that output from threads which have called 'capture'
+    is held back until they call 'release', and is then
+    written in one go (so the output from threads running
+    at the same time isn't interleaved). Output from
+    other threads is written straight away.
+
+    """
+    def __init__(self,fp):
+        """
+        Create a new ThreadOutput instance
+
+        Arguments:
+          fp (file): file-like object to write to
+
+        """
+        self._fp = fp
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def capture(self):
+        """
+        Start holding back output from the current thread
+
+        """
+        self._buffers[threading.current_thread().ident] = StringIO()
+
+    def release(self):
+        """
+        Write the output held back for the current thread
+
+        """
+        buf = self._buffers.pop(threading.current_thread().ident)
+        self.write(buf.getvalue())
+        self.flush()
+
+    def write(self,s):
+        buf = self._buffers.get(threading.current_thread().ident)
+        if buf is not None:
+            buf.write(s)
+        else:
+            with self._lock:
+                self._fp.write(s)
+
+    def flush(self):
+        with self._lock:
+            self._fp.flush()
+
+def report_projects(projects,nprocs=1,nprojects=2,memory_budget=None,
+                    **kws):
+    """
+    Report the QC for multiple projects sharing a worker pool
+
+    A single pool of 'nprocs' worker processes is used to
+    generate the thumbnails, read counts and Fastq report
+    content for all the projects. Up to 'nprojects'
+    projects are reported at the same time (each from a
+    separate thread), so that the work for the next project
+    is already queued on the pool while the report for the
+    current one is being assembled; each project's report
+    is written as soon as the content for its last Fastq
+    has been generated. The output for each project is
+    written as a single block once its report is
+    complete.
+
+    The section, thumbnail and read count caches are
+    not shared between the projects: each project keeps
+    its own caches in its QC directory (as when it is
+    reported on its own), so they are reused whether or
+    not the project is reported in a batch, and removing
+    stale entries from one project's caches can't affect
+    another's.
+
+    Arguments:
+      projects (list): list of AnalysisProject instances
+      nprocs (int): number of worker processes
+      nprojects (int): maximum number of projects to
+        report at the same time
+      memory_budget (int): if set then limit the total
+        size of the files (in bytes) being processed by
+        the worker processes at any one time (across all
+        the projects)
+      kws (mapping): additional keyword arguments are
+        passed to 'QCReporter.report' for each project
+
+    Returns:
+      List: names of the projects, in the order that
+        their reports were completed.
+
+    """
+    completed = []
+    threads = ThreadPool(max(1,min(nprojects,len(projects))))
+    stdout = sys.stdout
+    output = ThreadOutput(stdout)
+    def report(project):
+        output.capture()
+        try:
+            print "Reporting %s" % project.name
+            QCReporter(project).report(nprocs=nprocs,scheduler=scheduler,
+                                       **kws)
+        finally:
+            output.release()
+        completed.append(project.name)
+    with worker_pool(nprocs,max_size=memory_budget) as scheduler:
+        sys.stdout = output
+        try:
+            threads.map(report,projects,chunksize=1)
+        finally:
+            sys.stdout = stdout
+            threads.close()
+            threads.join()
+    report_utilisation(scheduler)
+    return completed
+
+@contextmanager
+def _report_scheduler(nprocs=1,memory_budget=None,scheduler=None):
+    """
+    Internal: supply the scheduler for reporting a project
+
+    Yields the supplied scheduler if there is one (or
+    None if only one process is being used); otherwise
+    a new pool of worker processes is started for the
+    duration of the 'with' block (see 'worker_pool'), and
+    the utilisation of the workers is reported at the end.
+
+    Arguments:
+      nprocs (int): number of worker processes
+      memory_budget (int): if set then limit the total
+        size of the files being processed by the worker
+        processes at any one time
+      scheduler (SizeScheduler): existing scheduler to
+        use, if any
+
+    """
+    if scheduler is not None or nprocs <= 1:
+        yield scheduler
+        return
+    with worker_pool(nprocs,max_size=memory_budget) as scheduler:
+        yield scheduler
+    report_utilisation(scheduler)
+
+def report_utilisation(scheduler):
+    """
+    Print the utilisation of the worker processes
+
+    Arguments:
+      scheduler (SizeScheduler): scheduler used to run
+        tasks on the worker processes
+
+    """
+    if scheduler.utilisation is None:
+        return
+    print "Ran %d tasks on %d processes: %.1f%% utilisation " \
+        "(at most %d bytes of input in progress)" % \
+        (scheduler.ntasks,scheduler.nprocs,100.0*scheduler.utilisation,
+         scheduler.max_size_running)
+
+@timed(args=('fq','read_id'))
+def report_fastq(fq,read_id,qc_dir,level=4,thumbnails=None,
+                 plot_format='png',sprites=False,nreads=None,size=None):
+    """
+    Generate report content for a Fastq file
+
+    The report content is returned rather than being
+    added to a document, so that reports for multiple
+    Fastqs can be generated independently (e.g. in
+    parallel processes).
+
+    Arguments:
+      fq (str): name of the Fastq file being reported
+      read_id (str): either 'r1' or 'r2'
+      qc_dir (str): path to the QC directory
+      level (int): heading level for the section
+      thumbnails (dict): mapping of PNGs to thumbnails
+        to embed in their place
+      plot_format (str): format for micro-plots
+        ('png' or 'svg')
+      sprites (boolean): if True then micro-plots are
+        returned as (Image,href) tuples (for packing into
+        a sprite sheet) rather than being embedded
+      nreads (int): number of reads in the Fastq (if
+        None then the count is taken from the FastQC
+        outputs)
+      size (str): if set then the size of the Fastq
+        (e.g. '1.2G'), which is included in the report
+
+    Returns:
+      Tuple: (section,values,stats) where 'section' is a
+        Section with the report for the Fastq, 'values'
+        is a dictionary with values for the summary table
+        (keyed by column id, plus 'metrics' with the QC
+        metrics for the Fastq, which only include the read
+        count if the QC data files are missing), and 'stats'
+        is a dictionary with statistics on the embedded
+        micro-plots.
+
+    """
+    report = Section(title=fq,level=level)
+    report.add_css_classes('fastq_%s' % read_id)
+    values = {}
+    stats = dict(nimages=0,
+                 plot_bytes=0,
+                 encoded_bytes=0)
+    # Read the QC data files
+    fastqc_names,screen_names = qc_output_names(fq)
+    screen_files = [os.path.join(qc_dir,txt) for png,txt in screen_names]
+    try:
+        fastqc = Fastqc(os.path.join(qc_dir,fastqc_names[0]))
+        screens = [Fastqscreen(f) for f in screen_files]
+    except IOError:
+        # Only check which files are missing if reading failed
+        missing = [f for f in fastq_qc_inputs(fq,qc_dir)
+                   if f.endswith('.txt') and not os.path.exists(f)]
+        if not missing:
+            raise
+        report.add("QC outputs not found: %s" %
+                   ", ".join([os.path.basename(f) for f in missing]))
+        if read_id == 'r1' and nreads is not None:
+            values['reads'] = nreads
+        values['metrics'] = fastq_metrics(fq,None,[],nreads=nreads)
+        return (report,values,stats)
+    # Number of reads for summary
+    if nreads is None:
+        nreads = int(fastqc.data.basic_statistics('Total Sequences'))
+    if read_id == 'r1':
+        values['reads'] = nreads
+    if size is not None:
+        report.add("%d reads (%s)" % (nreads,size))
+    # Overall FastQC status
+    values['status_%s' % read_id] = fastqc_status(fastqc.summary)
+    # FastQC quality boxplot
+    fastqc_report = report.add_subsection("FastQC")
+    fastqc_report.add("Per base sequence quality boxplot:")
+    boxplot_png = fastqc.quality_boxplot()
+    boxplot = Img(_embed_png(boxplot_png,thumbnails),
+                  height=250,
+                  width=480,
+                  href=boxplot_png,
+                  name="boxplot_%s" % fq)
+    fastqc_report.add(boxplot)
+    values['boxplot_%s' % read_id] = _micro_plot(
+        uboxplot_image(fastqc.data),
+        href=boxplot,
+        plot_format=plot_format,
+        sprites=sprites,
+        stats=stats)
+    # FastQC summary plot
+    fastqc_report.add("FastQC summary:")
+    fastqc_tbl = Target("fastqc_%s" % fq)
+    fastqc_report.add(fastqc_tbl,fastqc.summary.html_table())
+    values['fastqc_%s' % read_id] = _micro_plot(
+        ufastqcplot_image(fastqc.summary),
+        href=fastqc_tbl,
+        plot_format=plot_format,
+        sprites=sprites,
+        stats=stats)
+    fastqc_report.add("%s for %s" % (Link("Full FastQC report",
+                                          fastqc.html_report),
+                                     fq))
+    # Fastq_screens
+    screens_report = report.add_subsection("Screens")
+    fastq_screens = Target("fastq_screens_%s" % fq)
+    screens_report.add(fastq_screens)
+    fastq_screen_txt = []
+    for name,(png,txt) in zip(FASTQ_SCREENS,screen_names):
+        description = name.replace('_',' ').title()
+        png = os.path.join(qc_dir,png)
+        screens_report.add(description)
+        screens_report.add(Img(_embed_png(png,thumbnails),
+                               height=250,
+                               href=png))
+        fastq_screen_txt.append(
+            Link(description,os.path.join(qc_dir,txt)).html())
+    screens_report.add("Raw screen data: " +
+                       " | ".join(fastq_screen_txt))
+    values['screens_%s' % read_id] = _micro_plot(
+        uscreenplot_image(screens),
+        href=fastq_screens,
+        plot_format=plot_format,
+        sprites=sprites,
+        stats=stats)
+    # QC metrics
+    values['metrics'] = fastq_metrics(fq,fastqc,zip(FASTQ_SCREENS,screens),
+                                      nreads=nreads)
+    # Program versions
+    versions = report.add_subsection("Program versions")
+    versions.add(program_versions(fastqc.version,screens[0].version))
+    return (report,values,stats)
+
+def report_page(name,n):
+    """
+    Return the file name for a page of sample reports
+
+    Arguments:
+      name (str): project name
+      n (int): page number
+
+    Returns:
+      String: file name for the page.
+
+    """
+    return "%s.qcreport.p%s.html" % (name,n)
+
+def report_assets_dir(name):
+    """
+    Return the name of the assets directory for a report
+
+    Arguments:
+      name (str): project name
+
+    Returns:
+      String: name of the directory for report images.
+
+    """
+    return "%s.qcreport_assets" % name
+
+def report_navigation(report_file,n,npages,prev_page,next_page):
+    """
+    Return links for navigating between pages of a report
+
+    Arguments:
+      report_file (str): file name of the main report
+      n (int): page number of the current page
+      npages (int): total number of pages
+      prev_page (str): file name of the previous page
+      next_page (str): file name of the next page
+
+    Returns:
+      String: HTML with the links.
+
+    """
+    links = [Link("Summary","%s#summary" % report_file).html()]
+    if n > 1:
+        links.append(Link("Previous page",prev_page).html())
+    if n < npages:
+        links.append(Link("Next page",next_page).html())
+    return " | ".join(links)
+
+def fastqc_status(summary):
+    """
+    Return the overall status from a FastQC summary
+
+    Arguments:
+      summary (FastqcSummary): summary from FastQC
+
+    Returns:
+      String: HTML for the overall status, i.e. 'FAIL'
+        if any of the modules failed, 'WARN' if there were
+        warnings but no failures, otherwise 'PASS'.
+
+    """
+    status = summary.overall_status
+    return "<span class='%s'>%s</span>" % (status,status)
+
+def program_versions(fastqc_version,fastq_screen_version):
+    """
+    Return table of program versions
+
+    Arguments:
+      fastqc_version (str): FastQC version
+      fastq_screen_version (str): fastq_screen version
+
+    Returns:
+      Table: Table instance listing the versions.
+
+    """
+    tbl = Table(("Program","Version"))
+    tbl.add_css_classes("programs","summary")
+    tbl.add_row(Program='fastqc',
+                Version=fastqc_version)
+    tbl.add_row(Program='fastq_screen',
+                Version=fastq_screen_version)
+    return tbl
+
+def fastq_qc_plots(fastq,qc_dir):
+    """
+    Return paths to the QC plots for a Fastq file
+
+    Arguments:
+      fastq (str): name of Fastq file
+      qc_dir (str): path to QC directory
+
+    Returns:
+      Tuple: tuple of the form (boxplot,screens) where
+        'boxplot' is the path to the FastQC per-base
+        quality boxplot and 'screens' is a list of paths
+        to the fastq_screen plots.
+
+    """
+    fastqc_names,screen_names = qc_output_names(fastq)
+    boxplot = os.path.join(qc_dir,
+                           fastqc_names[0],
+                           'Images',
+                           'per_base_quality.png')
+    screens = [os.path.join(qc_dir,png) for png,txt in screen_names]
+    return (boxplot,screens)
+
+def fastq_qc_inputs(fastq,qc_dir):
+    """
+    Return paths to the QC outputs used to report a Fastq
+
+    Arguments:
+      fastq (str): name of Fastq file
+      qc_dir (str): path to QC directory
+
+    Returns:
+      List: list of paths to the FastQC and fastq_screen
+        outputs used to generate the report.
+
+    """
+    fastqc_names,screen_names = qc_output_names(fastq)
+    fastqc_dir = os.path.join(qc_dir,fastqc_names[0])
+    inputs = [os.path.join(fastqc_dir,'summary.txt'),
+              os.path.join(fastqc_dir,'fastqc_data.txt'),
+              os.path.join(fastqc_dir,'Images','per_base_quality.png')]
+    for names in screen_names:
+        inputs.extend([os.path.join(qc_dir,f) for f in names])
+    return inputs
+
+def fastq_report_files(fastq,qc_dir,thumbnails=None):
+    """
+    Return paths to the files read when reporting a Fastq
+
+    These are the QC outputs used to report the Fastq,
+    except that thumbnails are substituted for the plots
+    where available.
+
+    Arguments:
+      fastq (str): name of Fastq file
+      qc_dir (str): path to QC directory
+      thumbnails (dict): mapping of PNGs to thumbnails
+
+    Returns:
+      List: list of paths to the files.
+
+    """
+    if not thumbnails:
+        thumbnails = {}
+    return [thumbnails.get(path,path)
+            for path in fastq_qc_inputs(fastq,qc_dir)]
+
+def _report_fastq(args):
+    """
+    Internal: wrapper for 'report_fastq' for use with 'imap'
+
+    """
+    return report_fastq(*args)
+
+def _prefetch_report_fastq(args):
+    """
+    Internal: wrapper for 'report_fastq' reading files concurrently
+
+    The files for the Fastq are all read at once (in
+    separate threads) before the content is generated.
+    The reader threads are shared by all the tasks run
+    in the same worker process (see '_worker_prefetcher').
+
+    """
+    fq,read_id,qc_dir,level,thumbnails = args[:5]
+    return list(_worker_prefetcher().imap(
+        _report_fastq,[args],
+        [fastq_report_files(fq,qc_dir,thumbnails)]))[0]
+
+def _worker_prefetcher():
+    """
+    Internal: return the Prefetcher for the current process
+
+    The Prefetcher is created the first time it is
+    needed in each process (so a process forked after it
+    was created, e.g. a pool worker, gets its own rather
+    than one without any reader threads), and is kept
+    for the lifetime of the process.
+
+    """
+    global _prefetcher
+    pid = os.getpid()
+    if _prefetcher is None or _prefetcher[0] != pid:
+        _prefetcher = (pid,Prefetcher())
+    return _prefetcher[1]
+
+def _file_size(path):
+    """
+    Internal: return the size of a file (zero if it doesn't exist)
+
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _embed_png(png,thumbnails=None):
+    """
+    Internal: return Base64 encoded PNG for embedding
+
+    Arguments:
+      png (str): path to the PNG
+      thumbnails (dict): if not None then a mapping
+        of PNGs to thumbnails; if 'png' has a
+        thumbnail then this is encoded instead
+
+    Returns:
+      String: Base64 encoded PNG (or None if 'png'
+        is None).
+
+    """
+    if png is None:
+        return None
+    if thumbnails and png in thumbnails:
+        png = thumbnails[png]
+    with open_file(png) as fp:
+        return encode_png_data(fp.read())
+
+def _micro_plot(img,href=None,plot_format='png',sprites=False,
+                stats=None):
+    """
+    Internal: return element for displaying a 'micro-plot'
+
+    Arguments:
+      img (Image): PIL Image with the micro-plot
+      href (str): link target for the plot
+      plot_format (str): if 'svg' then the plot is
+        embedded as inline SVG, otherwise as a Base64
+        encoded PNG
+      sprites (boolean): if True then return the image
+        and link target (for adding to a sprite sheet)
+      stats (dict): if not None then statistics on the
+        embedded plot are added to this dictionary
+
+    Returns:
+      Object: Img or Link instance, or (Image,href) tuple.
+
+    """
+    if plot_format == 'svg':
+        plot_data = svg_from_image(img,standalone=False)
+        encoded_plot = plot_data
+        element = Link(encoded_plot,href)
+    elif sprites:
+        return (img,href)
+    else:
+        plot_data = png_bytes(img)
+        encoded_plot = encode_png_data(plot_data)
+        element = Img(encoded_plot,href=href)
+    if stats is not None:
+        stats['nimages'] += 1
+        stats['plot_bytes'] += len(plot_data)
+        stats['encoded_bytes'] += len(encoded_plot)
+    return element
+
 def fastq_screen_output(fastq,screen_name):
     """
     Generate name of fastq_screen output files
@@ -482,9 +2018,20 @@ def fastq_screen_output(fastq,screen_name):
        tuple: fastq_screen output names (without leading path)
 
     """
-    base_name = "%s_%s_screen" % (strip_ngs_extensions(os.path.basename(fastq)),
-                                  str(screen_name))
-    
+    return _fastq_screen_names(strip_ngs_extensions(os.path.basename(fastq)),
+                               screen_name)
+
+def _fastq_screen_names(fastq_base,screen_name):
+    """
+    Internal: fastq_screen output names for a Fastq base name
+
+    Arguments:
+       fastq_base (str): name of Fastq file with the
+         path and extensions removed
+       screen_name (str): name of screen
+
+    """
+    base_name = "%s_%s_screen" % (fastq_base,str(screen_name))
     return (base_name+'.png',base_name+'.txt')
 
 def fastqc_output(fastq):
@@ -505,9 +2052,44 @@ def fastqc_output(fastq):
        tuple: FastQC outputs (without leading paths)
 
     """
-    base_name = "%s_fastqc" % strip_ngs_extensions(os.path.basename(fastq))
+    return _fastqc_names(strip_ngs_extensions(os.path.basename(fastq)))
+
+def _fastqc_names(fastq_base):
+    """
+    Internal: FastQC output names for a Fastq base name
+
+    Arguments:
+       fastq_base (str): name of Fastq file with the
+         path and extensions removed
+
+    """
+    base_name = "%s_fastqc" % fastq_base
     return (base_name,base_name+'.html',base_name+'.zip')
 
+def qc_output_names(fastq):
+    """
+    Generate names of the FastQC and fastq_screen outputs
+
+    The extensions are only stripped from the Fastq name
+    once for all the outputs.
+
+    Arguments:
+       fastq (str): name of Fastq file
+
+    Returns:
+       tuple: tuple of the form (fastqc,screens) where
+         'fastqc' is the tuple of FastQC outputs (see
+         'fastqc_output') and 'screens' is a list with
+         the tuple of fastq_screen outputs for each of
+         the screens in FASTQ_SCREENS (see
+         'fastq_screen_output').
+
+    """
+    fastq_base = strip_ngs_extensions(os.path.basename(fastq))
+    return (_fastqc_names(fastq_base),
+            [_fastq_screen_names(fastq_base,name)
+             for name in FASTQ_SCREENS])
+
 def expected_qc_outputs(fastq,qc_dir):
     """
     Return list of expected QC products for a FASTQ file
@@ -520,23 +2102,28 @@ def expected_qc_outputs(fastq,qc_dir):
       List: list of paths to the expected associated QC products
 
     """
+    fastqc_names,screen_names = qc_output_names(fastq)
     expected = []
     # FastQC outputs
-    expected.extend([os.path.join(qc_dir,f)
-                     for f in fastqc_output(fastq)])
+    expected.extend([os.path.join(qc_dir,f) for f in fastqc_names])
     # Fastq_screen outputs
-    for name in FASTQ_SCREENS:
-        expected.extend([os.path.join(qc_dir,f)
-                         for f in fastq_screen_output(fastq,name)])
+    for names in screen_names:
+        expected.extend([os.path.join(qc_dir,f) for f in names])
     return expected
 
-def check_qc_outputs(fastq,qc_dir):
+def check_qc_outputs(fastq,qc_dir,index=None):
     """
     Return lists of present and missing QC products for FASTQ file
 
+    If an index of the QC directory is supplied (see
+    'qc_dir_index') then the outputs are checked against
+    it, rather than looking up each one on the filesystem.
+
     Arguments:
       fastq (str): name of FASTQ file
       qc_dir (str): path to QC directory
+      index (set): optional set of names in the QC
+        directory
 
     Returns:
       Tuple: tuple of the form (present,missing) where present,
@@ -548,8 +2135,37 @@ def check_qc_outputs(fastq,qc_dir):
     missing = []
     # Check that outputs exist
     for output in expected_qc_outputs(fastq,qc_dir):
-        if os.path.exists(output):
+        if index is None:
+            exists = os.path.exists(output)
+        else:
+            exists = (os.path.basename(output) in index)
+        if exists:
             present.append(output)
         else:
             missing.append(output)
     return (present,missing)
+
+def qc_dir_index(qc_dir):
+    """
+    Return the set of names in a QC directory
+
+    The directory is listed once, so that multiple QC
+    outputs can be checked against the set without a
+    separate filesystem lookup for each one.
+
+    Arguments:
+      qc_dir (str): path to QC directory
+
+    Returns:
+      Set: set of the names (without leading paths) of
+        the files and directories in the QC directory
+        (empty if the directory doesn't exist).
+
+    """
+    try:
+        if scandir is not None:
+            return set([entry.name for entry in scandir(qc_dir)])
+        else:
+            return set(os.listdir(qc_dir))
+    except OSError:
+        return set()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+#
+# QC metrics store library
+import os
+import time
+import json
+import sqlite3
+from auto_process_ngs.utils import AnalysisFastq
+from .heatmap import per_base_quality
+
+"""
+Per-Fastq QC metrics are stored in an SQLite database
+with the following tables:
+
+fastqs: one row per Fastq for each run and project,
+  with the read count, overall FastQC status and
+  per-base quality summary
+fastqc_modules: status of each FastQC module for
+  each Fastq
+screens: percentages from each fastq_screen library
+  for each Fastq
+"""
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS fastqs (
+    id INTEGER PRIMARY KEY,
+    run TEXT NOT NULL,
+    project TEXT NOT NULL,
+    sample TEXT,
+    fastq TEXT NOT NULL,
+    read_number INTEGER,
+    lane INTEGER,
+    reported REAL,
+    nreads INTEGER,
+    fastqc_status TEXT,
+    mean_quality REAL,
+    min_median_quality REAL)""",
+    """CREATE TABLE IF NOT EXISTS fastqc_modules (
+    fastq_id INTEGER NOT NULL REFERENCES fastqs(id),
+    module TEXT NOT NULL,
+    status TEXT NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS screens (
+    fastq_id INTEGER NOT NULL REFERENCES fastqs(id),
+    screen TEXT NOT NULL,
+    library TEXT NOT NULL,
+    percent_unmapped REAL,
+    percent_one_hit_one_library REAL,
+    percent_multiple_hits_one_library REAL,
+    percent_one_hit_multiple_libraries REAL,
+    percent_multiple_hits_multiple_libraries REAL)""",
+    "CREATE INDEX IF NOT EXISTS fastqs_run ON fastqs(run)",
+    "CREATE INDEX IF NOT EXISTS fastqs_project ON fastqs(project)",
+    "CREATE INDEX IF NOT EXISTS fastqs_sample "
+    "ON fastqs(sample,lane,read_number)",
+    "CREATE INDEX IF NOT EXISTS fastqs_lane ON fastqs(lane)",
+    "CREATE INDEX IF NOT EXISTS fastqs_fastq ON fastqs(fastq)",
+    "CREATE INDEX IF NOT EXISTS fastqc_modules_fastq "
+    "ON fastqc_modules(fastq_id)",
+    "CREATE INDEX IF NOT EXISTS screens_fastq "
+    "ON screens(fastq_id,library)",
+)
+
+# Metrics which can be queried directly from the 'fastqs' table
+FASTQ_METRICS = ('nreads',
+                 'fastqc_status',
+                 'mean_quality',
+                 'min_median_quality',)
+
+# Columns from fastq_screen outputs
+SCREEN_COLUMNS = ('%Unmapped',
+                  '%One_hit_one_library',
+                  '%Multiple_hits_one_library',
+                  '%One_hit_multiple_libraries',
+                  '%Multiple_hits_multiple_libraries',)
+
+class MetricsStore:
+    """
+    Class for storing and querying per-Fastq QC metrics
+
+    The metrics for all the Fastqs in a project are
+    added in a single transaction, replacing any
+    metrics previously stored for the same run and
+    project:
+
+    >>> store = MetricsStore('qc_metrics.db')
+    >>> store.add_project('170901_M00879_0087','PJB',metrics)
+
+    Metrics can then be retrieved across runs, for
+    example the percentage of reads from a Fastq which
+    map to PhiX in the last 50 runs:
+
+    >>> store.query('PhiX',sample='PJB1',lane=1,read_number=1)
+
+    """
+    def __init__(self,db_file):
+        """
+        Create a new MetricsStore instance
+
+        Arguments:
+          db_file (str): path to the SQLite database
+            file (will be created if it doesn't exist)
+
+        """
+        self._db_file = os.path.abspath(db_file)
+        self._cx = sqlite3.connect(self._db_file)
+        with self._cx:
+            for sql in SCHEMA:
+                self._cx.execute(sql)
+
+    def close(self):
+        """
+        Close the connection to the database
+
+        """
+        self._cx.close()
+
+    def add_project(self,run,project,metrics,reported=None):
+        """
+        Store the metrics for the Fastqs in a project
+
+        Arguments:
+          run (str): name of the sequencing run
+          project (str): name of the project
+          metrics (list): list of dictionaries with the
+            metrics for each Fastq (as returned by
+            'fastq_metrics')
+          reported (float): time that the metrics were
+            generated (defaults to the current time)
+
+        Returns:
+          Integer: number of Fastqs stored.
+
+        """
+        if reported is None:
+            reported = time.time()
+        with self._cx:
+            # Remove metrics from previous reports
+            ids = "SELECT id FROM fastqs WHERE run=? AND project=?"
+            for table in ('fastqc_modules','screens',):
+                self._cx.execute("DELETE FROM %s WHERE fastq_id IN (%s)" %
+                                 (table,ids),(run,project))
+            self._cx.execute("DELETE FROM fastqs WHERE run=? AND project=?",
+                             (run,project))
+            # Add the new metrics
+            modules = []
+            screens = []
+            for m in metrics:
+                fastq_id = self._cx.execute(
+                    "INSERT INTO fastqs (run,project,sample,fastq,"
+                    "read_number,lane,reported,nreads,fastqc_status,"
+                    "mean_quality,min_median_quality) "
+                    "VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                    (run,project,m['sample'],m['fastq'],
+                     m['read_number'],m['lane'],reported,
+                     m['nreads'],m['fastqc_status'],
+                     m['mean_quality'],m['min_median_quality'])).lastrowid
+                modules.extend([(fastq_id,module,status)
+                                for module,status in m['fastqc_modules']])
+                screens.extend([(fastq_id,)+tuple(screen)
+                                for screen in m['screens']])
+            self._cx.executemany("INSERT INTO fastqc_modules "
+                                 "VALUES (?,?,?)",modules)
+            self._cx.executemany("INSERT INTO screens "
+                                 "VALUES (?,?,?,?,?,?,?,?)",screens)
+        return len(metrics)
+
+    def query(self,metric,run=None,project=None,sample=None,lane=None,
+              read_number=None,fastq=None,last=None):
+        """
+        Retrieve the values of a metric for matching Fastqs
+
+        The metric can be one of the values in
+        'FASTQ_METRICS', or the name of a fastq_screen
+        library (e.g. 'PhiX') or screen and library
+        (e.g. 'other_organisms/PhiX'), in which case the
+        value is the percentage of reads which mapped to
+        the library.
+
+        Runs are ordered by name, so names should sort
+        chronologically (as Illumina run names do).
+
+        Arguments:
+          metric (str): the metric to retrieve
+          run (str): only report Fastqs from this run
+          project (str): only report Fastqs from this
+            project
+          sample (str): only report Fastqs from this
+            sample
+          lane (int): only report Fastqs from this lane
+          read_number (int): only report Fastqs for this
+            read
+          fastq (str): only report Fastqs with this name
+          last (int): only report values from the most
+            recent 'last' runs with matching Fastqs
+
+        Returns:
+          List: list of tuples of the form
+            (run,project,fastq,metric,value), with the
+            most recent runs first (for screen libraries
+            'metric' is the screen and library, e.g.
+            'other_organisms/PhiX').
+
+        """
+        where = []
+        args = []
+        for column,value in (('run',run),
+                             ('project',project),
+                             ('sample',sample),
+                             ('lane',lane),
+                             ('read_number',read_number),
+                             ('fastq',fastq)):
+            if value is not None:
+                where.append("f.%s=?" % column)
+                args.append(value)
+        if metric in FASTQ_METRICS:
+            value = "?,f.%s" % metric
+            value_args = [metric]
+            join = ""
+            join_args = []
+        else:
+            value = "s.screen||'/'||s.library,100.0-s.percent_unmapped"
+            value_args = []
+            if '/' in metric:
+                join = "JOIN screens s ON s.fastq_id=f.id " \
+                       "AND s.screen=? AND s.library=?"
+                join_args = metric.split('/',1)
+            else:
+                join = "JOIN screens s ON s.fastq_id=f.id " \
+                       "AND s.library=?"
+                join_args = [metric]
+        if where:
+            where = "WHERE %s" % " AND ".join(where)
+        else:
+            where = ""
+        if last:
+            runs = self._cx.execute(
+                "SELECT DISTINCT f.run FROM fastqs f %s %s "
+                "ORDER BY f.run DESC LIMIT ?" % (join,where),
+                join_args+args+[last]).fetchall()
+            if not runs:
+                return []
+            where = "%s %s f.run IN (%s)" % (where,
+                                             ("AND" if where else "WHERE"),
+                                             ",".join(["?"]*len(runs)))
+            args = args + [r[0] for r in runs]
+        return self._cx.execute(
+            "SELECT f.run,f.project,f.fastq,%s FROM fastqs f %s %s "
+            "ORDER BY f.run DESC,f.project,f.fastq,4" % (value,join,where),
+            value_args+join_args+args).fetchall()
+
+def fastq_metrics(fastq,fastqc,screens,nreads=None):
+    """
+    Collect the QC metrics for a Fastq
+
+    The metrics are taken from the FastQC and
+    fastq_screen outputs which have already been read
+    in, so no files are read here.
+
+    If the QC outputs are missing then 'fastqc' should
+    be None, in which case only the read count is
+    recorded (the FastQC status and quality metrics are
+    None, and there are no module statuses or screens).
+
+    Arguments:
+      fastq (str): path to the Fastq file
+      fastqc (Fastqc): Fastqc instance for the Fastq
+        (or None if the outputs are missing)
+      screens (list): list of (name,screen) tuples with
+        the name of each screen and the Fastqscreen
+        instance with its outputs for the Fastq
+      nreads (int): number of reads in the Fastq (if
+        None then the count is taken from the FastQC
+        outputs)
+
+    Returns:
+      Dictionary: dictionary with the metrics for the
+        Fastq, suitable for storing in a MetricsStore.
+
+    """
+    analysis_fastq = AnalysisFastq(fastq)
+    if fastqc is not None:
+        if nreads is None:
+            nreads = int(fastqc.data.basic_statistics('Total Sequences'))
+        status = fastqc.summary.overall_status
+        modules = [(module,fastqc.summary.status(module))
+                   for module in fastqc.summary.modules]
+        mean,median = per_base_quality(
+            fastqc.data.data('Per base sequence quality') or [])
+    else:
+        status = None
+        modules = []
+        mean,median = [],[]
+    screen_data = []
+    for name,screen in screens:
+        for library in screen:
+            screen_data.append([name,library['Library']] +
+                               [float(library[col])
+                                for col in SCREEN_COLUMNS])
+    return { 'fastq': os.path.basename(fastq),
+             'sample': analysis_fastq.sample_name,
+             'lane': analysis_fastq.lane_number,
+             'read_number': analysis_fastq.read_number,
+             'nreads': nreads,
+             'fastqc_status': status,
+             'fastqc_modules': modules,
+             'mean_quality': (sum(mean)/len(mean) if mean else None),
+             'min_median_quality': (min(median) if median else None),
+             'screens': screen_data, }
+
+def write_metrics_json(metrics,filen,project=None):
+    """
+    Write the metrics for a set of Fastqs to a JSON file
+
+    The file contains a single object with the project
+    name, the names of the fastq_screen columns, and a
+    list of records with the metrics for each Fastq, e.g.:
+
+    {"project":"PJB","screen_columns":["%Unmapped",...],
+     "fastqs":[{"fastq":"PB1_S1_L001_R1_001.fastq.gz",
+     "fastqc_modules":{"Basic Statistics":"PASS",...},
+     "screens":{"other_organisms":{"PhiX":[98.5,...],...},...},
+     ...},...]}
+
+    (the values for each screen library are in the same
+    order as 'screen_columns').
+
+    Arguments:
+      metrics (list): list of dictionaries with the
+        metrics for each Fastq (as returned by
+        'fastq_metrics')
+      filen (str): path to the output file
+      project (str): name of the project
+
+    """
+    records = []
+    for m in metrics:
+        record = dict(m)
+        record['fastqc_modules'] = dict(m['fastqc_modules'])
+        screens = {}
+        for screen in m['screens']:
+            screens.setdefault(screen[0],{})[screen[1]] = screen[2:]
+        record['screens'] = screens
+        records.append(record)
+    with open(filen,'w') as fp:
+        json.dump({ 'project': project,
+                    'screen_columns': SCREEN_COLUMNS,
+                    'fastqs': records },fp,
+                  sort_keys=True,separators=(',',':'))
+        fp.write("\n")
+
+def write_metrics_tsv(metrics,filen):
+    """
+    Write the metrics for a set of Fastqs to a TSV file
+
+    The file has a header line followed by one line for
+    each Fastq. As well as the values from 'FASTQ_METRICS'
+    there is a column with the status of each FastQC
+    module, and a column for each fastq_screen library
+    (named '<SCREEN>/<LIBRARY>') with the percentage of
+    reads which mapped to it. Missing values are left
+    empty.
+
+    Arguments:
+      metrics (list): list of dictionaries with the
+        metrics for each Fastq (as returned by
+        'fastq_metrics')
+      filen (str): path to the output file
+
+    """
+    modules = []
+    libraries = []
+    for m in metrics:
+        for module,status in m['fastqc_modules']:
+            if module not in modules:
+                modules.append(module)
+        for screen in m['screens']:
+            library = "%s/%s" % (screen[0],screen[1])
+            if library not in libraries:
+                libraries.append(library)
+    columns = ['fastq','sample','lane','read_number'] + \
+              list(FASTQ_METRICS)
+    with open(filen,'w') as fp:
+        fp.write("%s\n" % "\t".join(columns+modules+libraries))
+        for m in metrics:
+            values = dict(m['fastqc_modules'])
+            for screen in m['screens']:
+                values["%s/%s" % (screen[0],screen[1])] = \
+                    100.0 - screen[2]
+            for column in columns:
+                values[column] = m[column]
+            fp.write("%s\n" % "\t".join(
+                ['' if values.get(x) is None else str(values[x])
+                 for x in columns+modules+libraries]))
+
+def run_name(project_dir):
+    """
+    Return the run name for a project directory
+
+    Projects are assumed to be in the analysis directory
+    for the run (e.g. '/data/170901_M00879_0087_analysis'),
+    and the run name is the name of this directory with
+    any trailing '_analysis' removed.
+
+    Arguments:
+      project_dir (str): path to the project directory
+
+    Returns:
+      String: run name.
+
+    """
+    run = os.path.basename(os.path.dirname(os.path.abspath(project_dir)))
+    if run.endswith('_analysis'):
+        run = run[:-len('_analysis')]
+    return run
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+#
+# pipeline stages library
+import sys
+import time
+import threading
+import Queue
+
+# Marker for the end of the items passed between stages
+_END = '__end__'
+
+class PipelineStage:
+    """
+    Base class for a pipeline stage run in a background thread
+
+    Items are passed into or out of the stage through a
+    bounded queue, so that a stage which gets ahead of the
+    next one is paused until there is space on the queue
+    (i.e. backpressure).
+
+    Statistics are recorded for tuning the pipeline:
+
+    - nitems: number of items handled by the stage
+    - busy_time: time spent handling items (seconds)
+    - blocked_time: time spent waiting for the next
+      stage (or for items from the previous stage)
+    - max_depth: maximum number of items on the queue
+    - mean_depth: mean number of items on the queue,
+      sampled each time an item is added
+
+    """
+    def __init__(self,name,queue_size=8):
+        """
+        Create a new PipelineStage instance
+
+        Arguments:
+          name (str): name for the stage
+          queue_size (int): maximum number of items on
+            the queue
+
+        """
+        self.name = name
+        self.queue_size = queue_size
+        self.nitems = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+        self._total_depth = 0
+        self._nsamples = 0
+        self._start_time = None
+        self._end_time = None
+        self._queue = Queue.Queue(queue_size)
+        self._stop = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    @property
+    def mean_depth(self):
+        """
+        Return the mean number of items on the queue
+
+        """
+        if not self._nsamples:
+            return 0.0
+        return float(self._total_depth)/self._nsamples
+
+    @property
+    def throughput(self):
+        """
+        Return the number of items handled per second
+
+        This is based on the elapsed time from the stage
+        starting to it finishing (or to now, if it hasn't
+        finished), or None if it hasn't started.
+
+        """
+        if self._start_time is None:
+            return None
+        end_time = self._end_time
+        if end_time is None:
+            end_time = time.time()
+        if end_time <= self._start_time:
+            return None
+        return self.nitems/(end_time - self._start_time)
+
+    def _put(self,item):
+        """
+        Internal: add an item to the queue
+
+        """
+        depth = self._queue.qsize()
+        self.max_depth = max(self.max_depth,depth)
+        self._total_depth += depth
+        self._nsamples += 1
+        self._queue.put(item)
+
+    def _run(self):
+        """
+        Internal: run the stage (in the background thread)
+
+        Must be implemented by the subclass.
+
+        """
+        raise NotImplementedError("Subclass must implement '_run'")
+
+    def _raise_error(self):
+        """
+        Internal: raise an exception from the background thread
+
+        """
+        if self._error is not None:
+            error,self._error = self._error,None
+            raise error[0],error[1],error[2]
+
+class PipelineSource(PipelineStage):
+    """
+    Class for generating items in a background thread
+
+    The items are taken from an iterator (e.g. a
+    generator which does the work for the stage) and
+    put on the queue, from which they can be taken by
+    iterating over the stage.
+
+    Example usage:
+
+    >>> stage = PipelineSource('render',imap(render,tasks))
+    >>> for item in stage:
+    ...    assemble(item)
+    >>> stage.close()
+
+    Any exception raised by the iterator is raised again
+    when the item that it would have produced is
+    requested.
+
+    """
+    def __init__(self,name,items,queue_size=8):
+        """
+        Create a new PipelineSource instance
+
+        Arguments:
+          name (str): name for the stage
+          items (iterator): iterator to take the items
+            from
+          queue_size (int): maximum number of items to
+            hold on the queue
+
+        """
+        PipelineStage.__init__(self,name,queue_size=queue_size)
+        self._items = iter(items)
+        self._thread.start()
+
+    def _run(self):
+        """
+        Internal: put the items from the iterator on the queue
+
+        """
+        self._start_time = time.time()
+        try:
+            while not self._stop:
+                start = time.time()
+                try:
+                    item = self._items.next()
+                except StopIteration:
+                    break
+                finally:
+                    self.busy_time += time.time() - start
+                start = time.time()
+                self._put(item)
+                self.blocked_time += time.time() - start
+                self.nitems += 1
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            close = getattr(self._items,'close',None)
+            if close is not None:
+                close()
+            self._end_time = time.time()
+            self._queue.put(_END)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Return the next item from the stage
+
+        """
+        item = self._queue.get()
+        if item is _END:
+            # Leave the marker for subsequent calls
+            self._queue.put(_END)
+            self._raise_error()
+            raise StopIteration
+        return item
+
+    def close(self):
+        """
+        Stop the stage and wait for the thread to finish
+
+        """
+        self._stop = True
+        while self._thread.is_alive():
+            # Make space on the queue so the thread can finish
+            try:
+                self._queue.get_nowait()
+            except Queue.Empty:
+                self._thread.join(0.01)
+        self._thread.join()
+
+class PipelineSink(PipelineStage):
+    """
+    Class for processing items in a background thread
+
+    Items added to the stage are put on the queue and
+    then passed to a function in the background thread;
+    the values returned by the function are collected.
+
+    Example usage:
+
+    >>> stage = PipelineSink('write',write)
+    >>> stage.put(item)
+    >>> results = stage.close()
+
+    An exception raised by the function stops the stage
+    and is raised again by the next call to 'put' or to
+    'close'.
+
+    """
+    def __init__(self,name,func,queue_size=2):
+        """
+        Create a new PipelineSink instance
+
+        Arguments:
+          name (str): name for the stage
+          func (function): function to call with each
+            item
+          queue_size (int): maximum number of items to
+            hold on the queue
+
+        """
+        PipelineStage.__init__(self,name,queue_size=queue_size)
+        self._func = func
+        self._results = []
+        self._thread.start()
+
+    def _run(self):
+        """
+        Internal: pass the items on the queue to the function
+
+        """
+        self._start_time = time.time()
+        while True:
+            start = time.time()
+            item = self._queue.get()
+            self.blocked_time += time.time() - start
+            if item is _END:
+                break
+            if self._error is not None or self._stop:
+                # Discard the remaining items
+                continue
+            start = time.time()
+            try:
+                self._results.append(self._func(item))
+                self.nitems += 1
+            except Exception:
+                self._error = sys.exc_info()
+            self.busy_time += time.time() - start
+        self._end_time = time.time()
+
+    def put(self,item):
+        """
+        Add an item to be processed
+
+        Arguments:
+          item (Object): item to pass to the function
+
+        """
+        self._raise_error()
+        self._put(item)
+
+    def close(self):
+        """
+        Wait for all the items to be processed
+
+        Returns:
+          List: values returned by the function for
+            each item, in the order they were added.
+
+        """
+        if self._thread.is_alive():
+            self._queue.put(_END)
+            self._thread.join()
+        self._raise_error()
+        return self._results
+
+    def abort(self):
+        """
+        Discard any items which haven't been processed yet
+
+        """
+        self._stop = True
+        if self._thread.is_alive():
+            self._queue.put(_END)
+            self._thread.join()
+
+def pipeline_stats_table(stages):
+    """
+    Return a table of statistics for pipeline stages
+
+    Arguments:
+      stages (list): list of PipelineStage instances
+
+    Returns:
+      String: text table with the number of items,
+        busy and blocked times, throughput and queue
+        depths for each stage.
+
+    """
+    lines = ["%-10s %7s %9s %11s %10s %9s %10s" %
+             ('Stage','Items','Busy (s)','Blocked (s)','Items/s',
+              'Max queue','Mean queue')]
+    for stage in stages:
+        throughput = stage.throughput
+        if throughput is None:
+            throughput = '-'
+        else:
+            throughput = "%.1f" % throughput
+        lines.append("%-10s %7d %9.2f %11.2f %10s %5d/%-3d %10.1f" %
+                     (stage.name,stage.nitems,stage.busy_time,
+                      stage.blocked_time,throughput,
+                      stage.max_depth,stage.queue_size,
+                      stage.mean_depth))
+    return "\n".join(lines)
@@ -1,16 +1,19 @@
 #!/usr/bin/env python
 #
 # QC plot generation
-import os
-import tempfile
+import base64
+from io import BytesIO
 from math import ceil
-from matplotlib import pyplot as plt
+from itertools import groupby
+import numpy
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from PIL import Image
 from bcftbx.htmlpagewriter import PNGBase64Encoder
-from .fastqc import FastqcData
 from .fastqc import FastqcSummary
 from .screens import Fastqscreen
 from .fastq_stats import FastqQualityStats
+from .timings import timed
 
 # Colours taken from http://www.rapidtables.com/web/color/RGB_Color.htm
 RGB_COLORS = {
@@ -25,6 +28,14 @@ RGB_COLORS = {
     'yellow': (255,255,0),
 }
 
+# Colours used in the micro-plots (these are assigned CSS
+# classes when the plots are rendered as inline SVG)
+PLOT_COLORS = sorted(set(RGB_COLORS.values() +
+                         [(255,255,255),
+                          (0,128,0),
+                          (0,0,153),
+                          (128,0,0),]))
+
 def encode_png(png_file):
     """
     Return Base64 encoded string for a PNG
@@ -32,14 +43,96 @@ def encode_png(png_file):
     return "data:image/png;base64," + \
         PNGBase64Encoder().encodePNG(png_file)
 
-def screenplot(screen_files,outfile,threshold=None):
+@timed()
+def encode_png_data(png_data):
+    """
+    Return Base64 encoded string for PNG data held in memory
+    """
+    return "data:image/png;base64," + base64.b64encode(png_data)
+
+def screenplot(screen_files,outfile=None,threshold=None,inline=False):
     """
     Generate plot of FastqScreen outputs
 
     Arguments:
       screen_files (list): list of paths to one or more
         ...screen.txt files from FastqScreen
-      outfile (str): path to output file,outfile
+      outfile (str): path to output file
+      threshold (float): minimum percentage of mapped
+        reads (below which library is excluded)
+      inline (boolean): if True then return the plot
+        as a Base64 encoded PNG string
+
+    """
+    return screenplots((screen_files,),
+                       outfiles=(outfile,),
+                       threshold=threshold,
+                       inline=inline)[0]
+
+def screenplots(screen_file_sets,outfiles=None,threshold=None,
+                inline=False):
+    """
+    Generate plots for multiple sets of FastqScreen outputs
+
+    A single matplotlib ``Figure`` and Agg canvas are
+    created and reused for every set of screens: the
+    figure is cleared after each plot is rendered to an
+    in-memory buffer, so memory use doesn't grow with the
+    number of plots (and the pyplot state machine is not
+    involved at all).
+
+    Arguments:
+      screen_file_sets (list): list where each item is
+        a list of paths to ...screen.txt files from
+        FastqScreen which will appear in a single plot
+      outfiles (list): list of paths to output files
+        (one for each set of screen files; None for
+        a set means it won't be written to file)
+      threshold (float): minimum percentage of mapped
+        reads (below which library is excluded)
+      inline (boolean): if True then return the plots
+        as Base64 encoded PNG strings
+
+    Returns:
+      List: list with the Base64 encoded PNG for each
+        plot (if 'inline' was specified), otherwise the
+        paths to the output files.
+
+    """
+    if outfiles is None:
+        outfiles = [None]*len(screen_file_sets)
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    plots = []
+    try:
+        for screen_files,outfile in zip(screen_file_sets,outfiles):
+            _draw_screenplot(fig,screen_files,threshold=threshold)
+            # Render to an in-memory buffer
+            buf = BytesIO()
+            canvas.print_png(buf)
+            fig.clf()
+            png_data = buf.getvalue()
+            buf.close()
+            # Write out plot
+            if outfile is not None:
+                with open(outfile,'wb') as fp:
+                    fp.write(png_data)
+            if inline:
+                plots.append(encode_png_data(png_data))
+            else:
+                plots.append(outfile)
+    finally:
+        fig.clf()
+    return plots
+
+def _draw_screenplot(fig,screen_files,threshold=None):
+    """
+    Internal: draw FastqScreen data onto a Figure
+
+    Arguments:
+      fig (Figure): matplotlib Figure to draw onto
+      screen_files (list): list of paths to one or more
+        ...screen.txt files from FastqScreen
       threshold (float): minimum percentage of mapped
         reads (below which library is excluded)
 
@@ -50,37 +143,34 @@ def screenplot(screen_files,outfile,threshold=None):
         screens.append(Fastqscreen(screen_file))
     nscreens = len(screens)
     # Plot the data
-    plt.figure(1)
     for i,screen_data in enumerate(screens):
         # Create a sub-plot
-        plt.subplot(nscreens,1,i+1)
+        ax = fig.add_subplot(nscreens,1,i+1)
         # Filter on threshold
         if threshold:
             screen_data = filter(lambda x: float(x['%Unmapped'])
                                  <= (100.0-threshold),
                                  screen_data)
         # Make a stacked bar chart
-        plt.grid(True)
+        ax.grid(True)
         x = xrange(len(screen_data))
         for mapping,color in (('%Multiple_hits_multiple_libraries','#800000'),
                               ('%One_hit_multiple_libraries','#000099'),
                               ('%Multiple_hits_one_library','r'),
                               ('%One_hit_one_library','b'),):
             data = [r[mapping] for r in screen_data]
-            plt.barh(x,data,color=color,label=mapping)
+            ax.barh(x,data,color=color,label=mapping)
         # Add the library names
-        plt.yticks([x+0.5 for x in xrange(len(screen_data))],
-                   [r['Library'] for r in screen_data])
+        ax.set_yticks([x+0.5 for x in xrange(len(screen_data))])
+        ax.set_yticklabels([r['Library'] for r in screen_data])
         # Set axis limits on current plot
-        plt.gca().set_xlim([0,100])
-        plt.gca().set_ylim([0,len(screen_data)])
+        ax.set_xlim([0,100])
+        ax.set_ylim([0,len(screen_data)])
         # Only set legend for last plot
         if i == 0:
-            plt.legend(loc=4)
-    # Write out plot
-    plt.savefig(outfile)
-    
-def uscreenplot(screen_files,outfile=None,inline=None):
+            ax.legend(loc=4)
+
+def uscreenplot(screen_files,outfile=None,inline=None,format='png'):
     """
     Generate 'micro-plot' of FastqScreen outputs
 
@@ -88,12 +178,35 @@ def uscreenplot(screen_files,outfile=None,inline=None):
       screen_files (list): list of paths to one or more
         ...screen.txt files from FastqScreen
       outfile (str): path to output file
+      inline (boolean): if True then return the plot
+        as a Base64 encoded PNG string (or SVG markup)
+      format (str): either 'png' (the default) or 'svg'
+
+    """
+    return output_plot(uscreenplot_image(screen_files),
+                       outfile=outfile,inline=inline,format=format)
+
+@timed()
+def uscreenplot_image(screen_files):
+    """
+    Generate FastqScreen 'micro-plot' as an image
+
+    Arguments:
+      screen_files (list): list of paths to one or more
+        ...screen.txt files from FastqScreen (or
+        Fastqscreen instances with the data already
+        read in)
+
+    Returns:
+      Image: PIL Image instance with the plot.
 
     """
     # Read in the screen data
     screens = []
     for screen_file in screen_files:
-        screens.append(Fastqscreen(screen_file))
+        if not isinstance(screen_file,Fastqscreen):
+            screen_file = Fastqscreen(screen_file)
+        screens.append(screen_file)
     nscreens = len(screens)
     # Make a small stacked bar chart
     bbox_color = (145,145,145)
@@ -138,22 +251,10 @@ def uscreenplot(screen_files,outfile=None,inline=None):
         for i in xrange(x,x+npx):
             for j in xrange(y,y+barwidth):
                 pixels[i,j] = bbox_color
-    # Output the plot to file
-    fp,tmp_plot = tempfile.mkstemp(".ufastqscreen.png")
-    img.save(tmp_plot)
-    os.fdopen(fp).close()
-    if inline:
-        encoded_plot = encode_png(tmp_plot)
-    if outfile is not None:
-        os.rename(tmp_plot,outfile)
-    os.remove(tmp_plot)
-    if inline:
-        return encoded_plot
-    else:
-        return outfile
+    return img
 
 def uboxplot(fastqc_data=None,fastq=None,
-             outfile=None,inline=None):
+             outfile=None,inline=None,format='png'):
     """
     Generate FASTQ per-base quality 'micro-boxplot'
 
@@ -163,10 +264,35 @@ def uboxplot(fastqc_data=None,fastq=None,
     Arguments:
        fastqc_data (str): path to a ``fastqc_data.txt``
         file
+       fastq (str): path to a FASTQ file (used if
+        'fastqc_data' is not supplied)
        outfile (str): path to output file
+       inline (boolean): if True then return the plot
+        as a Base64 encoded PNG string (or SVG markup)
+       format (str): either 'png' (the default) or 'svg'
+
+    Returns:
+       String: path to output file
+
+    """
+    return output_plot(uboxplot_image(fastqc_data=fastqc_data,
+                                      fastq=fastq),
+                       outfile=outfile,inline=inline,format=format)
+
+@timed()
+def uboxplot_image(fastqc_data=None,fastq=None):
+    """
+    Generate FASTQ per-base quality 'micro-boxplot' image
+
+    Arguments:
+       fastqc_data (str): path to a ``fastqc_data.txt``
+        file (or a FastqcData instance with the data
+        already read in)
+       fastq (str): path to a FASTQ file (used if
+        'fastqc_data' is not supplied)
 
     Returns:
-       String: path to output PNG file
+       Image: PIL Image instance with the plot.
 
     """
     # Boxplots need: mean, median, 25/75th and 10/90th quantiles
@@ -205,21 +331,9 @@ def uboxplot(fastqc_data=None,fastq=None,
         pixels[i,40-int(fastq_stats.median[i])] = RGB_COLORS['red']
         # Mean coloured black
         pixels[i,40-int(fastq_stats.mean[i])] = RGB_COLORS['blue']
-    # Output the plot to file
-    fp,tmp_plot = tempfile.mkstemp(".uboxplot.png")
-    img.save(tmp_plot)
-    os.fdopen(fp).close()
-    if inline:
-        encoded_plot = encode_png(tmp_plot)
-    if outfile is not None:
-        os.rename(tmp_plot,outfile)
-    os.remove(tmp_plot)
-    if inline:
-        return encoded_plot
-    else:
-        return outfile
+    return img
 
-def ufastqcplot(summary_file,outfile=None,inline=False):
+def ufastqcplot(summary_file,outfile=None,inline=False,format='png'):
     """
     Make a 'micro' summary plot of FastQC output
 
@@ -245,6 +359,26 @@ def ufastqcplot(summary_file,outfile=None,inline=False):
       summary_file (str): path to a FastQC
         'summary.txt' output file
       outfile (str): path for the output PNG
+      inline (boolean): if True then return the plot
+        as a Base64 encoded PNG string (or SVG markup)
+      format (str): either 'png' (the default) or 'svg'
+
+    """
+    return output_plot(ufastqcplot_image(summary_file),
+                       outfile=outfile,inline=inline,format=format)
+
+@timed()
+def ufastqcplot_image(summary_file):
+    """
+    Make a 'micro' summary plot of FastQC output as an image
+
+    Arguments:
+      summary_file (str): path to a FastQC
+        'summary.txt' output file (or a FastqcSummary
+        instance with the summary already read in)
+
+    Returns:
+       Image: PIL Image instance with the plot.
 
     """
     status_codes = {
@@ -261,7 +395,10 @@ def ufastqcplot(summary_file,outfile=None,inline=False):
                    'rgb': (255,0,0),
                    'hex': '#FF0000' },
         }
-    fastqc_summary = FastqcSummary(summary_file)
+    if isinstance(summary_file,FastqcSummary):
+        fastqc_summary = summary_file
+    else:
+        fastqc_summary = FastqcSummary(summary_file)
     # Initialise output image instance
     nmodules = len(fastqc_summary.modules)
     img = Image.new('RGB',(30,4*nmodules),"white")
@@ -277,17 +414,297 @@ def ufastqcplot(summary_file,outfile=None,inline=False):
             for j in xrange(y,y+3):
                 #print "%d %d" % (i,j)
                 pixels[i,j] = code['rgb']
-    # Output the plot to file
-    fp,tmp_plot = tempfile.mkstemp(".ufastqc.png")
-    img.save(tmp_plot)
-    os.fdopen(fp).close()
-    if inline:
-        encoded_plot = encode_png(tmp_plot)
+    return img
+
+def output_plot(img,outfile=None,inline=False,format='png'):
+    """
+    Write a plot image to file and/or encode it
+
+    For 'png' format the plot is written as an
+    indexed-palette PNG (see 'png_bytes'); for 'svg' the
+    plot is converted to SVG (see 'svg_from_image').
+
+    Arguments:
+      img (Image): PIL Image instance with the plot
+      outfile (str): if not None then path to write
+        the plot to
+      inline (boolean): if True then return the plot
+        as a Base64 encoded PNG string (for 'png'), or
+        as SVG markup suitable for embedding in an HTML
+        document (for 'svg')
+      format (str): either 'png' (the default) or 'svg'
+
+    Returns:
+      String: encoded plot (if 'inline' was specified),
+        otherwise the path to the output file.
+
+    """
+    if format not in ('png','svg'):
+        raise Exception("Unsupported plot format: '%s'" % format)
     if outfile is not None:
-        os.rename(tmp_plot,outfile)
-    os.remove(tmp_plot)
+        if format == 'svg':
+            plot_data = svg_from_image(img)
+        else:
+            plot_data = png_bytes(img)
+        with open(outfile,'wb') as fp:
+            fp.write(plot_data)
     if inline:
-        return encoded_plot
+        if format == 'svg':
+            return svg_from_image(img,standalone=False)
+        if outfile is None:
+            plot_data = png_bytes(img)
+        return encode_png_data(plot_data)
     else:
         return outfile
 
+@timed()
+def png_bytes(img,palette=True):
+    """
+    Return the PNG encoded data for an image
+
+    By default the image is converted to an indexed-palette
+    image with the minimum bit depth (1, 2, 4 or 8 bits per
+    pixel) needed for the number of colours, and encoded
+    using the maximum level of compression. As the plots
+    only use a handful of colours this is lossless, and
+    substantially reduces the size of the PNG compared with
+    24-bit RGB.
+
+    (NB the bit depth is always reduced, as otherwise PIL
+    writes a full 256 entry palette which can make the PNG
+    larger than the RGB equivalent.)
+
+    Images with more than 256 colours are left as RGB.
+
+    Arguments:
+      img (Image): PIL Image instance
+      palette (boolean): if True (the default) then
+        convert to an indexed-palette PNG where possible
+
+    Returns:
+      String: PNG data.
+
+    """
+    options = dict(optimize=True)
+    if palette and img.mode == 'RGB':
+        colors = img.getcolors(256)
+        if colors is not None:
+            img = img.convert('P',palette=Image.ADAPTIVE,
+                              colors=len(colors))
+            for bits in (1,2,4,8):
+                if len(colors) <= 2**bits:
+                    break
+            options['bits'] = bits
+    buf = BytesIO()
+    img.save(buf,'PNG',**options)
+    png_data = buf.getvalue()
+    buf.close()
+    return png_data
+
+@timed()
+def svg_from_image(img,standalone=True):
+    """
+    Convert a plot image to SVG
+
+    The image is converted to a set of rectangles: runs
+    of pixels with the same colour in each row (or each
+    column, whichever gives fewer rectangles; see
+    '_count_rects') are merged, and then identical runs
+    in consecutive rows (or columns) are merged into a
+    single rectangle. The
+    rectangles for each colour are drawn as a single
+    path. Pixels with the background colour (i.e. the
+    colour of the top-left pixel) are drawn by a single
+    background rectangle.
+
+    Colours in PLOT_COLORS are assigned via CSS classes
+    (see 'svg_css_rules'), other colours are set directly
+    on each path.
+
+    Arguments:
+      img (Image): PIL Image instance with the plot
+      standalone (boolean): if True (the default) then
+        the SVG is a complete document which includes the
+        style rules for the colour classes; otherwise it is
+        intended to be embedded inline in an HTML document
+        which provides the rules.
+
+    Returns:
+      String: SVG markup.
+
+    """
+    img = img.convert('RGB')
+    width,height = img.size
+    background = img.getpixel((0,0))
+    # Merge pixels into rectangles, along the rows unless
+    # merging along the columns gives fewer rectangles
+    pixels = numpy.asarray(img,dtype=numpy.uint32)
+    pixels = (pixels[:,:,0] << 16) | (pixels[:,:,1] << 8) | pixels[:,:,2]
+    if _count_rects(pixels,pixels[0,0]) < _count_rects(pixels.T,
+                                                       pixels[0,0]):
+        columns = _pixel_rows(img.transpose(Image.TRANSPOSE))
+        rects = [(y,x,h,w,rgb) for x,y,w,h,rgb in
+                 _merge_pixels(columns,background)]
+    else:
+        rects = _merge_pixels(_pixel_rows(img),background)
+    # Group the rectangles by colour
+    paths = {}
+    for x,y,w,h,rgb in sorted(rects,key=lambda r: (r[1],r[0])):
+        try:
+            paths[rgb].append("M%d %dh%dv%dh-%dz" % (x,y,w,h,w))
+        except KeyError:
+            paths[rgb] = ["M%d %dh%dv%dh-%dz" % (x,y,w,h,w)]
+    # Generate the SVG
+    svg = []
+    if standalone:
+        svg.append("<svg xmlns='http://www.w3.org/2000/svg' "
+                   "class='uplot' width='%d' height='%d' "
+                   "shape-rendering='crispEdges'>" % (width,height))
+        svg.append("<style>%s</style>" %
+                   ' '.join(svg_css_rules([background]+paths.keys())))
+    else:
+        svg.append("<svg class='uplot' width='%d' height='%d'>" %
+                   (width,height))
+    svg.append("<rect %s width='%d' height='%d'/>" %
+               (_svg_fill(background),width,height))
+    for rgb in sorted(paths):
+        svg.append("<path %s d='%s'/>" % (_svg_fill(rgb),
+                                          ''.join(paths[rgb])))
+    svg.append("</svg>")
+    return ''.join(svg)
+
+def _pixel_rows(img):
+    """
+    Internal: return the RGB values for each row of an image
+
+    Arguments:
+      img (Image): PIL Image instance (in RGB mode)
+
+    Returns:
+      List: list of rows, where each row is a list of
+        RGB values.
+
+    """
+    width,height = img.size
+    data = list(img.getdata())
+    return [data[j*width:(j+1)*width] for j in xrange(height)]
+
+def _merge_pixels(rows,background):
+    """
+    Internal: merge runs of pixels into rectangles
+
+    Runs of pixels with the same colour along each row
+    are merged, and runs which are identical in
+    consecutive rows are merged into rectangles.
+
+    Arguments:
+      rows (list): list of rows, where each row is a
+        list of RGB values
+      background (tuple): RGB value for the background
+        (pixels with this colour are ignored)
+
+    Returns:
+      List: list of rectangles, each of the form
+        (x,y,width,height,rgb).
+
+    """
+    rects = []
+    open_rects = {}
+    for j,row in enumerate(rows):
+        runs = set()
+        i = 0
+        for rgb,run in groupby(row):
+            w = len(list(run))
+            if rgb != background:
+                runs.add((i,w,rgb))
+            i += w
+        # Extend or close rectangles from previous row
+        for run in open_rects.keys():
+            if run in runs:
+                open_rects[run][3] += 1
+                runs.remove(run)
+            else:
+                rects.append(tuple(open_rects.pop(run)))
+        # Start new rectangles
+        for i0,w,rgb in runs:
+            open_rects[(i0,w,rgb)] = [i0,j,w,1,rgb]
+    rects.extend([tuple(r) for r in open_rects.values()])
+    return rects
+
+def _count_rects(pixels,background):
+    """
+    Internal: count the rectangles from merging pixels
+
+    Returns the number of rectangles that '_merge_pixels'
+    would produce for the columns of the supplied array
+    (i.e. with the runs of pixels down each column merged
+    across consecutive columns), without doing the merge;
+    pass the transposed array to count the rectangles for
+    the rows.
+
+    Arguments:
+      pixels (array): 2D numpy array of pixel values
+        (indexed by row then column)
+      background (int): pixel value for the background
+        (pixels with this value are ignored)
+
+    Returns:
+      Integer: number of rectangles.
+
+    """
+    nrows,ncols = pixels.shape
+    # Pixels which start a run down a column
+    start = numpy.ones(pixels.shape,dtype=bool)
+    start[1:,:] = pixels[1:,:] != pixels[:-1,:]
+    # Length of the run at each start pixel
+    starts = numpy.flatnonzero(start.T)
+    lengths = numpy.zeros(pixels.size,dtype=numpy.int64)
+    lengths[starts] = numpy.diff(numpy.append(starts,pixels.size))
+    lengths = lengths.reshape(ncols,nrows).T
+    # Runs which are identical to a run in the previous
+    # column extend an existing rectangle
+    extends = numpy.zeros(pixels.shape,dtype=bool)
+    extends[:,1:] = start[:,1:] & start[:,:-1] & \
+                    (pixels[:,1:] == pixels[:,:-1]) & \
+                    (lengths[:,1:] == lengths[:,:-1])
+    return int(numpy.count_nonzero(start & ~extends &
+                                   (pixels != background)))
+
+def svg_css_rules(colors=None):
+    """
+    Return CSS rules for the SVG micro-plot colour classes
+
+    Arguments:
+      colors (list): optional, list of RGB tuples to
+        return rules for (only those in PLOT_COLORS are
+        included); defaults to all of PLOT_COLORS
+
+    Returns:
+      List: list of CSS rules.
+
+    """
+    rules = []
+    if colors is None:
+        rules.append("svg.uplot { shape-rendering: crispEdges; }")
+        colors = PLOT_COLORS
+    for rgb in sorted(colors):
+        if rgb in PLOT_COLORS:
+            rules.append(".%s { fill: #%02x%02x%02x; }" %
+                         ((_svg_class(rgb),)+rgb))
+    return rules
+
+def _svg_class(rgb):
+    """
+    Internal: return the CSS class for an RGB colour
+
+    """
+    return "c%02x%02x%02x" % rgb
+
+def _svg_fill(rgb):
+    """
+    Internal: return the attribute setting the fill colour
+
+    """
+    if rgb in PLOT_COLORS:
+        return "class='%s'" % _svg_class(rgb)
+    return "fill='#%02x%02x%02x'" % rgb
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+# prefetching file reader library
+import threading
+import Queue
+from io import BytesIO
+
+# States for files which haven't been read yet
+_PENDING = 'pending'
+_READING = 'reading'
+
+# Prefetcher used by 'open_file' in each thread
+_local = threading.local()
+
+class Prefetcher:
+    """
+    Class for reading files in the background ahead of use
+
+    Files are read in the order they are requested by
+    a pool of threads, and their contents held in memory
+    until they are released. This hides the latency of
+    opening and reading lots of small files (e.g. on a
+    network filesystem) behind other processing, and
+    means that files which are read more than once are
+    only read from disk once.
+
+    Example usage:
+
+    >>> prefetcher = Prefetcher()
+    >>> for result in prefetcher.imap(func,tasks,files):
+    ...    print result
+    >>> prefetcher.close()
+
+    where 'files' lists the files that will be read for
+    each task. Within 'func', files should be opened
+    using the 'open_file' function in order to use the
+    prefetched contents.
+
+    The amount of memory used is limited by pausing the
+    reads when the total size of the contents being held
+    exceeds the maximum.
+
+    """
+    def __init__(self,nthreads=4,max_bytes=64*1024*1024):
+        """
+        Create a new Prefetcher instance
+
+        Arguments:
+          nthreads (int): number of threads to read
+            files with
+          max_bytes (int): maximum total size of the
+            file contents to hold in memory (approximate,
+            as the limit is only checked before starting
+            to read each file)
+
+        """
+        self._max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._files = {}
+        self._nbytes = 0
+        self._queue = Queue.Queue()
+        self._threads = []
+        self.nreads = 0
+        self.nreused = 0
+        self.max_nbytes = 0
+        for i in xrange(nthreads):
+            thread = threading.Thread(target=self._reader)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _reader(self):
+        """
+        Internal: read queued files (run in each thread)
+
+        """
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            with self._cond:
+                while self._nbytes >= self._max_bytes and \
+                      self._files.get(path) is _PENDING:
+                    self._cond.wait()
+                if self._files.get(path) is not _PENDING:
+                    # Released, or already read by 'open'
+                    continue
+                self._files[path] = _READING
+            self._read(path)
+
+    def _read(self,path):
+        """
+        Internal: read a file and store its contents
+
+        The file must already be marked as being read.
+
+        """
+        try:
+            with open(path,'rb') as fp:
+                data = fp.read()
+        except IOError as ex:
+            data = ex
+        with self._cond:
+            if self._files.get(path) is _READING:
+                self._files[path] = data
+                if not isinstance(data,IOError):
+                    self._nbytes += len(data)
+                    self.max_nbytes = max(self.max_nbytes,self._nbytes)
+                self.nreads += 1
+            self._cond.notify_all()
+
+    def prefetch(self,paths):
+        """
+        Queue files to be read
+
+        Arguments:
+          paths (list): list of paths to files
+
+        """
+        with self._cond:
+            for path in paths:
+                if path not in self._files:
+                    self._files[path] = _PENDING
+                    self._queue.put(path)
+
+    def release(self,paths):
+        """
+        Discard the contents of files
+
+        Arguments:
+          paths (list): list of paths to files
+
+        """
+        with self._cond:
+            for path in paths:
+                data = self._files.pop(path,None)
+                if isinstance(data,str):
+                    self._nbytes -= len(data)
+            self._cond.notify_all()
+
+    def open(self,path):
+        """
+        Open a file for reading
+
+        If the file was queued to be read then its
+        contents are returned from memory (waiting for
+        the read to finish if necessary; if the read
+        hasn't started yet then the file is read
+        immediately instead). Otherwise the file is
+        opened normally.
+
+        Arguments:
+          path (str): path to the file
+
+        Returns:
+          File: file-like object for reading the file.
+
+        """
+        with self._cond:
+            data = self._files.get(path)
+            while data is _READING:
+                self._cond.wait()
+                data = self._files.get(path)
+            if data is _PENDING:
+                self._files[path] = _READING
+            elif data is not None:
+                self.nreused += 1
+        if data is _PENDING:
+            self._read(path)
+            with self._cond:
+                data = self._files.get(path)
+        if data is None:
+            return open(path,'r')
+        if isinstance(data,IOError):
+            raise data
+        return BytesIO(data)
+
+    def imap(self,func,tasks,files):
+        """
+        Run a function for a set of tasks, prefetching files
+
+        The files for all the tasks are queued to be read
+        before the first task is run, and the contents are
+        released as each task completes.
+
+        Arguments:
+          func (function): function to run
+          tasks (list): list of arguments to run the
+            function with
+          files (list): list of the paths to the files
+            read for each task (in the same order as
+            'tasks')
+
+        Yields:
+          Object: the value returned by the function for
+            each task.
+
+        """
+        for paths in files:
+            self.prefetch(paths)
+        for task,paths in zip(tasks,files):
+            set_prefetcher(self)
+            try:
+                result = func(task)
+            finally:
+                set_prefetcher(None)
+                self.release(paths)
+            yield result
+
+    def close(self):
+        """
+        Stop the reader threads and discard any contents
+
+        """
+        with self._cond:
+            for path in self._files.keys():
+                if self._files[path] is _PENDING:
+                    del self._files[path]
+            self._cond.notify_all()
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._files = {}
+        self._nbytes = 0
+
+def set_prefetcher(prefetcher):
+    """
+    Set the Prefetcher used by 'open_file' in this thread
+
+    Arguments:
+      prefetcher (Prefetcher): the Prefetcher to use,
+        or None to stop using one
+
+    """
+    _local.prefetcher = prefetcher
+
+def open_file(path):
+    """
+    Open a file for reading, using prefetched contents
+
+    If a Prefetcher has been set for the current thread
+    (see 'set_prefetcher') then it is used to open the
+    file; otherwise the file is opened normally.
+
+    Arguments:
+      path (str): path to the file
+
+    Returns:
+      File: file-like object for reading the file.
+
+    """
+    prefetcher = getattr(_local,'prefetcher',None)
+    if prefetcher is not None:
+        return prefetcher.open(path)
+    return open(path,'r')
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+#
+# task scheduling library
+import sys
+import time
+import threading
+import Queue
+import cPickle
+from functools import partial
+from contextlib import contextmanager
+from multiprocessing import Pool
+from .timings import timings_enabled
+from .timings import collect_events
+from .timings import add_events
+
+# Interval between checks on the worker processes while
+# waiting for results (seconds)
+POLL_INTERVAL = 0.5
+
+class SizeScheduler:
+    """
+    Class for running tasks on a worker pool, largest first
+
+    Tasks are submitted to a multiprocessing Pool in
+    order of decreasing size (e.g. the size of the file
+    that each task processes), so that the longest running
+    tasks are started first and a single large file
+    doesn't end up running on its own at the end.
+
+    At most two tasks per worker are submitted to the pool
+    at any one time; if a maximum size is specified then
+    the total size of the submitted tasks is also kept
+    within this limit (tasks which don't fit are skipped
+    in favour of the largest smaller task that does, and
+    a task larger than the limit is run on its own). This
+    can be used to limit the memory needed when processing
+    large files.
+
+    Example usage:
+
+    >>> scheduler = SizeScheduler(pool,nprocs=4)
+    >>> for result in scheduler.imap(func,tasks,sizes):
+    ...    print result
+
+    The scheduler can be shared between threads (e.g.
+    when reporting several projects at once), in which
+    case the limits apply to the tasks from all of them.
+
+    The time spent running tasks is recorded so that the
+    utilisation of the workers can be reported.
+
+    If a task raises an exception, or returns a value
+    which can't be passed back from the worker, then the
+    exception is raised again by 'imap'; if a worker
+    process dies while tasks are running (so that its
+    task is lost) then a RuntimeError is raised rather
+    than waiting forever.
+
+    """
+    def __init__(self,pool,nprocs,max_size=None):
+        """
+        Create a new SizeScheduler instance
+
+        Arguments:
+          pool (Pool): multiprocessing Pool to run the
+            tasks on
+          nprocs (int): number of worker processes in
+            the pool
+          max_size (int): if set then the maximum total
+            size of the tasks submitted to the pool at
+            any one time
+
+        """
+        self._pool = pool
+        self.nprocs = nprocs
+        self._max_size = max_size
+        self._max_tasks = 2*nprocs
+        self._cond = threading.Condition()
+        self._ntasks_running = 0
+        self._size_running = 0
+        self._worker_pids = self._pids()
+        self._worker_lost = None
+        self._start_time = None
+        self._end_time = None
+        self.ntasks = 0
+        self.busy_time = 0.0
+        self.max_size_running = 0
+
+    @property
+    def utilisation(self):
+        """
+        Return the fraction of the time the workers were busy
+
+        This is the total time spent running tasks divided
+        by the time available to the workers between the
+        first task being submitted and the last one
+        finishing, or None if no tasks have been run.
+
+        """
+        if not self._start_time or self._end_time <= self._start_time:
+            return None
+        return self.busy_time/(self.nprocs*
+                               (self._end_time - self._start_time))
+
+    def _can_submit(self,size):
+        """
+        Internal: check if a task fits within the limits
+
+        """
+        if self._ntasks_running == 0:
+            return True
+        if self._ntasks_running >= self._max_tasks:
+            return False
+        if self._max_size is None:
+            return True
+        return self._size_running + size <= self._max_size
+
+    def _pids(self):
+        """
+        Internal: return the process IDs of the pool workers
+
+        Returns None if the pool doesn't expose its
+        worker processes.
+
+        """
+        workers = getattr(self._pool,'_pool',None)
+        if workers is None:
+            return None
+        return set([w.pid for w in workers])
+
+    def _check_workers(self):
+        """
+        Internal: raise an exception if a worker has died
+
+        A task running on a worker process which dies is
+        lost without the callback ever being invoked, so
+        this is checked periodically while waiting for
+        results. Workers which have exited, or which have
+        been replaced by the pool since the last check,
+        are treated as lost.
+
+        """
+        with self._cond:
+            if self._worker_lost is None and \
+               self._worker_pids is not None:
+                workers = self._pool._pool
+                lost = self._worker_pids - self._pids()
+                lost.update([w.pid for w in workers
+                             if w.exitcode is not None])
+                if lost:
+                    self._worker_lost = \
+                        "Worker process(es) %s exited while running " \
+                        "tasks" % ", ".join([str(pid)
+                                             for pid in sorted(lost)])
+                self._worker_pids = self._pids()
+            if self._worker_lost is not None:
+                raise RuntimeError(self._worker_lost)
+
+    def _task_done(self,results,result):
+        """
+        Internal: handle a completed task
+
+        Invoked as a callback from the pool.
+
+        """
+        i,size,ok,value,start,end,events = result
+        try:
+            value = cPickle.loads(value)
+        except Exception as ex:
+            # Value couldn't be recreated from the worker
+            ok = False
+            value = ex
+        if events:
+            add_events(events)
+        with self._cond:
+            self._ntasks_running -= 1
+            self._size_running -= size
+            self.busy_time += end - start
+            self._end_time = time.time()
+            self._cond.notify_all()
+        results.put((i,ok,value))
+
+    def imap(self,func,tasks,sizes):
+        """
+        Run a function for a set of tasks
+
+        Arguments:
+          func (function): function to run (must be
+            defined at the top level of a module, so it
+            can be passed to the workers)
+          tasks (list): list of arguments to run the
+            function with
+          sizes (list): list of sizes of the tasks (in
+            the same order as 'tasks')
+
+        Yields:
+          Object: the value returned by the function for
+            each task, in the same order as 'tasks'. If
+            the function raised an exception for a task
+            then it is raised again instead.
+
+        """
+        results = Queue.Queue()
+        callback = partial(self._task_done,results)
+        pending = sorted(xrange(len(tasks)),key=lambda i: sizes[i],
+                         reverse=True)
+        nrunning = 0
+        done = {}
+        next_task = 0
+        while next_task < len(tasks):
+            # Submit as many tasks as possible, largest first
+            while pending:
+                with self._cond:
+                    i = None
+                    while i is None:
+                        for j in pending:
+                            if self._can_submit(sizes[j]):
+                                i = j
+                                break
+                        if i is None and nrunning == 0:
+                            # Wait for other threads' tasks
+                            self._cond.wait(POLL_INTERVAL)
+                            self._check_workers()
+                        elif i is None:
+                            break
+                    if i is None:
+                        break
+                    pending.remove(i)
+                    self._ntasks_running += 1
+                    self._size_running += sizes[i]
+                    self.max_size_running = max(self.max_size_running,
+                                                self._size_running)
+                    self.ntasks += 1
+                    if self._start_time is None:
+                        self._start_time = time.time()
+                self._pool.apply_async(_run_task,
+                                       ((i,sizes[i],func,tasks[i]),),
+                                       callback=callback)
+                nrunning += 1
+            # Wait for a task to complete
+            while True:
+                try:
+                    i,ok,value = results.get(timeout=POLL_INTERVAL)
+                    break
+                except Queue.Empty:
+                    self._check_workers()
+            nrunning -= 1
+            if not ok:
+                raise value
+            done[i] = value
+            # Return the results that are ready, in order
+            while next_task in done:
+                yield done.pop(next_task)
+                next_task += 1
+
+    def map(self,func,tasks,sizes):
+        """
+        Run a function for a set of tasks
+
+        Arguments:
+          func (function): function to run
+          tasks (list): list of arguments to run the
+            function with
+          sizes (list): list of sizes of the tasks
+
+        Returns:
+          List: the values returned by the function for
+            each task, in the same order as 'tasks'.
+
+        """
+        return list(self.imap(func,tasks,sizes))
+
+@contextmanager
+def worker_pool(nprocs,max_size=None):
+    """
+    Run tasks on a new pool of worker processes
+
+    Starts a multiprocessing Pool and returns a
+    SizeScheduler for it, for use in a 'with' statement:
+
+    >>> with worker_pool(4) as scheduler:
+    ...    results = scheduler.map(func,tasks,sizes)
+
+    The pool is shut down at the end of the block (if
+    the block raised an exception then the pool is
+    terminated, as tasks may have been lost).
+
+    Arguments:
+      nprocs (int): number of worker processes
+      max_size (int): if set then the maximum total size
+        of the tasks submitted to the pool at any one
+        time (see 'SizeScheduler')
+
+    """
+    pool = Pool(nprocs)
+    try:
+        yield SizeScheduler(pool,nprocs,max_size=max_size)
+    except:
+        # Don't wait for tasks which may have been lost
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+def _run_task(args):
+    """
+    Internal: run a task in a worker process for SizeScheduler
+
+    Returns a tuple (index,size,ok,value,start,end,events)
+    where 'ok' is False if the task raised an exception (in
+    which case 'value' is the exception), 'start' and 'end'
+    are the times the task started and finished, and
+    'events' are the timing spans recorded during the task
+    (or None if timings aren't being recorded).
+
+    'value' is returned already pickled, so that a value
+    which can't be pickled is reported as an error for the
+    task (rather than the pool failing to return a result
+    at all).
+
+    """
+    i,size,func,task = args
+    start = time.time()
+    try:
+        value = func(task)
+        ok = True
+    except:
+        value = sys.exc_info()[1]
+        ok = False
+    end = time.time()
+    try:
+        value = cPickle.dumps(value,cPickle.HIGHEST_PROTOCOL)
+    except Exception as ex:
+        value = cPickle.dumps(cPickle.PicklingError(
+            "Can't pickle value returned by %s: %s" %
+            (getattr(func,'__name__',func),ex)),cPickle.HIGHEST_PROTOCOL)
+        ok = False
+    if timings_enabled():
+        events = collect_events()
+    else:
+        events = None
+    return (i,size,ok,value,start,end,events)
@@ -3,6 +3,8 @@
 # fastq screens library
 import os
 from bcftbx.TabFile import TabFile
+from .prefetch import open_file
+from .timings import timed
 
 """
 Example screen file for v0.4.1:
@@ -46,6 +48,7 @@ class Fastqscreen(TabFile):
     Class representing data from a FastqScreen run
 
     """
+    @timed('Fastqscreen')
     def __init__(self,screen_file):
         """
         Create a new FastqscreenData instance
@@ -62,7 +65,7 @@ class Fastqscreen(TabFile):
         self._version = None
         self._no_hits = None
         # Read in data
-        with open(self._screen_file,'r') as fp:
+        with open_file(self._screen_file) as fp:
             for line in fp:
                 line = line.strip()
                 if line.startswith('#Fastq_screen version:'):
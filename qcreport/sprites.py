@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+#
+# sprite sheet library
+from PIL import Image
+from .docwriter import Link
+from .plots import png_bytes
+from .plots import encode_png_data
+
+class SpriteSheet:
+    """
+    Class for packing small images into CSS sprite sheets
+
+    Rather than embedding each small image as a separate
+    ``<img>`` tag, images are added to the sheet and are
+    packed together into one (or a few) larger images,
+    which are each embedded once as CSS background images.
+    The individual images are then displayed by referencing
+    the appropriate offsets within the sheet.
+
+    Example usage:
+
+    >>> sheet = SpriteSheet()
+    >>> sprite = sheet.add(img)
+    >>> sprite.html()
+    "<span class='sprite sprite0' style='...'></span>"
+
+    The CSS rules needed to display the sprites must then
+    be added to the document, e.g.:
+
+    >>> for css_rule in sheet.css_rules():
+    ...    document.add_css_rule(css_rule)
+
+    Images are packed into horizontal 'shelves'; a new
+    sheet is started when the current one would exceed
+    the maximum height.
+
+    """
+    def __init__(self,name='sprite',max_width=1024,max_height=4096,
+                 padding=1):
+        """
+        Create a new SpriteSheet instance
+
+        Arguments:
+          name (str): base name used for the CSS classes
+            associated with the sheet(s)
+          max_width (int): maximum width of each sheet
+            (pixels)
+          max_height (int): maximum height of each sheet
+            (pixels)
+          padding (int): number of pixels to leave between
+            images packed in the sheet
+
+        """
+        self._name = name
+        self._max_width = max_width
+        self._max_height = max_height
+        self._padding = padding
+        self._sheets = []
+        self._new_sheet()
+
+    def _new_sheet(self):
+        """
+        Internal: start a new sheet
+
+        """
+        self._sheets.append({ 'images': [],
+                              'width': 0,
+                              'height': 0, })
+        self._x = 0
+        self._y = 0
+        self._shelf_height = 0
+
+    @property
+    def nsheets(self):
+        """
+        Return the number of sheets which have been started
+
+        """
+        return len(self._sheets)
+
+    @property
+    def nsprites(self):
+        """
+        Return the total number of images packed into the sheets
+
+        """
+        return sum([len(s['images']) for s in self._sheets])
+
+    def add(self,img,href=None,alt=None):
+        """
+        Pack an image into the sprite sheet
+
+        Arguments:
+          img (Image): PIL Image instance to add
+          href (str): if specified then the sprite
+            will be wrapped in <a href..>...</a> with
+            this used as the link target
+          alt (str): if specified then used as the
+            'title' attribute for the sprite
+
+        Returns:
+          Sprite: Sprite instance which can be used to
+            display the image.
+
+        """
+        width,height = img.size
+        if self._x and self._x + width > self._max_width:
+            # Move to a new shelf
+            self._x = 0
+            self._y += self._shelf_height + self._padding
+            self._shelf_height = 0
+        if self._y and self._y + height > self._max_height:
+            # Move to a new sheet
+            self._new_sheet()
+        sheet = self._sheets[-1]
+        x,y = self._x,self._y
+        sheet['images'].append((img,x,y))
+        sheet['width'] = max(sheet['width'],x+width)
+        sheet['height'] = max(sheet['height'],y+height)
+        self._x += width + self._padding
+        self._shelf_height = max(self._shelf_height,height)
+        return Sprite("%s%d" % (self._name,len(self._sheets)-1),
+                      x,y,width,height,
+                      css_class=self._name,
+                      href=href,alt=alt)
+
+    def images(self):
+        """
+        Return the composite images for each sheet
+
+        Returns:
+          List: list of PIL Image instances, one for
+            each sheet.
+
+        """
+        images = []
+        for sheet in self._sheets:
+            if not sheet['images']:
+                continue
+            img = Image.new('RGB',(sheet['width'],sheet['height']),
+                            "white")
+            for sprite,x,y in sheet['images']:
+                img.paste(sprite,(x,y))
+            images.append(img)
+        return images
+
+    def css_rules(self,stats=None):
+        """
+        Return the CSS rules needed to display the sprites
+
+        The sheet images are embedded in the rules as
+        Base64 encoded PNGs.
+
+        Arguments:
+          stats (dict): if not None then statistics on the
+            embedded sheets are added to this dictionary
+            ('nimages' is the number of sprites, 'plot_bytes'
+            the size of the sheet PNGs and 'encoded_bytes' the
+            size after encoding)
+
+        Returns:
+          List: list of CSS rules.
+
+        """
+        css_rules = ["span.%s { display: inline-block;\n"
+                     "          background-repeat: no-repeat; }" %
+                     self._name]
+        for i,img in enumerate(self.images()):
+            plot_data = png_bytes(img)
+            encoded_plot = encode_png_data(plot_data)
+            css_rules.append("span.%s%d { background-image: url(%s); }" %
+                             (self._name,i,encoded_plot))
+            if stats is not None:
+                stats['plot_bytes'] += len(plot_data)
+                stats['encoded_bytes'] += len(encoded_plot)
+        if stats is not None:
+            stats['nimages'] += self.nsprites
+        return css_rules
+
+class Sprite:
+    """
+    Utility class for displaying an image from a sprite sheet
+
+    Sprite instances are normally created by the 'add'
+    method of a SpriteSheet, and are rendered as
+    ``<span>`` tags which display the region of the sheet
+    corresponding to the original image.
+
+    """
+    def __init__(self,sheet,x,y,width,height,css_class='sprite',
+                 href=None,alt=None):
+        """
+        Create a new Sprite instance
+
+        Arguments:
+          sheet (str): CSS class for the sheet that
+            the image is packed into
+          x (int): horizontal offset of the image
+            within the sheet (pixels)
+          y (int): vertical offset of the image
+            within the sheet (pixels)
+          width (int): width of the image (pixels)
+          height (int): height of the image (pixels)
+          css_class (str): CSS class common to all
+            sprites
+          href (str): if specified then the sprite
+            will be wrapped in <a href..>...</a> with
+            this used as the link target
+          alt (str): if specified then used as the
+            'title' attribute for the sprite
+
+        """
+        self._sheet = sheet
+        self._x = x
+        self._y = y
+        self._width = width
+        self._height = height
+        self._css_class = css_class
+        self._target = href
+        self._alt = alt
+
+    def resolve_link(self):
+        """
+        Replace the link target with its href
+
+        The sprite no longer refers to the target object,
+        so the target can be discarded.
+
+        """
+        if self._target:
+            self._target = Link(None,self._target).href
+
+    def html(self):
+        """
+        Generate HTML version of the sprite
+
+        """
+        html = []
+        html.append("<span class='%s %s'" % (self._css_class,
+                                             self._sheet))
+        html.append("style='background-position: -%dpx -%dpx; "
+                    "width: %dpx; height: %dpx;'" % (self._x,self._y,
+                                                     self._width,
+                                                     self._height))
+        if self._alt:
+            html.append("title='%s'" % self._alt)
+        html = "%s></span>" % " ".join(html)
+        # Wrap in a href
+        if self._target:
+            return Link(html,self._target).html()
+        else:
+            return html
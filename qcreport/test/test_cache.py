@@ -0,0 +1,67 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+
+from qcreport.cache import ReportCache
+class TestReportCache(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.wd,'cache')
+        self.input_file = os.path.join(self.wd,'input.txt')
+        with open(self.input_file,'w') as fp:
+            fp.write("some data\n")
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_get_missing_content(self):
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key',[self.input_file]),None)
+    def test_reuse_content(self):
+        cache = ReportCache(self.cache_dir)
+        cache.put('key',[self.input_file],{ 'a': 1 })
+        cache.save()
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key',[self.input_file]),{ 'a': 1 })
+        self.assertEqual(cache.nreused,1)
+    def test_reuse_touched_input(self):
+        cache = ReportCache(self.cache_dir)
+        cache.put('key',[self.input_file],{ 'a': 1 })
+        cache.save()
+        os.utime(self.input_file,(0,0))
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key',[self.input_file]),{ 'a': 1 })
+    def test_changed_input(self):
+        cache = ReportCache(self.cache_dir)
+        cache.put('key',[self.input_file],{ 'a': 1 })
+        cache.save()
+        with open(self.input_file,'a') as fp:
+            fp.write("more data\n")
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key',[self.input_file]),None)
+    def test_missing_input(self):
+        missing_file = os.path.join(self.wd,'missing.txt')
+        cache = ReportCache(self.cache_dir)
+        cache.put('key',[missing_file],{ 'a': 1 })
+        cache.save()
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key',[missing_file]),{ 'a': 1 })
+        with open(missing_file,'w') as fp:
+            fp.write("now exists\n")
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key',[missing_file]),None)
+    def test_unused_content_is_removed(self):
+        cache = ReportCache(self.cache_dir)
+        cache.put('key1',[self.input_file],1)
+        cache.put('key2',[self.input_file],2)
+        cache.save()
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key1',[self.input_file]),1)
+        cache.save()
+        cache = ReportCache(self.cache_dir)
+        self.assertEqual(cache.get('key2',[self.input_file]),None)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir,
+                                                     'key2.pickle')))
@@ -0,0 +1,167 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+
+# 2x1 pixel PNG
+PNG_2X1 = "data:image/png;base64," \
+          "iVBORw0KGgoAAAANSUhEUgAAAAIAAAABCAAAAADRSSBWAAAAC0lEQVR4nGP8zwAAAgQBAcc81xUAAAAASUVORK5CYII="
+
+from qcreport.docwriter import image_size
+class TestImageSizeFunction(unittest.TestCase):
+    def test_image_size_png(self):
+        self.assertEqual(image_size(PNG_2X1),(2,1))
+    def test_image_size_not_png(self):
+        self.assertEqual(image_size("picture.png"),None)
+        self.assertEqual(image_size("data:image/gif;base64,R0lGODlhAQABAAAAACw="),
+                         None)
+
+from qcreport.docwriter import Img
+class TestImg(unittest.TestCase):
+    def test_img(self):
+        self.assertEqual(Img('picture.png',width=150).html(),
+                         "<img src='picture.png' width='150' />")
+    def test_img_display_size(self):
+        self.assertEqual(Img(PNG_2X1).display_size((2,1)),(2,1))
+        self.assertEqual(Img(PNG_2X1,height=10).display_size((2,1)),(20,10))
+        self.assertEqual(Img(PNG_2X1,width=10).display_size((2,1)),(10,5))
+    def test_img_asset(self):
+        img = Img(PNG_2X1,height=10)
+        img.set_asset('assets/picture.png',(2,1))
+        self.assertEqual(img.html(),
+                         "<img src='assets/picture.png' height='10' width='20' "
+                         "loading='lazy' />")
+    def test_img_shared(self):
+        img = Img(PNG_2X1,name='plot',href='#target')
+        img.set_shared('img0')
+        self.assertEqual(img.html(),
+                         "<a href='#target'><span id='plot' class='img0'></span></a>")
+
+from qcreport.docwriter import Document
+from qcreport.docwriter import Table
+class TestDocumentDedupImages(unittest.TestCase):
+    def test_dedup_images(self):
+        doc = Document(dedup_images=True)
+        section = doc.add_section(name='images')
+        tbl = Table(('a','b'))
+        tbl.add_row(a=Img(PNG_2X1),b=Img(PNG_2X1))
+        section.add(tbl)
+        section.add(Img(PNG_2X1,height=10))
+        html = doc.html()
+        self.assertEqual(html.count(PNG_2X1),1)
+        self.assertEqual(html.count("<span class='img0'></span>"),2)
+        self.assertEqual(html.count("<img src='%s' height='10' />" % PNG_2X1),1)
+    def test_no_dedup_images(self):
+        doc = Document()
+        section = doc.add_section(name='images')
+        section.add(Img(PNG_2X1),Img(PNG_2X1))
+        self.assertEqual(doc.html().count(PNG_2X1),2)
+
+class TestDocumentAssets(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_write_assets(self):
+        assets_dir = os.path.join(self.wd,'doc_assets')
+        doc = Document(assets_dir=assets_dir)
+        doc.add_css_rule("span.bg { background-image: url(%s); }" %
+                         PNG_2X1)
+        section = doc.add_section(name='images')
+        section.add(Img(PNG_2X1),Img(PNG_2X1,height=10))
+        doc.write(os.path.join(self.wd,'doc.html'))
+        self.assertEqual(len(os.listdir(assets_dir)),1)
+        asset = "doc_assets/%s" % os.listdir(assets_dir)[0]
+        html = open(os.path.join(self.wd,'doc.html')).read()
+        self.assertFalse(PNG_2X1 in html)
+        self.assertTrue("url(%s)" % asset in html)
+        self.assertTrue("<img src='%s' height='1' width='2' "
+                        "loading='lazy' />" % asset in html)
+        self.assertTrue("<img src='%s' height='10' width='20' "
+                        "loading='lazy' />" % asset in html)
+
+from qcreport.docwriter import Section
+from qcreport.docwriter import Link
+from qcreport.docwriter import Target
+from qcreport.docwriter import set_page
+from qcreport.docwriter import resolve_links
+class TestPageLinks(unittest.TestCase):
+    def test_link_to_page(self):
+        section = Section("New section",name='new_section')
+        link = Link("New section",section)
+        self.assertEqual(link.href,'#new_section')
+        section.page = 'page1.html'
+        self.assertEqual(link.href,'page1.html#new_section')
+    def test_set_page(self):
+        section = Section("New section",name='new_section')
+        target = Target('new_target')
+        subsection = section.add_subsection("Subsection",name='sub')
+        subsection.add(target)
+        set_page([section],'page1.html')
+        self.assertEqual(Link("Target",target).href,
+                         'page1.html#new_target')
+        self.assertEqual(Link("Subsection",subsection).href,
+                         'page1.html#sub')
+    def test_resolve_links(self):
+        section = Section("New section",name='new_section')
+        section.page = 'page1.html'
+        link = Link("New section",section)
+        img = Img('picture.png',href=section)
+        resolve_links([link,img])
+        section.page = None
+        self.assertEqual(link.html(),
+                         "<a href='page1.html#new_section'>New section</a>")
+        self.assertEqual(img.html(),
+                         "<a href='page1.html#new_section'>"
+                         "<img src='picture.png' /></a>")
+
+import json
+from qcreport.docwriter import DataTable
+class TestDataTable(unittest.TestCase):
+    def test_data_table(self):
+        tbl = DataTable(('name','link','status'),name='Name',status='Status')
+        tbl.add_filter('status')
+        tbl.add_row(name='PB1',link=Link('PB1','#pb1'),status='PASS')
+        tbl.add_row(name='PB2',status='FAIL')
+        html = tbl.html(css_id='tbl')
+        self.assertTrue(html.startswith("<div id='tbl'></div>"))
+        self.assertTrue("qcreport_datatable('tbl');" in html)
+        start = "<script type='application/json' id='tbl_data'>"
+        data = html[html.index(start)+len(start):]
+        data = json.loads(data[:data.index("</script>")])
+        self.assertEqual(data['names'],['Name','link','Status'])
+        self.assertEqual(data['filters'],[2])
+        self.assertEqual(data['rows'],[['PB1',"<a href='#pb1'>PB1</a>",'PASS'],
+                                       ['PB2',None,'FAIL']])
+    def test_data_table_bad_filter(self):
+        tbl = DataTable(('name','status'))
+        self.assertRaises(KeyError,tbl.add_filter,'reads')
+
+import gzip
+class TestDocumentGzip(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _document(self):
+        doc = Document(title="Gzipped document")
+        section = doc.add_section(name='images')
+        section.add(Img(PNG_2X1),"Some text")
+        return doc
+    def test_write_gzip(self):
+        html_file = os.path.join(self.wd,'doc.html')
+        self.assertEqual(self._document().write(html_file,gzip_level=9),
+                         [html_file,"%s.gz" % html_file])
+        self.assertEqual(gzip.open("%s.gz" % html_file).read(),
+                         open(html_file).read())
+    def test_write_gzip_only(self):
+        html_file = os.path.join(self.wd,'doc.html')
+        self.assertEqual(self._document().write(html_file,gzip_level=1,
+                                                plain=False),
+                         ["%s.gz" % html_file])
+        self.assertFalse(os.path.exists(html_file))
+        self.assertTrue(PNG_2X1 in gzip.open("%s.gz" % html_file).read())
@@ -0,0 +1,85 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import gzip
+import json
+import os
+
+FASTQ_DATA = """@READ1
+ACGTACGTAC
++
+IIIIIIIIII
+@READ2
+ACGTACGTAC
++
+IIIIIIIIII
+"""
+
+from qcreport.fastq_stats import count_reads
+from qcreport.fastq_stats import read_counts
+from qcreport.scheduler import SizeScheduler
+from multiprocessing import Pool
+class TestCountReads(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _fastq(self,name,data=FASTQ_DATA,members=1):
+        fastq = os.path.join(self.wd,name)
+        if fastq.endswith('.gz'):
+            # Write each copy of the data as a separate gzip member
+            with open(fastq,'wb') as fp:
+                for i in xrange(members):
+                    gz = gzip.GzipFile(fileobj=fp,mode='wb')
+                    gz.write(data)
+                    gz.close()
+        else:
+            with open(fastq,'w') as fp:
+                fp.write(data)
+        return fastq
+    def test_count_reads(self):
+        self.assertEqual(count_reads(self._fastq('PB1.fastq')),2)
+    def test_count_reads_no_trailing_newline(self):
+        self.assertEqual(count_reads(self._fastq('PB1.fastq',
+                                                 FASTQ_DATA.rstrip())),2)
+    def test_count_reads_gzipped(self):
+        fastq = self._fastq('PB1.fastq.gz',members=3)
+        self.assertEqual(count_reads(fastq),6)
+        self.assertEqual(count_reads(fastq,blocksize=7),6)
+    def test_read_counts_cache(self):
+        fastqs = [self._fastq('PB1.fastq'),self._fastq('PB2.fastq.gz')]
+        cache_file = os.path.join(self.wd,'cache','read_counts.json')
+        self.assertEqual(read_counts(fastqs,cache_file=cache_file),
+                         { fastqs[0]: 2, fastqs[1]: 2 })
+        # Modify the cached count to check it is reused
+        cache = json.load(open(cache_file))
+        cache[fastqs[0]]['nreads'] = 10
+        json.dump(cache,open(cache_file,'w'))
+        self.assertEqual(read_counts(fastqs,cache_file=cache_file),
+                         { fastqs[0]: 10, fastqs[1]: 2 })
+        # Changing the Fastq invalidates the cached count
+        self._fastq('PB1.fastq',FASTQ_DATA*2)
+        self.assertEqual(read_counts(fastqs,cache_file=cache_file),
+                         { fastqs[0]: 4, fastqs[1]: 2 })
+    def test_read_counts_no_cache_update(self):
+        fastqs = [self._fastq('PB1.fastq')]
+        cache_file = os.path.join(self.wd,'cache','read_counts.json')
+        self.assertEqual(read_counts(fastqs,cache_file=cache_file,
+                                     update_cache=False),
+                         { fastqs[0]: 2 })
+        self.assertFalse(os.path.exists(os.path.dirname(cache_file)))
+    def test_read_counts_scheduler(self):
+        fastqs = [self._fastq('PB1.fastq'),self._fastq('PB2.fastq.gz')]
+        pool = Pool(2)
+        try:
+            scheduler = SizeScheduler(pool,2)
+            self.assertEqual(read_counts(fastqs,scheduler=scheduler),
+                             { fastqs[0]: 2, fastqs[1]: 2 })
+            self.assertEqual(scheduler.ntasks,2)
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,88 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+
+FASTQC_DATA = """##FastQC	0.11.3
+>>Basic Statistics	pass
+#Measure	Value
+Filename	PB1_S1_R1_001.fastq.gz
+>>END_MODULE
+>>Per base sequence quality	pass
+#Base	Mean	Median	Lower Quartile	Upper Quartile	10th Percentile	90th Percentile
+1	32.5	33.0	31.0	34.0	30.0	34.0
+2	%s	34.0	31.0	34.0	30.0	34.0
+3-4	30.5	31.0	28.0	34.0	25.0	34.0
+>>END_MODULE
+>>Per sequence quality scores	pass
+#Quality	Count
+30	100.0
+>>END_MODULE
+"""
+
+def write_fastqc_data(path,mean2=33.5):
+    with open(path,'w') as fp:
+        fp.write(FASTQC_DATA % mean2)
+
+from qcreport.heatmap import read_per_base_quality
+class TestReadPerBaseQualityFunction(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_read_per_base_quality(self):
+        fastqc_data = os.path.join(self.wd,'fastqc_data.txt')
+        write_fastqc_data(fastqc_data)
+        self.assertEqual(read_per_base_quality(fastqc_data),
+                         ([32.5,33.5,30.5,30.5],[33.0,34.0,31.0,31.0]))
+    def test_read_per_base_quality_missing_file(self):
+        self.assertEqual(read_per_base_quality(
+            os.path.join(self.wd,'missing.txt')),([],[]))
+
+import numpy
+from qcreport.heatmap import quality_matrix
+from qcreport.heatmap import quality_heatmap_image
+class TestQualityMatrix(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.matrix_file = os.path.join(self.wd,'matrix.npy')
+        self.fastqc_data = [os.path.join(self.wd,'fastqc_data%d.txt' % i)
+                            for i in (1,2)]
+        for f in self.fastqc_data:
+            write_fastqc_data(f)
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_quality_matrix(self):
+        missing = os.path.join(self.wd,'missing.txt')
+        matrix = quality_matrix(self.fastqc_data+[missing],
+                                self.matrix_file)
+        self.assertEqual(matrix.shape,(3,2,4))
+        self.assertEqual(list(matrix[1,1]),[33.0,34.0,31.0,31.0])
+        self.assertTrue(numpy.isnan(matrix[2]).all())
+        self.assertEqual(quality_heatmap_image(matrix,row_height=2).size,
+                         (8,6))
+    def test_quality_matrix_update(self):
+        quality_matrix(self.fastqc_data,self.matrix_file)
+        write_fastqc_data(self.fastqc_data[1],mean2=20.25)
+        matrix = quality_matrix(self.fastqc_data,self.matrix_file)
+        self.assertEqual(list(matrix[0,0]),[32.5,33.5,30.5,30.5])
+        self.assertEqual(list(matrix[1,0]),[32.5,20.25,30.5,30.5])
+
+from qcreport.heatmap import quality_heatmap_plot
+class TestQualityHeatmapPlot(unittest.TestCase):
+    def test_quality_heatmap_plot(self):
+        matrix = numpy.full((4,2,10),30.0)
+        heatmap = quality_heatmap_image(matrix)
+        img = quality_heatmap_plot(matrix,labels=['PJB1','PJB1',
+                                                  'PJB2','PJB2'])
+        self.assertEqual(img.mode,'RGB')
+        self.assertTrue(img.size[0] > heatmap.size[0])
+        self.assertTrue(img.size[1] > heatmap.size[1])
+    def test_quality_heatmap_plot_no_labels(self):
+        matrix = numpy.full((3,2,10),30.0)
+        img = quality_heatmap_plot(matrix)
+        self.assertTrue(img.size[0] > 20)
@@ -3,6 +3,9 @@
 #######################################################################
 
 import unittest
+import tempfile
+import shutil
+import os
 
 from auto_process_ngs.utils import AnalysisSample
 from qcreport.illumina import get_fastq_pairs
@@ -23,6 +26,15 @@ class TestFqPairsFunction(unittest.TestCase):
         s.add_fastq('/data/PB/PB1_GCCAAG_L002_R1_001.fastq')
         self.assertEqual(get_fastq_pairs(s),[('/data/PB/PB1_ATTAGG_L001_R1_001.fastq',None),
                                              ('/data/PB/PB1_GCCAAG_L002_R1_001.fastq',None)])
+    def test_missing_r2(self):
+        s = AnalysisSample('PB1')
+        s.add_fastq('/data/PB/PB1_ATTAGG_L001_R1_001.fastq.gz')
+        s.add_fastq('/data/PB/PB1_ATTAGG_L001_R2_001.fastq.gz')
+        s.add_fastq('/data/PB/PB1_ATTAGG_L002_R1_001.fastq.gz')
+        s.add_fastq('/data/PB/PB1_ATTAGG_L002_R2_001.fastq')
+        self.assertEqual(get_fastq_pairs(s),[('/data/PB/PB1_ATTAGG_L001_R1_001.fastq.gz',
+                                              '/data/PB/PB1_ATTAGG_L001_R2_001.fastq.gz'),
+                                             ('/data/PB/PB1_ATTAGG_L002_R1_001.fastq.gz',None)])
 
 
 from qcreport.illumina import fastq_screen_output
@@ -50,6 +62,169 @@ class TestFastqcOutputFunction(unittest.TestCase):
                          ('PB1_ATTAGG_L001_R1_001_fastqc',
                           'PB1_ATTAGG_L001_R1_001_fastqc.html',
                           'PB1_ATTAGG_L001_R1_001_fastqc.zip'))
-    
-        
-                         
+
+from qcreport.illumina import qc_output_names
+from qcreport.illumina import FASTQ_SCREENS
+class TestQCOutputNamesFunction(unittest.TestCase):
+    def test_qc_output_names(self):
+        fastq = '/data/PB/PB1_ATTAGG_L001_R1_001.fastq.gz'
+        self.assertEqual(qc_output_names(fastq),
+                         (fastqc_output(fastq),
+                          [fastq_screen_output(fastq,name)
+                           for name in FASTQ_SCREENS]))
+
+from qcreport.illumina import check_qc_outputs
+from qcreport.illumina import qc_dir_index
+class TestCheckQCOutputsFunction(unittest.TestCase):
+    def setUp(self):
+        self.qc_dir = tempfile.mkdtemp()
+        self.fastq = '/data/PB/PB1_ATTAGG_L001_R1_001.fastq'
+        for name in fastqc_output(self.fastq)[1:]:
+            open(os.path.join(self.qc_dir,name),'w').close()
+        os.mkdir(os.path.join(self.qc_dir,
+                              fastqc_output(self.fastq)[0]))
+        for screen in ('model_organisms','other_organisms'):
+            for name in fastq_screen_output(self.fastq,screen):
+                open(os.path.join(self.qc_dir,name),'w').close()
+        self.missing = [os.path.join(self.qc_dir,name)
+                        for name in fastq_screen_output(self.fastq,'rRNA')]
+    def tearDown(self):
+        shutil.rmtree(self.qc_dir)
+    def test_qc_dir_index(self):
+        self.assertEqual(len(qc_dir_index(self.qc_dir)),7)
+        self.assertEqual(qc_dir_index(os.path.join(self.qc_dir,'missing')),
+                         set())
+    def test_check_qc_outputs(self):
+        present,missing = check_qc_outputs(self.fastq,self.qc_dir)
+        self.assertEqual(len(present),7)
+        self.assertEqual(missing,self.missing)
+    def test_check_qc_outputs_with_index(self):
+        index = qc_dir_index(self.qc_dir)
+        self.assertEqual(check_qc_outputs(self.fastq,self.qc_dir,
+                                          index=index),
+                         check_qc_outputs(self.fastq,self.qc_dir))
+
+from qcreport.illumina import FastqStats
+class TestFastqStats(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.stats_file = os.path.join(self.wd,'statistics.info')
+        with open(self.stats_file,'w') as fp:
+            fp.write("#Project\tSample\tFastq\tSize\tNreads\tPaired_end\tRead_number\n"
+                     "PJB\tPB1\tPB1_S1_L001_R1_001.fastq.gz\t1.2G\t1234\tY\t1\n"
+                     "PJB\tPB1\tPB1_S1_L001_R2_001.fastq.gz\t1.3G\t1234\tY\t2\n")
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_lookup_fastq(self):
+        stats = FastqStats(self.stats_file)
+        self.assertEqual(stats.nreads('/data/PJB/PB1_S1_L001_R2_001.fastq.gz'),
+                         1234)
+        self.assertEqual(stats.size('/data/PJB/PB1_S1_L001_R2_001.fastq.gz'),
+                         '1.3G')
+        self.assertEqual(stats.size('/data/PJB/PB1_S1_L001_R1_001.fastq'),
+                         '1.2G')
+    def test_lookup_missing_fastq(self):
+        stats = FastqStats(self.stats_file)
+        self.assertEqual(stats.lookup_fastq('PB2_S2_L001_R1_001.fastq.gz'),
+                         None)
+        self.assertEqual(stats.nreads('PB2_S2_L001_R1_001.fastq.gz'),None)
+        self.assertEqual(stats.size('PB2_S2_L001_R1_001.fastq.gz'),None)
+
+from qcreport.illumina import report_fastq
+class TestReportFastq(unittest.TestCase):
+    def setUp(self):
+        self.qc_dir = tempfile.mkdtemp()
+        self.fastq = 'PB1_ATTAGG_L001_R1_001.fastq'
+        for screen in ('model_organisms','other_organisms','rRNA'):
+            with open(os.path.join(self.qc_dir,
+                                   fastq_screen_output(self.fastq,
+                                                       screen)[1]),'w') as fp:
+                fp.write("#Fastq_screen version: 0.4.2\n")
+    def tearDown(self):
+        shutil.rmtree(self.qc_dir)
+    def test_report_fastq_missing_outputs(self):
+        section,values,stats = report_fastq(self.fastq,'r1',self.qc_dir,
+                                            nreads=1234)
+        self.assertTrue("QC outputs not found: summary.txt, "
+                        "fastqc_data.txt" in section.html())
+        self.assertEqual(values['reads'],1234)
+        # Metrics are still recorded, with just the read count
+        metrics = values['metrics']
+        self.assertEqual(metrics['fastq'],self.fastq)
+        self.assertEqual(metrics['nreads'],1234)
+        self.assertEqual(metrics['fastqc_status'],None)
+        self.assertEqual(metrics['mean_quality'],None)
+        self.assertEqual(metrics['fastqc_modules'],[])
+        self.assertEqual(metrics['screens'],[])
+
+from auto_process_ngs.utils import AnalysisProject
+from qcreport.illumina import QCReporter
+from qcreport.scheduler import worker_pool
+class TestQCReporterReport(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.pwd = os.getcwd()
+        os.chdir(self.wd)
+        project_dir = os.path.join(self.wd,'PJB')
+        os.makedirs(os.path.join(project_dir,'fastqs'))
+        os.makedirs(os.path.join(project_dir,'qc'))
+        for sample in xrange(1,5):
+            for read in (1,2):
+                with open(os.path.join(project_dir,'fastqs',
+                                       'PJB%d_S%d_L001_R%d_001.fastq' %
+                                       (sample,sample,read)),'w') as fp:
+                    fp.write("@r1\nACGT\n+\nIIII\n"*sample)
+        self.project = AnalysisProject('PJB',project_dir)
+    def tearDown(self):
+        os.chdir(self.pwd)
+        shutil.rmtree(self.wd)
+    def _report(self,**kws):
+        QCReporter(self.project).report(use_cache=False,**kws)
+        with open('PJB.qcreport.html') as fp:
+            return fp.read()
+    def test_report_parallel_matches_serial(self):
+        serial = self._report()
+        self.assertEqual(self._report(nprocs=2),serial)
+        with worker_pool(2) as scheduler:
+            self.assertEqual(self._report(scheduler=scheduler),serial)
+    def test_report_removes_unused_assets(self):
+        self._report(assets=True)
+        self.assertTrue(os.path.isdir('PJB.qcreport_assets'))
+        with open(os.path.join('PJB.qcreport_assets','old.png'),'w') as fp:
+            fp.write("PNG")
+        # Assets directory is removed once images are embedded
+        self._report()
+        self.assertFalse(os.path.exists('PJB.qcreport_assets'))
+        # ...unless it contains other files
+        self._report(assets=True)
+        with open(os.path.join('PJB.qcreport_assets','notes.txt'),'w') as fp:
+            fp.write("Keep")
+        self._report()
+        self.assertEqual(os.listdir('PJB.qcreport_assets'),['notes.txt'])
+
+from qcreport.illumina import report_projects
+class TestReportProjects(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.pwd = os.getcwd()
+        os.chdir(self.wd)
+        self.projects = []
+        for name in ('PJA','PJB'):
+            project_dir = os.path.join(self.wd,name)
+            os.makedirs(os.path.join(project_dir,'fastqs'))
+            os.makedirs(os.path.join(project_dir,'qc'))
+            for read in (1,2):
+                with open(os.path.join(project_dir,'fastqs',
+                                       '%s1_S1_L001_R%d_001.fastq' %
+                                       (name,read)),'w') as fp:
+                    fp.write("@r1\nACGT\n+\nIIII\n")
+            self.projects.append(AnalysisProject(name,project_dir))
+    def tearDown(self):
+        os.chdir(self.pwd)
+        shutil.rmtree(self.wd)
+    def test_report_projects(self):
+        self.assertEqual(sorted(report_projects(self.projects,nprocs=2)),
+                         ['PJA','PJB'])
+        for name in ('PJA','PJB'):
+            self.assertTrue(os.path.exists(os.path.join(
+                self.wd,'%s.qcreport.html' % name)))
@@ -0,0 +1,184 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+
+def example_metrics(sample,lane,read_number,phix=1.5):
+    fastq = "%s_S1_L%03d_R%d_001.fastq.gz" % (sample,lane,read_number)
+    return { 'fastq': fastq,
+             'sample': sample,
+             'lane': lane,
+             'read_number': read_number,
+             'nreads': 1000,
+             'fastqc_status': 'WARN',
+             'fastqc_modules': [('Basic Statistics','PASS'),
+                                ('Per base sequence content','WARN')],
+             'mean_quality': 34.5,
+             'min_median_quality': 28.0,
+             'screens': [['other_organisms','PhiX',100.0-phix,
+                          phix,0.0,0.0,0.0],
+                         ['other_organisms','ecoli',100.0,
+                          0.0,0.0,0.0,0.0]], }
+
+from qcreport.metrics import MetricsStore
+class TestMetricsStore(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.wd,'metrics.db')
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_add_and_query(self):
+        store = MetricsStore(self.db_file)
+        for i,run in enumerate(('170101_M1','170201_M1','170301_M1')):
+            store.add_project(run,'PJB',
+                              [example_metrics('PB1',1,1,phix=i),
+                               example_metrics('PB1',1,2),
+                               example_metrics('PB2',1,1)])
+        store.close()
+        store = MetricsStore(self.db_file)
+        self.assertEqual(store.query('PhiX',sample='PB1',lane=1,
+                                     read_number=1),
+                         [('170301_M1','PJB','PB1_S1_L001_R1_001.fastq.gz',
+                           'other_organisms/PhiX',2.0),
+                          ('170201_M1','PJB','PB1_S1_L001_R1_001.fastq.gz',
+                           'other_organisms/PhiX',1.0),
+                          ('170101_M1','PJB','PB1_S1_L001_R1_001.fastq.gz',
+                           'other_organisms/PhiX',0.0)])
+        self.assertEqual(store.query('nreads',
+                                     fastq='PB2_S1_L001_R1_001.fastq.gz',
+                                     last=2),
+                         [('170301_M1','PJB','PB2_S1_L001_R1_001.fastq.gz',
+                           'nreads',1000),
+                          ('170201_M1','PJB','PB2_S1_L001_R1_001.fastq.gz',
+                           'nreads',1000)])
+        self.assertEqual(len(store.query('fastqc_status',run='170101_M1')),3)
+        self.assertEqual(store.query('Adapters'),[])
+        store.close()
+    def test_replace_project(self):
+        store = MetricsStore(self.db_file)
+        store.add_project('170101_M1','PJB',[example_metrics('PB1',1,1),
+                                             example_metrics('PB2',1,1)])
+        store.add_project('170101_M1','PJB',[example_metrics('PB1',1,1,
+                                                             phix=3.0)])
+        self.assertEqual(store.query('other_organisms/PhiX'),
+                         [('170101_M1','PJB','PB1_S1_L001_R1_001.fastq.gz',
+                           'other_organisms/PhiX',3.0)])
+        store.close()
+
+from qcreport.metrics import run_name
+class TestRunNameFunction(unittest.TestCase):
+    def test_run_name(self):
+        self.assertEqual(run_name('/data/170901_M00879_0087_analysis/PJB'),
+                         '170901_M00879_0087')
+        self.assertEqual(run_name('/data/170901_M00879_0087/PJB'),
+                         '170901_M00879_0087')
+
+import json
+from qcreport.metrics import write_metrics_json
+from qcreport.metrics import write_metrics_tsv
+class TestWriteMetricsFunctions(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.metrics = [example_metrics('PB1',1,1),
+                        example_metrics('PB1',1,2,phix=2.5)]
+        self.metrics[1]['mean_quality'] = None
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_write_metrics_json(self):
+        json_file = os.path.join(self.wd,'metrics.json')
+        write_metrics_json(self.metrics,json_file,project='PJB')
+        data = json.load(open(json_file))
+        self.assertEqual(data['project'],'PJB')
+        self.assertEqual(len(data['fastqs']),2)
+        fastq = data['fastqs'][1]
+        self.assertEqual(fastq['fastq'],'PB1_S1_L001_R2_001.fastq.gz')
+        self.assertEqual(fastq['nreads'],1000)
+        self.assertEqual(fastq['fastqc_modules'],
+                         { 'Basic Statistics': 'PASS',
+                           'Per base sequence content': 'WARN' })
+        self.assertEqual(data['screen_columns'][:2],
+                         ['%Unmapped','%One_hit_one_library'])
+        self.assertEqual(fastq['screens']['other_organisms']['PhiX'],
+                         [97.5,2.5,0.0,0.0,0.0])
+    def test_write_metrics_tsv(self):
+        tsv_file = os.path.join(self.wd,'metrics.tsv')
+        write_metrics_tsv(self.metrics,tsv_file)
+        self.assertEqual(open(tsv_file).read().split('\n'),
+                         ["fastq\tsample\tlane\tread_number\tnreads\t"
+                          "fastqc_status\tmean_quality\tmin_median_quality\t"
+                          "Basic Statistics\tPer base sequence content\t"
+                          "other_organisms/PhiX\tother_organisms/ecoli",
+                          "PB1_S1_L001_R1_001.fastq.gz\tPB1\t1\t1\t1000\t"
+                          "WARN\t34.5\t28.0\tPASS\tWARN\t1.5\t0.0",
+                          "PB1_S1_L001_R2_001.fastq.gz\tPB1\t1\t2\t1000\t"
+                          "WARN\t\t28.0\tPASS\tWARN\t2.5\t0.0",
+                          ""])
+
+FASTQC_SUMMARY = """PASS\tBasic Statistics\tPB1_S1_L001_R1_001.fastq.gz
+WARN\tPer base sequence content\tPB1_S1_L001_R1_001.fastq.gz
+"""
+
+FASTQC_DATA = """##FastQC\t0.11.3
+>>Basic Statistics\tpass
+#Measure\tValue
+Total Sequences\t1000
+>>END_MODULE
+>>Per base sequence quality\tpass
+#Base\tMean\tMedian\tLower Quartile\tUpper Quartile\t10th Percentile\t90th Percentile
+1\t33.5\t33.0\t31.0\t34.0\t30.0\t34.0
+2-3\t30.5\t28.0\t28.0\t34.0\t25.0\t34.0
+>>END_MODULE
+"""
+
+SCREEN = """#Fastq_screen version: 0.4.2\t#Reads in subset: 1000
+Library\t#Reads_processed\t#Unmapped\t%Unmapped\t#One_hit_one_library\t%One_hit_one_library\t#Multiple_hits_one_library\t%Multiple_hits_one_library\t#One_hit_multiple_libraries\t%One_hit_multiple_libraries\tMultiple_hits_multiple_libraries\t%Multiple_hits_multiple_libraries
+PhiX\t1000\t985\t98.50\t15\t1.50\t0\t0.00\t0\t0.00\t0\t0.00
+
+%Hit_no_libraries: 98.50
+"""
+
+from qcreport.fastqc import Fastqc
+from qcreport.screens import Fastqscreen
+from qcreport.metrics import fastq_metrics
+class TestFastqMetricsFunction(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.fastqc_dir = os.path.join(self.wd,'PB1_S1_L001_R1_001_fastqc')
+        os.mkdir(self.fastqc_dir)
+        for name,content in (('summary.txt',FASTQC_SUMMARY),
+                             ('fastqc_data.txt',FASTQC_DATA)):
+            with open(os.path.join(self.fastqc_dir,name),'w') as fp:
+                fp.write(content)
+        self.screen_file = os.path.join(self.wd,'screen.txt')
+        with open(self.screen_file,'w') as fp:
+            fp.write(SCREEN)
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_fastq_metrics(self):
+        fastqc = Fastqc(self.fastqc_dir)
+        screens = [('other_organisms',Fastqscreen(self.screen_file))]
+        # Metrics come from the parsed outputs, not the files
+        shutil.rmtree(self.fastqc_dir)
+        os.remove(self.screen_file)
+        metrics = fastq_metrics('PB1_S1_L001_R1_001.fastq.gz',fastqc,
+                                screens)
+        self.assertEqual(metrics['nreads'],1000)
+        self.assertEqual(metrics['fastqc_status'],'WARN')
+        self.assertEqual(metrics['mean_quality'],31.5)
+        self.assertEqual(metrics['min_median_quality'],28.0)
+        self.assertEqual(metrics['screens'],
+                         [['other_organisms','PhiX',98.5,1.5,0.0,0.0,0.0]])
+    def test_fastq_metrics_missing_outputs(self):
+        metrics = fastq_metrics('PB1_S1_L001_R1_001.fastq.gz',None,[],
+                                nreads=1234)
+        self.assertEqual(metrics['nreads'],1234)
+        self.assertEqual(metrics['lane'],1)
+        self.assertEqual(metrics['fastqc_status'],None)
+        self.assertEqual(metrics['fastqc_modules'],[])
+        self.assertEqual(metrics['mean_quality'],None)
+        self.assertEqual(metrics['min_median_quality'],None)
+        self.assertEqual(metrics['screens'],[])
@@ -0,0 +1,47 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+
+def _items(n,fail_at=None):
+    for i in xrange(n):
+        if i == fail_at:
+            raise ValueError("Failed at item %d" % i)
+        yield i
+
+from qcreport.pipeline import PipelineSource
+class TestPipelineSource(unittest.TestCase):
+    def test_source(self):
+        stage = PipelineSource('render',_items(20),queue_size=2)
+        self.assertEqual(list(stage),range(20))
+        stage.close()
+        self.assertEqual(stage.nitems,20)
+        self.assertTrue(stage.max_depth <= 2)
+    def test_source_exception(self):
+        stage = PipelineSource('render',_items(20,fail_at=5),queue_size=2)
+        try:
+            self.assertEqual([stage.next() for i in xrange(5)],range(5))
+            self.assertRaises(ValueError,stage.next)
+        finally:
+            stage.close()
+    def test_source_close_early(self):
+        items = _items(100)
+        stage = PipelineSource('render',items,queue_size=2)
+        self.assertEqual(stage.next(),0)
+        stage.close()
+        # Generator was closed by the stage
+        self.assertRaises(StopIteration,items.next)
+
+from qcreport.pipeline import PipelineSink
+class TestPipelineSink(unittest.TestCase):
+    def test_sink(self):
+        stage = PipelineSink('write',lambda x: x*2)
+        for i in xrange(10):
+            stage.put(i)
+        self.assertEqual(stage.close(),[i*2 for i in xrange(10)])
+        self.assertEqual(stage.nitems,10)
+    def test_sink_exception(self):
+        stage = PipelineSink('write',lambda x: 1/x)
+        stage.put(0)
+        self.assertRaises(ZeroDivisionError,stage.close)
@@ -0,0 +1,132 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+import numpy
+from PIL import Image
+
+def _test_image(width,height,bars):
+    # Make an image with a coloured bar for each (x,y,w,h,rgb)
+    img = Image.new('RGB',(width,height),"white")
+    for x,y,w,h,rgb in bars:
+        img.paste(rgb,(x,y,x+w,y+h))
+    return img
+
+def _pixels(img):
+    pixels = numpy.asarray(img,dtype=numpy.uint32)
+    return (pixels[:,:,0] << 16) | (pixels[:,:,1] << 8) | pixels[:,:,2]
+
+from qcreport.plots import _count_rects
+from qcreport.plots import _merge_pixels
+class TestCountRects(unittest.TestCase):
+    def test_count_rects(self):
+        img = _test_image(20,10,[(0,0,5,10,(255,0,0)),
+                                 (5,2,3,4,(0,0,255)),
+                                 (8,2,3,5,(0,0,255)),
+                                 (12,0,8,1,(255,0,0))])
+        rows = [list(img.getdata())[j*20:(j+1)*20] for j in xrange(10)]
+        pixels = _pixels(img)
+        background = pixels[9,19]
+        self.assertEqual(_count_rects(pixels.T,background),
+                         len(_merge_pixels(rows,(255,255,255))))
+        self.assertEqual(_count_rects(pixels,background),
+                         len(_merge_pixels(zip(*rows),(255,255,255))))
+
+from qcreport.plots import svg_from_image
+from qcreport.plots import output_plot
+class TestSvgFromImage(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_svg_from_image_columns(self):
+        # Vertical bars are merged down the columns
+        img = _test_image(10,10,[(1,0,2,10,(255,0,0)),
+                                 (5,3,2,7,(0,0,255))])
+        self.assertEqual(svg_from_image(img,standalone=False),
+                         "<svg class='uplot' width='10' height='10'>"
+                         "<rect class='cffffff' width='10' height='10'/>"
+                         "<path class='c0000ff' d='M5 3h2v7h-2z'/>"
+                         "<path class='cff0000' d='M1 0h2v10h-2z'/>"
+                         "</svg>")
+    def test_output_plot_svg(self):
+        img = _test_image(10,10,[(1,0,2,10,(255,0,0))])
+        svg_file = os.path.join(self.wd,"plot.svg")
+        self.assertEqual(output_plot(img,outfile=svg_file,format='svg'),
+                         svg_file)
+        with open(svg_file,'r') as fp:
+            self.assertEqual(fp.read(),svg_from_image(img))
+        self.assertEqual(output_plot(img,inline=True,format='svg'),
+                         svg_from_image(img,standalone=False))
+
+SCREEN = """#Fastq_screen version: 0.4.2\t#Reads in subset: 1000
+Library\t#Reads_processed\t#Unmapped\t%%Unmapped\t#One_hit_one_library\t%%One_hit_one_library\t#Multiple_hits_one_library\t%%Multiple_hits_one_library\t#One_hit_multiple_libraries\t%%One_hit_multiple_libraries\tMultiple_hits_multiple_libraries\t%%Multiple_hits_multiple_libraries
+PhiX\t1000\t%d\t%.2f\t%d\t%.2f\t0\t0.00\t0\t0.00\t0\t0.00
+
+%%Hit_no_libraries: %.2f
+"""
+
+from qcreport import plots
+from qcreport.plots import screenplot
+from qcreport.plots import screenplots
+from qcreport.plots import encode_png_data
+class TestScreenplots(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.screen_files = []
+        for name,unmapped in (('a',985),('b',600)):
+            screen_file = os.path.join(self.wd,"%s_screen.txt" % name)
+            with open(screen_file,'w') as fp:
+                fp.write(SCREEN % (unmapped,unmapped/10.0,
+                                   1000-unmapped,100.0-unmapped/10.0,
+                                   unmapped/10.0))
+            self.screen_files.append(screen_file)
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _read(self,filen):
+        with open(filen,'rb') as fp:
+            return fp.read()
+    def test_screenplots_outfiles(self):
+        a,b = self.screen_files
+        outfiles = [os.path.join(self.wd,"plot%d.png" % i)
+                    for i in xrange(3)]
+        self.assertEqual(screenplots([[a],[a,b],[a]],outfiles=outfiles),
+                         outfiles)
+        # Plots drawn on the reused figure are the same as
+        # those drawn on their own
+        for screen_files,outfile in (([a],outfiles[0]),
+                                     ([a,b],outfiles[1]),
+                                     ([a],outfiles[2])):
+            png = os.path.join(self.wd,"single.png")
+            screenplot(screen_files,outfile=png)
+            self.assertEqual(self._read(outfile),self._read(png))
+    def test_screenplots_inline(self):
+        a,b = self.screen_files
+        outfile = os.path.join(self.wd,"plot.png")
+        plots = screenplots([[b],[a]],outfiles=[outfile,None],inline=True)
+        # Inline plots are returned whether or not they
+        # are also written to file
+        self.assertEqual(len(plots),2)
+        self.assertEqual(plots[0],encode_png_data(self._read(outfile)))
+        self.assertEqual(plots[1],screenplot([a],inline=True))
+        # Without inline the output files are returned
+        self.assertEqual(screenplots([[a]]),[None])
+    def test_screenplots_reuses_figure(self):
+        figures = []
+        def figure(*args,**kws):
+            figures.append(Figure(*args,**kws))
+            return figures[-1]
+        Figure = plots.Figure
+        plots.Figure = figure
+        try:
+            screenplots([self.screen_files[:1],self.screen_files],
+                        inline=True)
+        finally:
+            plots.Figure = Figure
+        self.assertEqual(len(figures),1)
+        # Figure is left empty
+        self.assertEqual(figures[0].axes,[])
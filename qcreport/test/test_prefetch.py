@@ -0,0 +1,53 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+
+from qcreport.prefetch import Prefetcher
+from qcreport.prefetch import open_file
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.files = []
+        for i in xrange(10):
+            self.files.append(os.path.join(self.wd,"file%d.txt" % i))
+            with open(self.files[-1],'w') as fp:
+                fp.write("File %d\nLine 2\n" % i)
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def _read_twice(self,path):
+        # Read a file twice using 'open_file'
+        lines = [line for line in open_file(path)]
+        self.assertEqual(open_file(path).read(),"".join(lines))
+        return lines[0]
+    def _run(self,prefetcher):
+        try:
+            return list(prefetcher.imap(self._read_twice,self.files,
+                                        [[f] for f in self.files]))
+        finally:
+            prefetcher.close()
+    def test_imap(self):
+        prefetcher = Prefetcher(nthreads=2)
+        self.assertEqual(self._run(prefetcher),
+                         ["File %d\n" % i for i in xrange(10)])
+        # Each file is only read once
+        self.assertEqual(prefetcher.nreads,10)
+        self.assertTrue(prefetcher.nreused >= 10)
+    def test_imap_max_bytes(self):
+        prefetcher = Prefetcher(nthreads=2,max_bytes=1)
+        self.assertEqual(self._run(prefetcher),
+                         ["File %d\n" % i for i in xrange(10)])
+    def test_missing_file(self):
+        missing = os.path.join(self.wd,"missing.txt")
+        prefetcher = Prefetcher()
+        try:
+            results = prefetcher.imap(open_file,[missing],[[missing]])
+            self.assertRaises(IOError,results.next)
+        finally:
+            prefetcher.close()
+    def test_open_file_without_prefetcher(self):
+        self.assertEqual(open_file(self.files[0]).read(),"File 0\nLine 2\n")
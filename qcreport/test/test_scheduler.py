@@ -0,0 +1,142 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import os
+import threading
+from multiprocessing import Pool
+
+class RecordingPool:
+    # Wraps a Pool to record the tasks submitted by a
+    # SizeScheduler, and the total size of the tasks in
+    # progress when each one was submitted; tasks can be
+    # held back (so none of them complete) until released
+    def __init__(self,pool,hold=False):
+        self._wrapped = pool
+        self._hold = hold
+        self._held = []
+        self._cond = threading.Condition()
+        self.scheduler = None
+        self.submitted = []
+    def apply_async(self,func,args,callback=None):
+        i,size = args[0][:2]
+        with self._cond:
+            self.submitted.append((i,self.scheduler._size_running))
+            self._cond.notify_all()
+            if self._hold:
+                self._held.append((func,args,callback))
+                return
+        self._wrapped.apply_async(func,args,callback=callback)
+    def wait_for(self,n):
+        with self._cond:
+            while len(self.submitted) < n:
+                self._cond.wait()
+    def release(self):
+        with self._cond:
+            self._hold = False
+            held,self._held = self._held,[]
+        for func,args,callback in held:
+            self._wrapped.apply_async(func,args,callback=callback)
+
+def _identity(task):
+    return task
+
+def _fail(task):
+    raise ValueError("Task %s failed" % task)
+
+def _lock(task):
+    return threading.Lock()
+
+def _exit(task):
+    os._exit(1)
+
+from qcreport.scheduler import SizeScheduler
+class TestSizeScheduler(unittest.TestCase):
+    def setUp(self):
+        self.pool = Pool(1)
+    def tearDown(self):
+        self.pool.close()
+        self.pool.join()
+    def _scheduler(self,hold=False,**kws):
+        pool = RecordingPool(self.pool,hold=hold)
+        scheduler = SizeScheduler(pool,1,**kws)
+        pool.scheduler = scheduler
+        return (pool,scheduler)
+    def test_imap_largest_first(self):
+        pool,scheduler = self._scheduler()
+        tasks = ['a','b','c','d']
+        # Results are returned in the same order as the tasks
+        self.assertEqual(list(scheduler.imap(_identity,tasks,
+                                             [10,40,20,30])),tasks)
+        # Tasks were submitted largest first
+        self.assertEqual([i for i,size in pool.submitted],[1,3,2,0])
+        self.assertEqual(scheduler.ntasks,4)
+        self.assertTrue(0.0 < scheduler.utilisation <= 1.0)
+    def test_imap_max_tasks(self):
+        pool,scheduler = self._scheduler(hold=True)
+        results = []
+        t = threading.Thread(target=lambda: results.extend(
+            scheduler.map(_identity,['a','b','c','d'],[10,40,20,30])))
+        t.start()
+        pool.wait_for(2)
+        # At most two tasks per worker are in progress
+        self.assertEqual([i for i,size in pool.submitted],[1,3])
+        pool.release()
+        t.join()
+        self.assertEqual(results,['a','b','c','d'])
+    def test_imap_max_size(self):
+        pool,scheduler = self._scheduler(hold=True,max_size=50)
+        t = threading.Thread(target=scheduler.map,
+                             args=(_identity,['a','b','c'],[30,30,10]))
+        t.start()
+        pool.wait_for(2)
+        # Smaller task was submitted in place of one which
+        # didn't fit within the limit
+        self.assertEqual(pool.submitted,[(0,30),(2,40)])
+        pool.release()
+        t.join()
+        self.assertEqual(pool.submitted[2],(1,30))
+        self.assertEqual(scheduler.max_size_running,40)
+        # Task larger than the limit was run on its own
+        pool,scheduler = self._scheduler(max_size=50)
+        scheduler.map(_identity,['a','b','c'],[30,30,100])
+        self.assertEqual(pool.submitted,[(2,100),(0,30),(1,30)])
+    def test_imap_exception(self):
+        scheduler = SizeScheduler(self.pool,1)
+        self.assertRaises(ValueError,scheduler.map,_fail,['a'],[1])
+    def test_imap_unpicklable_result(self):
+        scheduler = SizeScheduler(self.pool,1)
+        self.assertRaises(Exception,scheduler.map,_lock,['a'],[1])
+        self.assertEqual(scheduler.map(_identity,['a'],[1]),['a'])
+    def test_imap_worker_lost(self):
+        scheduler = SizeScheduler(self.pool,1)
+        self.assertRaises(RuntimeError,scheduler.map,_exit,['a'],[1])
+        # Lost task is never completed, so the pool can only
+        # be terminated
+        self.pool.terminate()
+    def test_imap_worker_lost_waiting(self):
+        scheduler = SizeScheduler(self.pool,1)
+        self.assertRaises(RuntimeError,scheduler.map,_exit,['a','b'],[1,1])
+        # Slots held by the lost tasks are never released, so
+        # waiting for them also fails rather than hanging
+        self.assertRaises(RuntimeError,scheduler.map,_identity,['c'],[1])
+        self.pool.terminate()
+    def test_no_tasks(self):
+        scheduler = SizeScheduler(self.pool,1)
+        self.assertEqual(scheduler.map(_identity,[],[]),[])
+        self.assertEqual(scheduler.utilisation,None)
+
+from qcreport.scheduler import worker_pool
+class TestWorkerPool(unittest.TestCase):
+    def test_worker_pool(self):
+        with worker_pool(2,max_size=10) as scheduler:
+            self.assertEqual(scheduler.map(_identity,['a','b'],[5,5]),
+                             ['a','b'])
+        self.assertEqual(scheduler.nprocs,2)
+    def test_worker_pool_lost_task(self):
+        # Pool is terminated rather than waiting for the lost task
+        def run():
+            with worker_pool(1) as scheduler:
+                scheduler.map(_exit,['a'],[1])
+        self.assertRaises(RuntimeError,run)
@@ -0,0 +1,71 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+from PIL import Image
+
+from qcreport.sprites import SpriteSheet
+class TestSpriteSheet(unittest.TestCase):
+    def test_add_shelves(self):
+        sheet = SpriteSheet(max_width=25,max_height=20)
+        sprites = [sheet.add(Image.new('RGB',size,color))
+                   for size,color in (((10,5),"red"),
+                                      ((10,8),"blue"),
+                                      ((10,4),"green"),
+                                      ((5,6),"red"))]
+        # Images are packed left to right, with padding, and
+        # a new shelf starts below the tallest image on the
+        # previous one
+        self.assertEqual([sprite.html() for sprite in sprites],
+                         ["<span class='sprite sprite0' "
+                          "style='background-position: -0px -0px; "
+                          "width: 10px; height: 5px;'></span>",
+                          "<span class='sprite sprite0' "
+                          "style='background-position: -11px -0px; "
+                          "width: 10px; height: 8px;'></span>",
+                          "<span class='sprite sprite0' "
+                          "style='background-position: -0px -9px; "
+                          "width: 10px; height: 4px;'></span>",
+                          "<span class='sprite sprite0' "
+                          "style='background-position: -11px -9px; "
+                          "width: 5px; height: 6px;'></span>"])
+        self.assertEqual(sheet.nsheets,1)
+        # Images are at the same offsets in the sheet
+        img = sheet.images()[0]
+        self.assertEqual(img.size,(21,15))
+        self.assertEqual(img.getpixel((0,0)),(255,0,0))
+        self.assertEqual(img.getpixel((10,0)),(255,255,255))
+        self.assertEqual(img.getpixel((11,0)),(0,0,255))
+        self.assertEqual(img.getpixel((20,7)),(0,0,255))
+        self.assertEqual(img.getpixel((0,9)),(0,128,0))
+        self.assertEqual(img.getpixel((11,14)),(255,0,0))
+    def test_add_new_sheet(self):
+        sheet = SpriteSheet(name='uplot',max_width=10,max_height=10,
+                            padding=0)
+        sheet.add(Image.new('RGB',(10,6),"red"))
+        sprite = sheet.add(Image.new('RGB',(10,6),"blue"),
+                           href="#fastqc",alt="FastQC")
+        # Image doesn't fit below the first one so starts
+        # a new sheet
+        self.assertEqual(sheet.nsheets,2)
+        self.assertEqual(sprite.html(),
+                         "<a href='#fastqc'>"
+                         "<span class='uplot uplot1' "
+                         "style='background-position: -0px -0px; "
+                         "width: 10px; height: 6px;' "
+                         "title='FastQC'></span></a>")
+        self.assertEqual([img.size for img in sheet.images()],
+                         [(10,6),(10,6)])
+    def test_css_rules_stats(self):
+        sheet = SpriteSheet(max_width=15,max_height=20)
+        for i in xrange(3):
+            sheet.add(Image.new('RGB',(10,15),"red"))
+        stats = dict(nimages=0,plot_bytes=0,encoded_bytes=0)
+        css_rules = sheet.css_rules(stats=stats)
+        self.assertEqual(sheet.nsheets,3)
+        self.assertEqual(len(css_rules),4)
+        self.assertEqual(stats['nimages'],3)
+        self.assertTrue(0 < stats['plot_bytes'] < stats['encoded_bytes'])
+        self.assertTrue(stats['encoded_bytes'] <
+                        sum([len(r) for r in css_rules]))
@@ -0,0 +1,35 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+from PIL import Image
+
+from qcreport.thumbnails import make_thumbnails
+class TestMakeThumbnails(unittest.TestCase):
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.png = os.path.join(self.wd,'plot.png')
+        Image.new('RGB',(100,50),"red").save(self.png)
+        self.thumbnail_dir = os.path.join(self.wd,'thumbnails')
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+    def test_make_thumbnails(self):
+        thumbnails = make_thumbnails([self.png],self.thumbnail_dir,(None,10))
+        self.assertEqual(thumbnails.keys(),[self.png])
+        self.assertEqual(Image.open(thumbnails[self.png]).size,(20,10))
+        self.assertEqual(os.listdir(self.thumbnail_dir),
+                         [os.path.basename(thumbnails[self.png])])
+    def test_remove_stale_thumbnails(self):
+        # Thumbnail from another version of the code
+        os.mkdir(self.thumbnail_dir)
+        stale = os.path.join(self.thumbnail_dir,
+                             "plot.x10.0123456789ab.00000000.png")
+        Image.new('RGB',(20,10),"blue").save(stale)
+        thumbnails = make_thumbnails([self.png],self.thumbnail_dir,(None,10))
+        self.assertNotEqual(thumbnails[self.png],stale)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(thumbnails[self.png]))
@@ -0,0 +1,73 @@
+#######################################################################
+# Unit tests
+#######################################################################
+
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+from qcreport.timings import timed
+from qcreport.timings import Span
+from qcreport.timings import enable_timings
+from qcreport.timings import collect_events
+from qcreport.timings import timings_table
+from qcreport.timings import write_trace
+
+@timed('add',args=('x',))
+def _add(x,y):
+    return x + y
+
+class TestTimings(unittest.TestCase):
+    def setUp(self):
+        collect_events()
+        self.wd = tempfile.mkdtemp()
+    def tearDown(self):
+        enable_timings(False)
+        collect_events()
+        shutil.rmtree(self.wd)
+    def test_disabled(self):
+        self.assertEqual(_add(1,2),3)
+        with Span('span'):
+            pass
+        self.assertEqual(collect_events(),[])
+    def test_timed(self):
+        enable_timings()
+        self.assertEqual(_add(1,y=2),3)
+        self.assertEqual(_add(x=3,y=4),7)
+        events = collect_events()
+        self.assertEqual([e['name'] for e in events],['add','add'])
+        self.assertEqual([e['args'] for e in events],[{'x': '1'},
+                                                      {'x': '3'}])
+        self.assertEqual(collect_events(),[])
+    def test_span(self):
+        enable_timings()
+        with Span('outer',project='PJB'):
+            span = Span('inner')
+            span.end()
+            span.end()
+        events = collect_events()
+        self.assertEqual([e['name'] for e in events],['inner','outer'])
+        self.assertEqual(events[1]['args'],{'project': 'PJB'})
+    def test_write_trace(self):
+        enable_timings()
+        _add(1,2)
+        _add(3,4)
+        self.assertEqual(timings_table().split('\n')[1].split()[:2],
+                         ['add','2'])
+        trace = os.path.join(self.wd,"trace.json")
+        write_trace(trace)
+        with open(trace,'r') as fp:
+            events = json.load(fp)['traceEvents']
+        self.assertEqual([e['ph'] for e in events],['M','X','X'])
+        self.assertEqual(events[0]['args'],{'name': 'main'})
+
+from qcreport.cache import source_checksum
+class TestSourceChecksumTimed(unittest.TestCase):
+    def test_source_checksum_timed(self):
+        # Decorated functions are checksummed on their own source
+        self.assertEqual(source_checksum(_add),
+                         source_checksum(_add.__wrapped__))
+        self.assertNotEqual(source_checksum(_add),
+                            source_checksum(timed))
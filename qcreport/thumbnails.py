@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# thumbnail generation library
+import os
+import hashlib
+from multiprocessing import Pool
+from PIL import Image
+from .plots import png_bytes
+from .cache import source_checksum
+from .timings import timed
+
+def thumbnail_name(png,size,code=None):
+    """
+    Return the name for the thumbnail of a PNG
+
+    The name is unique for the path of the original
+    PNG and the size of the thumbnail, and ends with the
+    checksum for the code used to generate it (if
+    supplied).
+
+    Arguments:
+      png (str): path to the original PNG
+      size (tuple): (width,height) of the thumbnail,
+        where width can be None
+      code (str): optional checksum for the code used
+        to generate the thumbnail
+
+    Returns:
+      String: thumbnail file name (without leading path).
+
+    """
+    width,height = size
+    digest = hashlib.md5(os.path.abspath(png)).hexdigest()
+    name = "%s.%sx%s.%s" % (os.path.splitext(os.path.basename(png))[0],
+                            width if width else '',
+                            height,
+                            digest[:12])
+    if code is not None:
+        name = "%s.%s" % (name,code[:8])
+    return name + '.png'
+
+@timed(args=('png',))
+def make_thumbnail(png,thumbnail,size):
+    """
+    Create a resampled thumbnail version of a PNG
+
+    Arguments:
+      png (str): path to the original PNG
+      thumbnail (str): path to write the thumbnail to
+      size (tuple): (width,height) for the thumbnail;
+        if width is None then it is calculated from
+        the height, preserving the aspect ratio
+
+    Returns:
+      String: path to the thumbnail.
+
+    """
+    width,height = size
+    img = Image.open(png)
+    if img.mode not in ('RGB','L'):
+        img = img.convert('RGB')
+    if width is None:
+        width = max(1,int(round(float(img.size[0])*height/img.size[1])))
+    img = img.resize((width,height),Image.ANTIALIAS)
+    # Write to a temporary file first so that incomplete
+    # thumbnails are never picked up
+    tmp_thumbnail = "%s.%d.tmp" % (thumbnail,os.getpid())
+    with open(tmp_thumbnail,'wb') as fp:
+        fp.write(png_bytes(img))
+    os.rename(tmp_thumbnail,thumbnail)
+    return thumbnail
+
+def make_thumbnails(pngs,thumbnail_dir,size,nprocs=1,scheduler=None):
+    """
+    Create thumbnails for a set of PNGs
+
+    Thumbnails are only generated if they don't already
+    exist in 'thumbnail_dir', or if the original PNG is
+    newer; PNGs which don't exist are skipped. The names
+    of the thumbnails include a checksum of the code which
+    generates them, so they are also regenerated when the
+    code changes (and thumbnails generated by other
+    versions of the code are removed). The
+    thumbnails are generated in parallel using multiple
+    processes if 'nprocs' is greater than one, or using
+    a scheduler for an existing pool of worker processes
+    (in which case the largest PNGs are processed first).
+
+    Arguments:
+      pngs (list): list of paths to PNG files
+      thumbnail_dir (str): directory to write the
+        thumbnails to (will be created if it doesn't
+        exist)
+      size (tuple): (width,height) for the thumbnails;
+        if width is None then it is calculated from
+        the height
+      nprocs (int): number of processes to use
+      scheduler (SizeScheduler): if not None then the
+        scheduler to generate the thumbnails with
+        (overrides 'nprocs')
+
+    Returns:
+      Dictionary: mapping of the paths to the original
+        PNGs to the paths to their thumbnails.
+
+    """
+    code = source_checksum(make_thumbnail,png_bytes)
+    if not os.path.exists(thumbnail_dir):
+        os.makedirs(thumbnail_dir)
+    else:
+        remove_stale_thumbnails(thumbnail_dir,code)
+    thumbnails = {}
+    tasks = []
+    for png in pngs:
+        if not os.path.exists(png):
+            continue
+        thumbnail = os.path.join(thumbnail_dir,
+                                 thumbnail_name(png,size,code=code))
+        thumbnails[png] = thumbnail
+        if not os.path.exists(thumbnail) or \
+           os.path.getmtime(thumbnail) < os.path.getmtime(png):
+            tasks.append((png,thumbnail,size))
+    if scheduler is not None and tasks:
+        scheduler.map(_make_thumbnail,tasks,
+                      [os.path.getsize(task[0]) for task in tasks])
+    elif nprocs > 1 and len(tasks) > 1:
+        pool = Pool(nprocs)
+        try:
+            pool.map(_make_thumbnail,tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            _make_thumbnail(task)
+    return thumbnails
+
+def remove_stale_thumbnails(thumbnail_dir,code):
+    """
+    Remove thumbnails generated by other versions of the code
+
+    Arguments:
+      thumbnail_dir (str): directory with the thumbnails
+      code (str): checksum for the current code (see
+        'thumbnail_name')
+
+    """
+    for name in os.listdir(thumbnail_dir):
+        if name.endswith('.png') and \
+           not name.endswith(".%s.png" % code[:8]):
+            try:
+                os.remove(os.path.join(thumbnail_dir,name))
+            except OSError:
+                # Already removed (e.g. by another process)
+                pass
+
+def _make_thumbnail(args):
+    """
+    Internal: wrapper for 'make_thumbnail' for use with 'Pool.map'
+
+    """
+    return make_thumbnail(*args)
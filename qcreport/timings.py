@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# timing instrumentation library
+import os
+import time
+import json
+import inspect
+import threading
+from functools import wraps
+
+# Recorded spans, and whether recording is enabled
+_events = []
+_enabled = False
+
+def enable_timings(enabled=True):
+    """
+    Turn recording of timing spans on or off
+
+    Recording is off by default, in which case the
+    instrumented functions run with negligible overhead.
+    Worker processes started after recording is turned on
+    also record spans.
+
+    Arguments:
+      enabled (boolean): if True (the default) then
+        start recording spans; if False then stop
+
+    """
+    global _enabled
+    _enabled = enabled
+
+def timings_enabled():
+    """
+    Return True if timing spans are being recorded
+
+    """
+    return _enabled
+
+class Span:
+    """
+    Class for timing a span of code
+
+    Example usage:
+
+    >>> with Span('thumbnails'):
+    ...    make_thumbnails()
+
+    or where a block doesn't fit into a 'with' statement:
+
+    >>> span = Span('assemble')
+    >>> ...
+    >>> span.end()
+
+    Nothing is recorded unless recording has been turned
+    on with 'enable_timings'.
+
+    """
+    def __init__(self,name,**args):
+        """
+        Create a new Span instance and start timing
+
+        Arguments:
+          name (str): name for the span
+          args (mapping): additional values to include
+            with the span in traces
+
+        """
+        self._name = name
+        self._args = args
+        if _enabled:
+            self._start = time.time()
+        else:
+            self._start = None
+
+    def end(self):
+        """
+        Stop timing and record the span
+
+        """
+        if self._start is not None:
+            _record(self._name,self._start,time.time(),self._args)
+            self._start = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.end()
+
+def timed(name=None,args=()):
+    """
+    Decorator for timing each call to a function
+
+    Example usage:
+
+    >>> @timed('report_fastq',args=('fq',))
+    ... def report_fastq(fq,read_id):
+    ...    ...
+
+    The original function is available as the
+    '__wrapped__' attribute of the decorated function.
+
+    Arguments:
+      name (str): name for the spans (defaults to the
+        function name)
+      args (list): names of arguments to the function
+        whose values are included with the spans in
+        traces
+
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+        argnames = inspect.getargspec(func).args
+        positions = [(arg,argnames.index(arg)) for arg in args]
+        @wraps(func)
+        def wrapper(*a,**kw):
+            if not _enabled:
+                return func(*a,**kw)
+            values = {}
+            for arg,i in positions:
+                if arg in kw:
+                    values[arg] = kw[arg]
+                elif i < len(a):
+                    values[arg] = a[i]
+            start = time.time()
+            try:
+                return func(*a,**kw)
+            finally:
+                _record(span_name,start,time.time(),values)
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+def _record(name,start,end,args):
+    """
+    Internal: record a span
+
+    """
+    _events.append({ 'name': name,
+                     'ph': 'X',
+                     'ts': int(start*1000000),
+                     'dur': int((end - start)*1000000),
+                     'pid': os.getpid(),
+                     'tid': threading.current_thread().ident,
+                     'args': dict([(k,str(v)) for k,v in args.items()]), })
+
+def collect_events():
+    """
+    Remove and return the spans recorded by this process
+
+    Used to pass the spans recorded in a worker process
+    back to the main process (see 'add_events'); spans
+    inherited from the parent process are discarded.
+
+    Returns:
+      List: list of spans (as Chrome trace events).
+
+    """
+    pid = os.getpid()
+    events = [e for e in _events if e['pid'] == pid]
+    del _events[:]
+    return events
+
+def add_events(events):
+    """
+    Add spans recorded in another process
+
+    Arguments:
+      events (list): list of spans returned by
+        'collect_events'
+
+    """
+    _events.extend(events)
+
+def timings_table():
+    """
+    Return a summary table of the recorded spans
+
+    For each span name the table has the number of
+    calls, and the total, mean and maximum times. Times
+    are inclusive (i.e. include the times for any spans
+    inside them) and are summed over all the processes
+    and threads, so the total can exceed the elapsed
+    time.
+
+    Returns:
+      String: text table, sorted by total time.
+
+    """
+    totals = {}
+    for event in _events:
+        total = totals.setdefault(event['name'],[0,0,0])
+        total[0] += 1
+        total[1] += event['dur']
+        total[2] = max(total[2],event['dur'])
+    lines = ["%-24s %8s %10s %10s %10s" % ('Timing','Calls','Total (s)',
+                                           'Mean (ms)','Max (ms)')]
+    for name in sorted(totals.keys(),key=lambda n: totals[n][1],
+                       reverse=True):
+        ncalls,total,longest = totals[name]
+        lines.append("%-24s %8d %10.2f %10.2f %10.2f" %
+                     (name,ncalls,total/1000000.0,
+                      total/1000.0/ncalls,longest/1000.0))
+    return "\n".join(lines)
+
+def write_trace(filen):
+    """
+    Write the recorded spans to a Chrome trace file
+
+    The file uses the Chrome 'Trace Event Format' (JSON)
+    and can be loaded into chrome://tracing or Perfetto.
+
+    Arguments:
+      filen (str): path to the output file
+
+    """
+    events = []
+    for pid in sorted(set([e['pid'] for e in _events])):
+        if pid == os.getpid():
+            process_name = 'main'
+        else:
+            process_name = 'worker %d' % pid
+        events.append({ 'name': 'process_name',
+                        'ph': 'M',
+                        'pid': pid,
+                        'args': { 'name': process_name }, })
+    events.extend(sorted(_events,key=lambda e: e['ts']))
+    with open(filen,'w') as fp:
+        json.dump({ 'traceEvents': events,
+                    'displayTimeUnit': 'ms', },fp)
@@ -24,12 +24,14 @@ setup(
                 'qcreport.cli'],
     entry_points = { 'console_scripts': [
         'qcreporter2 = qcreport.cli.qcreporter2:main',
+        'qcmetrics = qcreport.cli.qcmetrics:main',
         'uboxplot = qcreport.cli.uboxplot:main',
         'screenplot = qcreport.cli.screenplot:main',
         'fastqcplot = qcreport.cli.fastqcplot:main',]
     },
     license = 'Artistic License',
     install_requires = ['pillow',
+                        'numpy',
                         'matplotlib',
                         'genomics-bcftbx',
                         'auto_process_ngs'],